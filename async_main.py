@@ -0,0 +1,288 @@
+import time
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+
+import requests
+import sentry_sdk
+
+from utils.logger import custom_logger, send_error
+from utils.driver_pool import init_driver_pool
+from utils.metrics import stage_metrics
+from utils.proxy import proxy_manager
+from utils.rate_limit import rate_limiter
+from utils.http_crawler import InstagramHttpCrawler, JSONExtractError
+from config import proc_numbers, ASYNC_CRAWL, CRAWL_STATE
+from connector.connector import CommentIndex, CrawlStateStore, KnownPostIndex, MongoDBConnector, MongoWriteBuffer, \
+    RedisConnector
+from connector.snapshot import get_snapshot_store
+
+custom_logger = custom_logger()
+logger = custom_logger.getLogger(__name__)
+sentry_sdk.init("")
+
+
+class AsyncCrawlRunner:
+    """
+    한 프로세스에서 여러 유저를 동시에 크롤링하는 asyncio 기반 runner
+    HTTP 요청과 MongoDB/Redis 저장은 thread executor 에서 실행하며,
+    전체 동시 크롤링 유저 수와 proxy 별 동시 요청 수를 제한한다
+    """
+    def __init__(self, overwrite: bool, concurrency: int = None, per_proxy: int = None):
+        self.overwrite = overwrite
+        self.concurrency = concurrency or ASYNC_CRAWL['CONCURRENCY']
+        self.per_proxy = per_proxy or ASYNC_CRAWL['PER_PROXY']
+        self.loop = asyncio.get_event_loop()
+        # 페이지 요청용 executor 와 DB 저장용 executor 를 나누어, 저장이 요청에 밀리지 않도록 한다
+        self.fetcher = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.writer = ThreadPoolExecutor(max_workers=ASYNC_CRAWL['WRITERS'])
+        # 유저 목록(pymongo cursor)은 event loop 를 막지 않도록 thread 하나에서 순서대로 가져온다
+        self.reader = ThreadPoolExecutor(max_workers=1)
+        self.proxy_limits = {}
+        # 취소 요청과 상관없이 끝까지 실행하는 저장 task
+        self._saves = set()
+
+        self.redis_conn = RedisConnector()
+        conn = MongoDBConnector().conn()
+        self.user_collection = conn['']['']
+        self.snapshots = get_snapshot_store(conn, conn[''][''])
+        self.data_collection = conn['']['']
+        self.states = CrawlStateStore(conn)
+
+        # Selenium 으로 다시 크롤링해야 하는 유저 목록이다
+        self.fallback = []
+        self.counters = {
+            'users': 0,
+            'posts': 0,
+            'fallback': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'comments_new': 0,
+            'comments_stored': 0
+        }
+        self.start = None
+
+    async def _fetch(self, func, *args):
+        return await self.loop.run_in_executor(self.fetcher, partial(func, *args))
+
+    async def _write(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(self.writer, partial(func, *args, **kwargs))
+
+    def _proxy_limit(self, proxy_url: str) -> asyncio.Semaphore:
+        if proxy_url not in self.proxy_limits:
+            self.proxy_limits[proxy_url] = asyncio.Semaphore(self.per_proxy)
+        return self.proxy_limits[proxy_url]
+
+    async def crawl_user(self, username: str) -> None:
+        """
+        인스타그램 유저 한 명을 크롤링한다
+        JSON 을 찾을 수 없는 경우에는 Selenium 으로 다시 크롤링하도록 fallback 목록에 추가한다
+        :param username: 인스타그램 유저이름이다
+        :return: None
+        """
+        try:
+            page_info, posts, crawler, state = await self._crawl(username)
+        except (JSONExtractError, requests.RequestException) as e:
+            logging.warning(f'{username}: {repr(e)} fallback to selenium')
+            self.fallback.append(username)
+            self.counters['fallback'] += 1
+            return
+        except asyncio.CancelledError:
+            # 종료 요청으로 취소된 유저는 retry 를 위해 redis-logging
+            self.counters['cancelled'] += 1
+            await self._write(self.redis_conn.saved_error, username, 'CancelledError')
+            raise
+        except Exception as e:
+            logging.error(f'{username}: {repr(e)}')
+            self.counters['failed'] += 1
+            await self._write(self.redis_conn.saved_error, username, repr(e))
+            return
+
+        if page_info is None:
+            logging.info(f'{username}: Private user or page not found.')
+            return
+        await self._save(page_info, posts, crawler, state)
+
+    async def _crawl(self, username: str) -> (dict, list, InstagramHttpCrawler, dict):
+        # RandProxy 가 proxy 목록을 요청하므로, crawler 생성도 executor 에서 실행한다
+        crawler = await self._fetch(InstagramHttpCrawler, username)
+        await self._fetch(crawler.session)
+        proxy_limit = self._proxy_limit(crawler.proxy_url)
+
+        async with proxy_limit:
+            user = await self._fetch(crawler.fetch_user)
+        # 비공개 또는 게시물이 없는 페이지는 Selenium 으로 크롤링하는 경우와 같이 유저 정보도 저장하지 않는다
+        if not crawler.page_available(user):
+            return None, [], crawler, None
+        page_info = crawler.parse_user_info(user)
+        shortcodes, has_next_page = crawler.timeline(user)
+
+        # 포스트 수가 이전 크롤링과 같은 경우에는 포스트를 크롤링하지 않으며,
+        # 이전 크롤링에서 가장 최신 포스트의 작성시간 이전의 포스트는 크롤링하지 않는다
+        # 'overwrite' 가 True 라면 30일 이내의 포스트를 모두 다시 저장하므로, 크롤링 상태는 프로필 확인에만 사용한다
+        state = None if CRAWL_STATE['FULL_REFRESH'] else await self._write(self.states.get, username)
+        if not self.overwrite and state is not None and state['postCount'] == page_info['postCount']:
+            return page_info, [], crawler, state
+        watermark = state['newestPostTimestamp'] if state and not self.overwrite else None
+
+        # 'overwrite' 가 False 라면, 이미 저장된 포스트는 포스트 페이지를 요청하기 전에 확인하여 크롤링을 중지한다
+        known_posts = None
+        if not self.overwrite:
+            known_posts = await self._write(KnownPostIndex, self.data_collection, username, crawler.crawl_since())
+
+        posts = []
+        for shortcode, post_id in shortcodes:
+            if known_posts is not None:
+                # 가져온 범위보다 오래된 포스트는 collection 에서 확인하므로 writer executor 에서 확인한다
+                known = post_id in known_posts if known_posts.oldest is None \
+                    else await self._write(known_posts.__contains__, post_id)
+                if known:
+                    return page_info, posts, crawler, state
+            if watermark is not None and self.states.post_timestamp(post_id) <= watermark:
+                return page_info, posts, crawler, state
+            # 다음 포스트를 요청하기 전에 proxy 와 인스타그램의 요청 간격만큼 기다리며, 기다리는 동안 다른 유저를 크롤링한다
+            delay, factor = await self._write(rate_limiter().reserve, crawler.proxy_key)
+            await asyncio.sleep(delay)
+            stage_metrics().observe('rate_wait', delay, crawler.proxy_key, rate_limiter().outcome(factor))
+            async with proxy_limit:
+                media = await self._fetch(crawler.fetch_content, shortcode)
+            try:
+                posts.append(crawler.parse_content(media))
+            except ValueError:
+                # 30일이 지난 포스트인 경우 이후의 포스트는 가져오지 않는다
+                return page_info, posts, crawler, state
+
+        if has_next_page:
+            raise JSONExtractError(f'crawl(): more than {len(shortcodes)} posts in {crawler.MAX_CRAWL_DATE} days')
+
+        return page_info, posts, crawler, state
+
+    async def _save(self, page_info: dict, posts: list, crawler: InstagramHttpCrawler, state: dict) -> None:
+        # 취소 요청이 들어와도 유저 정보와 포스트 정보를 저장하는 도중에는 중단하지 않는다
+        # 저장 task 는 run() 이 종료되기 전에 모두 기다린다
+        save = self.loop.create_task(self._save_all(page_info, posts, crawler, state))
+        self._saves.add(save)
+        save.add_done_callback(self._saves.discard)
+        await asyncio.shield(save)
+
+    async def _save_all(self, page_info: dict, posts: list, crawler: InstagramHttpCrawler, state: dict) -> None:
+        logging.info(page_info)
+        # 유저 한 명의 저장 요청을 모두 모은 다음, writer executor 에서 한번에 bulk_write 로 저장한다
+        writes = MongoWriteBuffer(batch_size=len(posts) + 3)
+        # 프로필이 바뀌지 않은 경우에는 최신 유저 정보를 저장하지 않는다
+        profile_hash = self.states.profile_hash(page_info)
+        if state is None or state['profileHash'] != profile_hash:
+            writes.replace(self.user_collection, page_info)
+        self.snapshots.save(writes, crawler.daily_user_info(page_info))
+
+        # 포스트 정보를 저장한다
+        # 'overwrite' 가 True 라면, 30일 이내의 모든 포스트 정보를 중복여부에 상관없이 다시 저장한다
+        # (이미 저장된 포스트는 새로운 댓글만 추가하고, 좋아요 수 등의 필드만 바꾼다)
+        # 'overwrite '가 False 라면, 이미 저장되어 있는 포스트는 덮어쓰지 않는다
+        stored_comments = None
+        if self.overwrite and posts:
+            stored_comments = await self._write(CommentIndex, self.data_collection, page_info['userName'],
+                                                crawler.crawl_since())
+        for data in posts:
+            if self.overwrite:
+                writes.sync(self.data_collection, data, stored_comments.get(data['_id']))
+            else:
+                writes.insert(self.data_collection, data)
+
+        await self._write(writes.flush)
+        if writes.duplicates:
+            logging.warning(f'Duplicate document: key {writes.duplicates}')
+        self.counters['posts'] += len(posts) - len(writes.duplicates)
+        self.counters['comments_new'] += writes.counters['comments_new']
+        self.counters['comments_stored'] += writes.counters['comments_stored']
+
+        newest = state['newestPostTimestamp'] if state else None
+        for data in posts:
+            newest = max(newest or 0, data['publishedAtTimestamp'])
+        await self._write(self.states.save, page_info['userName'], newest, page_info['postCount'], profile_hash)
+        self.counters['users'] += 1
+
+    def users_per_minute(self) -> float:
+        elapsed = time.time() - self.start
+        return self.counters['users'] / elapsed * 60 if elapsed else 0.0
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(ASYNC_CRAWL['REPORT_INTERVAL'])
+            logging.info(f'## PROGRESS: {self.counters} users/min: {self.users_per_minute():.1f}')
+
+    async def _worker(self, usernames) -> None:
+        # 여러 worker 가 하나의 iterator 를 나누어 가져가므로, 동시에 크롤링하는 유저 수는 worker 수로 제한된다
+        while True:
+            username = await self.loop.run_in_executor(self.reader, next, usernames, None)
+            if username is None:
+                return
+            await self.crawl_user(username)
+
+    async def _run_all(self, usernames) -> None:
+        usernames = iter(usernames)
+        reporter = self.loop.create_task(self._report())
+        try:
+            await asyncio.gather(*[self._worker(usernames) for _ in range(self.concurrency)])
+        finally:
+            reporter.cancel()
+
+    def run(self, usernames) -> None:
+        """
+        유저 목록을 모두 크롤링할 때까지 실행한다
+        SIGINT, SIGTERM 을 받는 경우 진행 중인 유저를 취소하고 retry 를 위해 저장한 다음 종료한다
+        이미 저장 중인 유저는 저장이 끝날 때까지 기다린다
+        :param usernames: 인스타그램 유저이름 목록
+        :return: None
+        """
+        self.start = time.time()
+        task = self.loop.create_task(self._run_all(usernames))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, task.cancel)
+
+        try:
+            self.loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            logging.warning('## CANCELLED: async crawling stopped by signal')
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self.loop.remove_signal_handler(sig)
+            # 저장 중인 task 와 취소된 유저의 retry 저장이 끝난 다음에 executor 를 종료한다
+            pending = self._saves | {pending for pending in asyncio.all_tasks(self.loop) if not pending.done()}
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.reader.shutdown(wait=True)
+            self.fetcher.shutdown(wait=True)
+            self.writer.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    from utils.crawl_flow import crawl_job
+
+    logging.info(f'## START: async crawling....{datetime.now()}')
+    runner = AsyncCrawlRunner(CRAWL_STATE['OVERWRITE'])
+    mongodb = MongoDBConnector()
+    # 유저 목록 조회에 사용하는 index 는 크롤링을 시작하기 전에 한 번만 만든다
+    mongodb.ensure_indexes()
+    runner.run(mongodb.over_500_followers())
+    end = time.time()
+    logging.info(f'## proxy stats: {proxy_manager().stats()}')
+    logging.info(f'## rate limit backoff: {rate_limiter().stats()}')
+    logging.info(f'## END: async crawling... {runner.counters} '
+                 f'users/min: {runner.users_per_minute():.1f} time taken: {end - runner.start}')
+
+    # JSON 으로 크롤링하지 못한 유저는 기존 process pool 로 Selenium 크롤링한다
+    # main.py 와 같이 crawl_job 으로 유저마다 에러를 redis-logging 하므로, 한 유저가 실패해도 나머지 유저는 크롤링한다
+    if runner.fallback:
+        pool = Pool(processes=proc_numbers, initializer=init_driver_pool)
+        pool.map(partial(crawl_job, runner.overwrite), runner.fallback)
+        pool.close()
+        pool.join()
+
+    logging.info(f'## stage metrics: {stage_metrics().export()["stages"]}')
+    end = time.time()
+    send_error(f'async crawling end..users/min: {runner.users_per_minute():.1f} time taken: {end - runner.start}')
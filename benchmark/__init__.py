@@ -0,0 +1,5 @@
+import os
+
+# benchmark 에서 실행하는 크롤러 함수가 기록하는 단계별 실행 시간을 저장하는 경로
+# 크롤링 결과(METRICS['PATH'])에 섞이지 않도록, 각 benchmark 는 실행할 때 init_stage_metrics(METRICS_PATH) 를 호출한다
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'metrics')
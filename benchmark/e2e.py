@@ -0,0 +1,268 @@
+"""
+인스타그램, proxy, MongoDB, Redis 없이 utils.crawl_flow.crawl_job 을 process pool 로 실행하여 크롤링 처리량을 측정한다
+- 인스타그램 대신 benchmark.standin_server 의 페이지를 크롤링하며, 서버를 proxy 로 사용한다
+- MongoDBConnector, RedisConnector 는 worker 프로세스마다 mongomock, fakeredis client 를 사용한다
+  (fakeredis 는 프로세스 사이에 공유되지 않으므로, rate limit bucket 도 worker 별로 따로 적용된다)
+- users/min, posts/min, worker 별 메모리(worker 프로세스와 브라우저 프로세스의 RSS)와 단계별 실행 시간을 출력하고 JSON 으로 저장한다
+
+usage: python -m benchmark.e2e [--users 30] [--procs N] [--mode selenium|http] [--posts 12] [--comments 8]
+                               [--latency 0.2] [--error-rate 0] [--private-rate 0.05] [--not-found-rate 0.02]
+                               [--proxy-rate R] [--host-rate R]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+import fakeredis
+import mongomock
+
+import config
+from benchmark import METRICS_PATH
+from benchmark.standin_server import StandInSite, serve
+
+RESULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# utils/crawl_flow.py 의 collection 이름이 비어 있는 경우에 사용하는 이름
+DEFAULT_DATABASE = 'instagram'
+DEFAULT_COLLECTION = 'documents'
+
+
+class StandInDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name: str):
+        return self._database[name or DEFAULT_COLLECTION]
+
+    def __getattr__(self, name: str):
+        return getattr(self._database, name)
+
+
+class StandInMongoClient:
+    """
+    MongoDBConnector 가 사용하는 mongomock client, 비어 있는 database/collection 이름은 기본 이름으로 바꾼다
+    """
+    def __init__(self):
+        self._client = mongomock.MongoClient()
+
+    def __getitem__(self, name: str) -> StandInDatabase:
+        return StandInDatabase(self._client[name or DEFAULT_DATABASE])
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+_mongo = None
+_redis = None
+
+
+def install_stand_ins(port: int, mode: str, run_id: str) -> None:
+    """
+    현재 프로세스의 크롤러가 stand-in 서버, mongomock, fakeredis 를 사용하도록 설정한다
+    :param port: stand-in 서버 port
+    :param mode: 'selenium' or 'http'
+    :param run_id: 단계별 실행 시간을 저장할 run id
+    :return: None
+    """
+    global _mongo, _redis
+    import connector.connector
+    import utils.crawl_flow
+    from utils.metrics import init_stage_metrics
+
+    _mongo = StandInMongoClient()
+    _redis = fakeredis.FakeRedis(decode_responses=True)
+    connector.connector.MongoClient = lambda *args, **kwargs: _mongo
+    connector.connector.Redis = lambda *args, **kwargs: _redis
+
+    config.BASE_URL = f'http://127.0.0.1:{port}/{{username}}/'
+    config.HTTP_CRAWL['POST_URL'] = f'http://127.0.0.1:{port}/p/{{shortcode}}/'
+    config.ALERT['SINK'] = 'stub'
+    # 단계별 실행 시간은 크롤링 결과(METRICS['PATH'])가 아닌 benchmark 결과 경로에 저장한다
+    init_stage_metrics(METRICS_PATH, run_id)
+    utils.crawl_flow.FETCH_MODE = mode
+    # stand-in 서버를 proxy 로 사용하므로, proxy API 를 요청하지 않도록 proxy 목록을 미리 저장한다
+    _redis.set(f'{config.PROXY_POOL["PREFIX"]}:list', json.dumps([
+        {'protocol': 'http', 'ip': '127.0.0.1', 'port': port, 'user': 'standin', 'password': 'standin'}
+    ]))
+
+
+def init_worker(port: int, mode: str, run_id: str) -> None:
+    from utils.driver_pool import init_driver_pool
+
+    install_stand_ins(port, mode, run_id)
+    init_driver_pool()
+
+
+def _process_rss(pid: int) -> int:
+    # /proc/{pid}/status 의 VmRSS(KB), 확인할 수 없는 경우 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _descendants(pid: int) -> list:
+    # /proc 의 parent pid 로 하위 프로세스(chromedriver, chrome)를 찾는다, /proc 가 없는 경우 빈 목록
+    parents = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return []
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/stat') as f:
+                parents.setdefault(int(f.read().rsplit(')', 1)[1].split()[1]), []).append(child)
+        except (OSError, IndexError, ValueError):
+            continue
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def crawl(username: str) -> dict:
+    """
+    유저 한 명을 crawl_job 으로 크롤링하고, 저장된 포스트 수와 메모리 사용량을 반환한다
+    """
+    from utils.crawl_flow import crawl_job
+    from connector.connector import RedisConnector
+
+    start = time.time()
+    crawl_job(True, username)
+    elapsed = time.time() - start
+
+    documents = _mongo[''][''] if _mongo is not None else None
+    redis_conn = RedisConnector()
+    pid = os.getpid()
+    return {
+        'username': username,
+        'pid': pid,
+        'seconds': elapsed,
+        'posts': documents.count_documents({'userName': username, 'contentText': {'$exists': True}}),
+        'failed': redis_conn.client.zscore(redis_conn.retry_queue, username) is not None,
+        # ru_maxrss 는 linux 에서 KB 단위이다
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'browser_rss_kb': sum(_process_rss(child) for child in _descendants(pid))
+    }
+
+
+def report(results: list, elapsed: float) -> dict:
+    workers = {}
+    for result in results:
+        worker = workers.setdefault(result['pid'], {'users': 0, 'posts': 0, 'failed': 0, 'seconds': 0.0,
+                                                    'max_rss_mb': 0.0, 'max_browser_rss_mb': 0.0})
+        worker['users'] += 1
+        worker['posts'] += result['posts']
+        worker['failed'] += result['failed']
+        worker['seconds'] += result['seconds']
+        worker['max_rss_mb'] = max(worker['max_rss_mb'], result['max_rss_kb'] / 1024)
+        worker['max_browser_rss_mb'] = max(worker['max_browser_rss_mb'], result['browser_rss_kb'] / 1024)
+
+    users = len(results)
+    posts = sum(result['posts'] for result in results)
+    return {
+        'users': users,
+        'posts': posts,
+        'failed': sum(result['failed'] for result in results),
+        'seconds': elapsed,
+        'users_per_minute': users / elapsed * 60 if elapsed else 0.0,
+        'posts_per_minute': posts / elapsed * 60 if elapsed else 0.0,
+        'workers': {str(pid): worker for pid, worker in sorted(workers.items())}
+    }
+
+
+def run(users: int, procs: int, mode: str, site: StandInSite) -> dict:
+    """
+    stand-in 서버를 실행하고, procs 개의 worker 로 users 명을 크롤링한다
+    :return: 측정 결과(dict)
+    """
+    from utils.metrics import stage_metrics
+
+    server = serve(site=site)
+    port = server.server_address[1]
+    run_id = f'e2e-{mode}-{datetime.now().strftime("%Y%m%d%H%M%S")}'
+    install_stand_ins(port, mode, run_id)
+
+    usernames = [f'standin_user{number:05d}' for number in range(users)]
+    start = time.time()
+    pool = Pool(processes=procs, initializer=init_worker, initargs=(port, mode, run_id))
+    results = list(pool.imap_unordered(crawl, usernames))
+    # worker 프로세스가 정상 종료되어야 브라우저가 정리되고, 단계별 실행 시간이 저장된다
+    pool.close()
+    pool.join()
+    elapsed = time.time() - start
+    server.shutdown()
+
+    summary = report(results, elapsed)
+    summary['meta'] = {
+        'createdAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'mode': mode,
+        'procs': procs,
+        'site': site.options,
+        'requests': site.counters
+    }
+    summary['stages'] = stage_metrics().export()['stages']
+    return summary
+
+
+def print_report(summary: dict) -> None:
+    meta = summary['meta']
+    print(f'mode: {meta["mode"]} procs: {meta["procs"]} requests: {meta["requests"]}')
+    print(f'users: {summary["users"]} posts: {summary["posts"]} failed: {summary["failed"]} '
+          f'time: {summary["seconds"]:.1f}s')
+    print(f'users/min: {summary["users_per_minute"]:.1f} posts/min: {summary["posts_per_minute"]:.1f}')
+    print(f'{"worker":<10}{"users":>8}{"posts":>8}{"failed":>8}{"rss (MB)":>12}{"browser (MB)":>15}')
+    for pid, worker in summary['workers'].items():
+        print(f'{pid:<10}{worker["users"]:>8}{worker["posts"]:>8}{worker["failed"]:>8}'
+              f'{worker["max_rss_mb"]:>12.1f}{worker["max_browser_rss_mb"]:>15.1f}')
+    print(f'{"stage":<16}{"count":>8}{"p50 (s)":>10}{"p90 (s)":>10}{"p99 (s)":>10}')
+    for stage, stats in sorted(summary['stages'].items()):
+        print(f'{stage:<16}{stats["count"]:>8}{stats["p50"]:>10.3f}{stats["p90"]:>10.3f}{stats["p99"]:>10.3f}')
+
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(description='end-to-end crawl throughput against a local instagram stand-in')
+    args.add_argument('--users', type=int, default=30)
+    args.add_argument('--procs', type=int, default=config.proc_numbers)
+    args.add_argument('--mode', choices=('selenium', 'http'), default=config.FETCH_MODE)
+    args.add_argument('--posts', type=int, default=12, help='posts per user')
+    args.add_argument('--comments', type=int, default=8, help='comments per post')
+    args.add_argument('--latency', type=float, default=0.2, help='mean response latency in seconds')
+    args.add_argument('--error-rate', type=float, default=0.0, help='ratio of HTTP 500 responses')
+    args.add_argument('--private-rate', type=float, default=0.05)
+    args.add_argument('--not-found-rate', type=float, default=0.02)
+    args.add_argument('--proxy-rate', type=float, help='requests per second per proxy (default: config.RATE_LIMIT)')
+    args.add_argument('--host-rate', type=float, help='requests per second to the site (default: config.RATE_LIMIT)')
+    args.add_argument('--output', help='result JSON path (default: benchmark/results/e2e-{mode}-{procs}.json)')
+    args = args.parse_args(argv)
+
+    site = StandInSite(POSTS=args.posts, COMMENTS=args.comments, LATENCY=args.latency, ERROR_RATE=args.error_rate,
+                       PRIVATE_RATE=args.private_rate, NOT_FOUND_RATE=args.not_found_rate)
+    # stand-in 서버 하나를 proxy 로 사용하므로, 모든 요청이 같은 proxy bucket 을 사용한다
+    if args.proxy_rate:
+        config.RATE_LIMIT['PROXY_RATE'] = args.proxy_rate
+    if args.host_rate:
+        config.RATE_LIMIT['HOST_RATE'] = args.host_rate
+    summary = run(args.users, args.procs, args.mode, site)
+    print_report(summary)
+
+    output = args.output or os.path.join(RESULT_PATH, f'e2e-{args.mode}-{args.procs}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f'saved: {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+포스트 본문 corpus(benchmark/fixtures/captions.txt)로 emoji 삭제 속도(MB/s)를 측정한다
+측정 전에 utils.emoji_text 의 함수가 기존 구현과 같은 결과를 반환하는지 corpus 와 랜덤 문자열로 먼저 확인한다
+
+usage: python -m benchmark.emoji_bench [repeat]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+import emoji
+
+from utils.emoji_text import remove_emoji, strip_emoji, strip_many
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_strip_emoji(text):
+    new_text = re.sub(emoji.get_emoji_regexp(), r'', text)
+    emoji_pattern = re.compile("["
+                               u"\u2800"
+                               "]+", flags=re.UNICODE)
+    return emoji_pattern.sub(r' ', new_text).strip()
+
+
+def legacy_remove_emoji(string):
+    NON_BMP_RE = re.compile(u"[^\U00000000-\U0000d7ff\U0000e000-\U0000ffff]", flags=re.UNICODE)
+    rem_emoji_text = NON_BMP_RE.sub(r'', string)
+
+    emoji_pattern = re.compile("["
+                               u"\u200d"
+                               u"\u2640-\u2642"
+                               u"\u2600-\u2B55"
+                               u"\u23cf"
+                               u"\u23e9"
+                               u"\u231a"
+                               u"\u3030"
+                               u"\ufe0f"
+                               "]+", flags=re.UNICODE)
+
+    return emoji_pattern.sub(r'', rem_emoji_text)
+
+
+def load_captions() -> list:
+    # 한 줄에 포스트 본문 하나이며, 본문의 줄바꿈은 '\n' 문자열로 저장되어 있다
+    with open(os.path.join(FIXTURE_PATH, 'captions.txt'), 'rt', encoding='utf-8') as f:
+        return [line.rstrip('\n').replace('\\n', '\n') for line in f if line.strip()]
+
+
+def random_texts(count: int, seed: int = 0) -> list:
+    # emoji, 공백 문자(\u2800), emoji 의 일부 문자, 한글, 영문이 섞인 문자열을 만든다
+    rng = random.Random(seed)
+    emojis = list(emoji.unicode_codes.EMOJI_UNICODE.values())
+    parts = ['\u2800', '\u200d', '\ufe0f', '\u20e3', '#', '1', ' ', '\n', '가', '나', 'a', 'b', '\U0001F3FB']
+    texts = []
+    for _ in range(count):
+        pieces = [rng.choice(emojis) if rng.random() < 0.4 else rng.choice(parts) for _ in range(rng.randint(0, 20))]
+        texts.append(''.join(pieces))
+    return texts
+
+
+def check_equivalence() -> None:
+    """
+    새 구현이 기존 구현과 같은 결과를 반환하는지 확인한다
+    :return: None
+    """
+    texts = load_captions() + random_texts(5000)
+    for text in texts:
+        for func, legacy in ((strip_emoji, legacy_strip_emoji), (remove_emoji, legacy_remove_emoji)):
+            if func(text) != legacy(text):
+                raise AssertionError(f'{func.__name__}({text!r}): {func(text)!r} != {legacy(text)!r}')
+    if strip_many(texts) != [legacy_strip_emoji(text) for text in texts]:
+        raise AssertionError('strip_many() result differs from strip_emoji()')
+
+
+def throughput(func, texts: list, repeat: int) -> float:
+    size = sum(len(text.encode('utf-8')) for text in texts) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(texts)
+    return size / (time.perf_counter() - start) / 1024 / 1024
+
+
+def run(repeat: int = 20) -> None:
+    check_equivalence()
+    # corpus 를 반복하여 약 1MB 로 만든다
+    captions = load_captions()
+    size = sum(len(text.encode('utf-8')) for text in captions)
+    texts = captions * max(1024 * 1024 // size, 1)
+
+    cases = [
+        ('legacy strip_emoji()', lambda items: [legacy_strip_emoji(text) for text in items]),
+        ('strip_emoji()', lambda items: [strip_emoji(text) for text in items]),
+        ('strip_many()', strip_many),
+        ('legacy remove_emoji()', lambda items: [legacy_remove_emoji(text) for text in items]),
+        ('remove_emoji()', lambda items: [remove_emoji(text) for text in items]),
+    ]
+    print(f'corpus: {len(captions)} captions x {len(texts) // len(captions)} = '
+          f'{sum(len(text.encode("utf-8")) for text in texts) / 1024 / 1024:.2f}MB')
+    print(f'{"case":<26}{"MB/s":>12}')
+    for name, func in cases:
+        func(texts[:100])
+        print(f'{name:<26}{throughput(func, texts, repeat):>12.2f}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,62 @@
+"""
+저장된 인스타그램 페이지(benchmark/fixtures)를 반환하는 로컬 HTTP 서버
+InstagramHttpCrawler 를 인스타그램, proxy 없이 실행하기 위해 사용한다
+
+usage: python -m benchmark.fixture_server [port]
+       FETCH 주소: http://127.0.0.1:{port}/{username}/, http://127.0.0.1:{port}/p/{shortcode}/
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 포스트 shortcode 별로 반환할 fixture 파일
+POSTS = {
+    'B9aaaaaaaa1': 'http_post.html',
+    'B9aaaaaaaa2': 'http_post_video.html'
+}
+PROFILE = 'http_profile.html'
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        paths = [path for path in self.path.split('?')[0].split('/') if path]
+        if len(paths) == 2 and paths[0] == 'p':
+            fixture = POSTS.get(paths[1])
+        elif len(paths) == 1:
+            fixture = PROFILE
+        else:
+            fixture = None
+
+        if fixture is None:
+            self.send_error(404)
+            return
+
+        with open(os.path.join(FIXTURE_PATH, fixture), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 0) -> HTTPServer:
+    """
+    fixture 서버를 background thread 로 실행한다
+    :param port: 0 인 경우 사용 가능한 port 를 선택한다
+    :return: HTTPServer (server.server_address 로 주소를 확인하고, server.shutdown() 으로 종료한다)
+    """
+    server = HTTPServer(('127.0.0.1', port), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    HTTPServer(('127.0.0.1', int(sys.argv[1]) if len(sys.argv) > 1 else 8000), FixtureHandler).serve_forever()
@@ -0,0 +1,154 @@
+"""
+브라우징 모드('normal', 'lean')별로 유저 페이지와 포스트 페이지의 전송량(bytes)과 로딩 시간을 측정한다
+전송량은 Chrome 의 DevTools network 로그(performance log)에서 페이지를 여는 동안 받은 bytes 와 차단된 요청 수를 집계한다
+--standin 인 경우 benchmark.standin_server 를 크롤링하며, 아닌 경우 config 의 인스타그램 주소와 proxy 로 username 들을 크롤링한다
+
+usage: python -m benchmark.lean_bench [--standin] [--users 5] [--posts 3] [--settle 1.0] [username ...]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.wait import WebDriverWait
+
+from utils.crawler import InstagramCrawler
+from utils.metrics import init_stage_metrics
+
+from benchmark import METRICS_PATH
+
+RESULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+MODES = ('normal', 'lean')
+
+
+def transfer(driver) -> dict:
+    """
+    마지막으로 호출한 이후의 DevTools network 로그에서 요청 수, 받은 bytes, 차단된 요청 수를 집계한다
+    :param driver: performance_log=True 로 띄운 webdriver
+    :return: {'requests', 'bytes', 'blocked'}
+    """
+    summary = {'requests': 0, 'bytes': 0, 'blocked': 0}
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        method, params = message.get('method'), message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            summary['requests'] += 1
+        elif method == 'Network.loadingFinished':
+            summary['bytes'] += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+            summary['blocked'] += 1
+    return summary
+
+
+def measure(driver, open_page, selector: str, settle: float) -> dict:
+    """
+    open_page() 로 페이지를 연 다음 selector 가 나타날 때까지의 시간과, settle 초 동안 받은 리소스까지의 전송량을 반환한다
+    """
+    transfer(driver)
+    start = time.time()
+    open_page()
+    try:
+        WebDriverWait(driver, 30).until(expected_conditions.presence_of_element_located((By.CSS_SELECTOR, selector)))
+    except TimeoutException:
+        return None
+    load_seconds = time.time() - start
+    # 본문이 나타난 다음에 받는 이미지, 동영상까지 집계한다
+    time.sleep(settle)
+    return dict(transfer(driver), seconds=load_seconds)
+
+
+def run_mode(mode: str, usernames: list, posts: int, settle: float) -> list:
+    crawler = InstagramCrawler(usernames[0])
+    driver = crawler.driver(mode=mode, performance_log=True)
+    pages = []
+    try:
+        for username in usernames:
+            crawler.user = username
+            result = measure(driver, lambda: driver.get(crawler.url()), 'div._9AhH0', settle)
+            if result is None:
+                continue
+            pages.append(dict(result, kind='profile', username=username))
+
+            crawler.popup_check_and_close(driver)
+            open_post = driver.find_element_by_css_selector('div._9AhH0').click
+            for _ in range(posts):
+                result = measure(driver, open_post, 'div.C4VMK > span', settle)
+                if result is None:
+                    break
+                pages.append(dict(result, kind='post', username=username))
+                arrows = driver.find_elements_by_css_selector('a._65Bje.coreSpriteRightPaginationArrow')
+                if not arrows:
+                    break
+                open_post = arrows[0].click
+    finally:
+        driver.quit()
+    return pages
+
+
+def summarize(pages: list) -> dict:
+    summary = {}
+    for kind in ('profile', 'post'):
+        selected = [page for page in pages if page['kind'] == kind]
+        if not selected:
+            continue
+        count = len(selected)
+        summary[kind] = {
+            'pages': count,
+            'avg_kb': sum(page['bytes'] for page in selected) / count / 1024,
+            'avg_seconds': sum(page['seconds'] for page in selected) / count,
+            'avg_requests': sum(page['requests'] for page in selected) / count,
+            'avg_blocked': sum(page['blocked'] for page in selected) / count
+        }
+    return summary
+
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(description='bytes transferred and load time per page for each browsing mode')
+    args.add_argument('usernames', nargs='*')
+    args.add_argument('--standin', action='store_true', help='crawl benchmark.standin_server instead of instagram')
+    args.add_argument('--users', type=int, default=5, help='stand-in users to crawl')
+    args.add_argument('--posts', type=int, default=3, help='posts to open per user')
+    args.add_argument('--settle', type=float, default=1.0, help='seconds to wait for media after the page renders')
+    args.add_argument('--output', default=os.path.join(RESULT_PATH, 'lean-bench.json'))
+    args = args.parse_args(argv)
+
+    # 크롤러 함수가 기록하는 단계별 실행 시간은 크롤링 결과(METRICS['PATH'])가 아닌 benchmark 결과 경로에 저장한다
+    init_stage_metrics(METRICS_PATH)
+    usernames = args.usernames
+    if args.standin:
+        from benchmark.e2e import install_stand_ins
+        from benchmark.standin_server import StandInSite, serve
+
+        server = serve(site=StandInSite(LATENCY=0.05, PRIVATE_RATE=0, NOT_FOUND_RATE=0))
+        install_stand_ins(server.server_address[1], 'selenium', f'lean-bench-{datetime.now().strftime("%Y%m%d%H%M%S")}')
+        usernames = usernames or [f'standin_user{number:05d}' for number in range(args.users)]
+    if not usernames:
+        print('usernames are required without --standin')
+        return 2
+
+    results = {mode: summarize(run_mode(mode, usernames, args.posts, args.settle)) for mode in MODES}
+
+    print(f'{"mode":<8}{"page":<9}{"pages":>7}{"avg KB":>10}{"avg load (s)":>14}{"requests":>10}{"blocked":>9}')
+    for mode, summary in results.items():
+        for kind, stats in summary.items():
+            print(f'{mode:<8}{kind:<9}{stats["pages"]:>7}{stats["avg_kb"]:>10.1f}{stats["avg_seconds"]:>14.3f}'
+                  f'{stats["avg_requests"]:>10.1f}{stats["avg_blocked"]:>9.1f}')
+    for kind in ('profile', 'post'):
+        normal, lean = results['normal'].get(kind), results['lean'].get(kind)
+        if normal and lean and normal['avg_kb']:
+            print(f'{kind}: lean transfers {1 - lean["avg_kb"] / normal["avg_kb"]:.0%} fewer bytes, '
+                  f'load time {lean["avg_seconds"] - normal["avg_seconds"]:+.3f}s')
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'createdAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+저장된 인스타그램 페이지(benchmark/fixtures)로 parser backend 별 파싱 시간을 측정한다
+측정 전에 두 backend 의 파싱 결과가 같은지 먼저 확인한다
+
+usage: python -m benchmark.parse_bench [repeat]
+"""
+import os
+import sys
+import timeit
+
+from utils.parser import PARSERS
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+USERNAME = 'sample_shop'
+
+# (fixture 파일, 측정할 parser 함수 이름)
+CASES = [
+    ('profile.html', 'user_info'),
+    ('profile.html', 'has_login_popup'),
+    ('profile.html', 'page_available'),
+    ('private.html', 'page_available'),
+    ('not_found.html', 'page_available'),
+    ('post.html', 'content'),
+    ('post_video.html', 'content'),
+    ('post_many_comments.html', 'content'),
+]
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_PATH, name), 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def call(parser, method: str, html: str):
+    if method == 'content':
+        return parser.content(html, USERNAME)
+    return getattr(parser, method)(html)
+
+
+def check_parity() -> None:
+    """
+    모든 backend 가 같은 결과를 반환하는지 확인한다
+    :return: None
+    """
+    for fixture, method in CASES:
+        html = load_fixture(fixture)
+        results = {name: call(parser, method, html) for name, parser in PARSERS.items()}
+        expected = results['soup']
+        for name, result in results.items():
+            if result != expected:
+                raise AssertionError(f'{fixture} {method}(): {name} result differs from soup\n'
+                                     f'{result}\n{expected}')
+
+
+def run(repeat: int = 200) -> None:
+    check_parity()
+    print(f'{"fixture":<26}{"method":<18}' + ''.join(f'{name + " (ms)":>14}' for name in PARSERS) + f'{"speedup":>10}')
+    for fixture, method in CASES:
+        html = load_fixture(fixture)
+        timings = {}
+        for name, parser in PARSERS.items():
+            # warmup
+            call(parser, method, html)
+            elapsed = timeit.timeit(lambda: call(parser, method, html), number=repeat)
+            timings[name] = elapsed / repeat * 1000
+
+        speedup = timings['soup'] / timings['lxml'] if timings['lxml'] else 0
+        print(f'{fixture:<26}{method:<18}' + ''.join(f'{timings[name]:>14.3f}' for name in PARSERS)
+              + f'{speedup:>9.1f}x')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
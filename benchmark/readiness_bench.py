@@ -0,0 +1,155 @@
+"""
+readiness 모드('polling', 'observer')별로 페이지를 연 다음 다음 단계로 넘어가기까지의 대기 시간과 WebDriver 요청 수를 측정한다
+두 모드를 유저마다 번갈아 실행하여, 측정 중 proxy 와 사이트 상태의 변화가 두 모드에 고르게 섞이도록 한다
+--standin 인 경우 benchmark.standin_server 를 크롤링하며, 아닌 경우 config 의 인스타그램 주소와 proxy 로 username 들을 크롤링한다
+
+usage: python -m benchmark.readiness_bench [--standin] [--users 5] [--posts 5] [username ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from selenium.common.exceptions import TimeoutException
+
+from utils.crawler import InstagramCrawler
+from utils.metrics import init_stage_metrics
+from utils.readiness import post_time, wait_ready
+
+from benchmark import METRICS_PATH
+
+RESULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+MODES = ('polling', 'observer')
+
+
+class CommandCounter:
+    """
+    driver 가 보내는 WebDriver 요청 수를 센다
+    """
+    def __init__(self, driver):
+        self.count = 0
+        self._execute = driver.execute
+
+        def execute(*args, **kwargs):
+            self.count += 1
+            return self._execute(*args, **kwargs)
+        driver.execute = execute
+
+
+def measure(driver, counter: CommandCounter, action, selector: str, name: str, mode: str, previous=None) -> dict:
+    """
+    action() 을 실행한 다음 selector 가 준비될 때까지 기다린 시간과 그동안 보낸 WebDriver 요청 수를 반환한다
+    """
+    action()
+    commands = counter.count
+    start = time.perf_counter()
+    try:
+        wait_ready(driver, selector, 30, name, previous, mode=mode)
+    except TimeoutException:
+        return None
+    return {'wait': name, 'mode': mode, 'seconds': time.perf_counter() - start, 'commands': counter.count - commands}
+
+
+def run_user(driver, counter: CommandCounter, crawler: InstagramCrawler, mode: str, posts: int) -> list:
+    waits = []
+    result = measure(driver, counter, lambda: driver.get(crawler.url()), 'div._9AhH0', 'profile', mode)
+    if result is None:
+        return waits
+    waits.append(result)
+
+    crawler.popup_check_and_close(driver)
+    first = driver.find_element_by_css_selector('div._9AhH0')
+    result = measure(driver, counter, first.click, 'div.C4VMK > span', 'first_post', mode)
+    if result is None:
+        return waits
+    waits.append(result)
+
+    for _ in range(posts - 1):
+        arrows = driver.find_elements_by_css_selector('a._65Bje.coreSpriteRightPaginationArrow')
+        if not arrows:
+            break
+        result = measure(driver, counter, arrows[0].click, 'div.C4VMK > span', 'next_post', mode, post_time(driver))
+        if result is None:
+            break
+        waits.append(result)
+    return waits
+
+
+def summarize(waits: list) -> dict:
+    summary = {}
+    for wait in sorted({result['wait'] for result in waits}):
+        summary[wait] = {}
+        for mode in MODES:
+            selected = [result for result in waits if result['wait'] == wait and result['mode'] == mode]
+            if not selected:
+                continue
+            seconds = sorted(result['seconds'] for result in selected)
+            summary[wait][mode] = {
+                'count': len(selected),
+                'p50': statistics.median(seconds),
+                'p90': seconds[min(int(len(seconds) * 0.9), len(seconds) - 1)],
+                'mean': statistics.mean(seconds),
+                'avg_commands': sum(result['commands'] for result in selected) / len(selected)
+            }
+    return summary
+
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(description='page readiness latency of MutationObserver waits against polling')
+    args.add_argument('usernames', nargs='*')
+    args.add_argument('--standin', action='store_true', help='crawl benchmark.standin_server instead of instagram')
+    args.add_argument('--users', type=int, default=5, help='stand-in users to crawl')
+    args.add_argument('--posts', type=int, default=5, help='posts to open per user')
+    args.add_argument('--output', default=os.path.join(RESULT_PATH, 'readiness-bench.json'))
+    args = args.parse_args(argv)
+
+    # 크롤러 함수가 기록하는 단계별 실행 시간은 크롤링 결과(METRICS['PATH'])가 아닌 benchmark 결과 경로에 저장한다
+    init_stage_metrics(METRICS_PATH)
+    usernames = args.usernames
+    if args.standin:
+        from benchmark.e2e import install_stand_ins
+        from benchmark.standin_server import StandInSite, serve
+
+        server = serve(site=StandInSite(LATENCY=0.05, PRIVATE_RATE=0, NOT_FOUND_RATE=0))
+        install_stand_ins(server.server_address[1], 'selenium',
+                          f'readiness-bench-{datetime.now().strftime("%Y%m%d%H%M%S")}')
+        usernames = usernames or [f'standin_user{number:05d}' for number in range(args.users)]
+    if not usernames:
+        print('usernames are required without --standin')
+        return 2
+
+    crawler = InstagramCrawler(usernames[0])
+    driver = crawler.driver()
+    counter = CommandCounter(driver)
+    waits = []
+    try:
+        for number, username in enumerate(usernames):
+            crawler.user = username
+            # 유저마다 먼저 실행하는 모드를 바꾼다
+            for mode in (MODES if number % 2 == 0 else MODES[::-1]):
+                waits.extend(run_user(driver, counter, crawler, mode, args.posts))
+    finally:
+        driver.quit()
+
+    summary = summarize(waits)
+    print(f'{"wait":<12}{"mode":<10}{"count":>7}{"p50 (s)":>10}{"p90 (s)":>10}{"mean (s)":>10}{"commands":>10}')
+    for wait, modes in summary.items():
+        for mode, stats in modes.items():
+            print(f'{wait:<12}{mode:<10}{stats["count"]:>7}{stats["p50"]:>10.3f}{stats["p90"]:>10.3f}'
+                  f'{stats["mean"]:>10.3f}{stats["avg_commands"]:>10.1f}')
+        polling, observer = modes.get('polling'), modes.get('observer')
+        if polling and observer:
+            print(f'{wait}: observer p50 {observer["p50"] - polling["p50"]:+.3f}s, '
+                  f'{observer["avg_commands"] - polling["avg_commands"]:+.1f} commands per wait')
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'createdAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'results': summary}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""
+인스타그램 대신 유저 페이지와 포스트 페이지를 만들어서 반환하는 로컬 HTTP 서버
+페이지에는 크롤러가 사용하는 class 이름(benchmark/fixtures 와 같은 구조)과 JSON(_sharedData, __additionalDataLoaded)이 모두 포함되어 있어,
+Selenium 크롤링(utils.crawl_flow.crawl_user)과 HTTP 크롤링(InstagramHttpCrawler)에 모두 사용할 수 있다
+유저와 포스트 내용은 유저이름으로 정해지므로 같은 설정에서는 항상 같은 페이지를 반환하며,
+응답 지연(latency), 에러 응답(HTTP 500), 비공개/없는 유저의 비율을 설정할 수 있다
+페이지의 이미지, 동영상, 폰트는 MEDIA_BYTES 크기의 /media/ 주소로 받으므로, 브라우징 모드별 전송량을 비교할 수 있다
+
+usage: python -m benchmark.standin_server [port]
+       유저 페이지: http://127.0.0.1:{port}/{username}/, 포스트 페이지: http://127.0.0.1:{port}/p/{username}-{index}/
+"""
+import html
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 유저 페이지의 JSON(_sharedData)에 포함되는 최신 포스트 수
+TIMELINE_SIZE = 12
+
+SITE = {
+    # 유저마다 포스트 수, 포스트 사이의 시간 간격
+    'POSTS': 12,
+    'POST_INTERVAL_HOURS': 36,
+    # 포스트마다 댓글 수, 동영상 포스트의 비율
+    'COMMENTS': 8,
+    'VIDEO_RATE': 0.2,
+    # 전체 유저 중 비공개 유저, 없는 유저의 비율
+    'PRIVATE_RATE': 0.05,
+    'NOT_FOUND_RATE': 0.02,
+    # 응답 지연(초), 실제 지연은 LATENCY * (1 - JITTER ~ 1 + JITTER) 이다
+    'LATENCY': 0.2,
+    'JITTER': 0.5,
+    # 유저/포스트 페이지 요청 중 HTTP 500 을 반환하는 비율
+    'ERROR_RATE': 0.0,
+    # 페이지의 이미지, 동영상, 폰트(/media/)의 크기(bytes), 'lean' 브라우징 모드의 전송량 비교에 사용한다
+    'MEDIA_BYTES': 64 * 1024
+}
+
+MEDIA_TYPES = {
+    'jpg': 'image/jpeg',
+    'mp4': 'video/mp4',
+    'woff2': 'font/woff2'
+}
+# 모든 페이지에서 받는 폰트
+FONT_STYLE = '<style>@font-face{font-family:"standin";src:url("/media/standin.woff2")}body{font-family:"standin"}</style>'
+
+COMMENTERS = ['jiwoo_kim', 'minseo.p', 'hana_day', 'yujin.lee', 'daily_sora', 'coffee_jun', 'eun.bi_']
+COMMENTS = [
+    '너무 예뻐요!! \U0001F60D 색상 다른 것도 있나요?',
+    '배송 언제 되나요? \U0001F64F',
+    '선물용 포장 가능한가요 \U0001F381✨',
+    '와 대박 \U0001F44D\U0001F3FB',
+    '재입고 알림 부탁드려요⠀⠀감사합니다 \U0001F60A',
+    '사이즈 문의 DM 드렸어요',
+]
+CAPTIONS = [
+    '금요일 신상 입고 \U0001F33F✨ 이번 주는 #handmade 귀걸이 세트가 새로 들어왔어요⠀⠀\n주문은 프로필 링크에서 가능합니다 \U0001F60A #선물추천',
+    '제작 과정 영상 \U0001F3AC #making',
+    '오늘의 코디 #ootd #daily \U0001F457',
+    '주말 할인 이벤트 진행중입니다 \U0001F389 #event #sale',
+]
+
+NOT_FOUND_PAGE = '''<!DOCTYPE html>
+<html lang="ko"><head><meta charset="utf-8"><title>페이지를 찾을 수 없습니다 • Instagram</title></head>
+<body class="p-error dialog-404"><div id="react-root"><section class="_9eogI E3X2T"><main class="SCxLW o64aR" role="main">
+<div class="error-container -cx-PRIVATE-ErrorPage__errorContainer -cx-PRIVATE-ErrorPage__errorContainer__"><h2>죄송합니다. 페이지를 사용할 수 없습니다.</h2>
+<p>클릭하신 링크가 잘못되었거나 페이지가 삭제되었습니다. <a href="/">Instagram으로 돌아가기.</a></p></div>
+</main></section></div></body></html>'''
+
+# 동영상 포스트의 '조회' 를 클릭하면 좋아요 수와 닫기 element 를 추가한다
+SHOW_LIKE_SCRIPT = ("var box=document.createElement('div');box.className='vJRqr';box.innerHTML='<span>{like}</span>';"
+                    "var close=document.createElement('div');close.className='QhbhU';"
+                    "close.onclick=function(){{box.remove();close.remove();}};"
+                    "document.body.appendChild(box);document.body.appendChild(close);")
+
+
+def _ratio(*keys) -> float:
+    # 유저이름, 포스트 번호로 항상 같은 0 ~ 1 사이의 값을 만든다
+    return zlib.crc32('/'.join(str(key) for key in keys).encode('utf-8')) % 10000 / 10000
+
+
+def _iso(timestamp: int) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _json(data: dict) -> str:
+    # </script> 로 끝나는 script 안에 넣으므로 '</' 는 escape 한다
+    return json.dumps(data, ensure_ascii=False).replace('</', '<\\/')
+
+
+class StandInSite:
+    """
+    유저이름으로 유저 정보와 포스트 목록을 만들고, 인스타그램 페이지 형식의 HTML 을 반환한다
+    """
+    def __init__(self, **options):
+        unknown = set(options) - set(SITE)
+        if unknown:
+            raise ValueError(f'unknown site options: {sorted(unknown)}')
+        self.options = dict(SITE, **options)
+        # 포스트 작성시간은 서버가 시작된 시간 기준으로 정하여, 크롤링하는 동안 바뀌지 않도록 한다
+        self.now = int(time.time()) // 3600 * 3600
+        self.counters = {'profile': 0, 'post': 0, 'media': 0, 'not_found': 0, 'error': 0}
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def kind(self, username: str) -> str:
+        """
+        :return: 'public', 'private' or 'not_found'
+        """
+        ratio = _ratio(username)
+        if ratio < self.options['NOT_FOUND_RATE']:
+            return 'not_found'
+        if ratio < self.options['NOT_FOUND_RATE'] + self.options['PRIVATE_RATE']:
+            return 'private'
+        return 'public'
+
+    def post(self, username: str, index: int) -> dict:
+        timestamp = self.now - (index + 1) * self.options['POST_INTERVAL_HOURS'] * 3600
+        comments = []
+        for number in range(self.options['COMMENTS']):
+            # 포스트 주인의 답글도 섞는다(크롤러는 포스트 주인의 댓글을 저장하지 않는다)
+            writer = username if number % 4 == 3 else COMMENTERS[(index + number) % len(COMMENTERS)]
+            comments.append({
+                'username': writer,
+                'text': COMMENTS[(index * 7 + number) % len(COMMENTS)],
+                'timestamp': timestamp + (number + 1) * 600
+            })
+        return {
+            'shortcode': f'{username}-{index}',
+            'timestamp': timestamp,
+            'video': _ratio(username, index) < self.options['VIDEO_RATE'],
+            'caption': CAPTIONS[index % len(CAPTIONS)],
+            'like': 100 + int(_ratio(username, index, 'like') * 5000),
+            'views': 1000 + int(_ratio(username, index, 'views') * 50000),
+            'comments': comments
+        }
+
+    def user(self, username: str) -> dict:
+        ratio = _ratio(username, 'followers')
+        return {
+            'username': username,
+            'full_name': f'{username} 공식 계정',
+            'biography': '핸드메이드 액세서리 \U0001F33F\n문의는 DM 주세요 ✉️',
+            'verified': ratio < 0.1,
+            'followers': 500 + int(ratio * 100000),
+            'following': 100 + int(ratio * 1000),
+            'posts': self.options['POSTS']
+        }
+
+    def profile_page(self, username: str) -> (int, str):
+        kind = self.kind(username)
+        if kind == 'not_found':
+            return 404, NOT_FOUND_PAGE
+        user = self.user(username)
+        if kind == 'private':
+            return 200, self._private_page(user)
+
+        posts = [self.post(username, index) for index in range(min(user['posts'], TIMELINE_SIZE))]
+        shared_data = {'config': {'viewer': None}, 'entry_data': {'ProfilePage': [{'graphql': {'user': {
+            'username': username,
+            'full_name': user['full_name'],
+            'biography': user['biography'],
+            'is_verified': user['verified'],
+            'is_private': False,
+            'edge_followed_by': {'count': user['followers']},
+            'edge_follow': {'count': user['following']},
+            'edge_owner_to_timeline_media': {
+                'count': user['posts'],
+                'page_info': {'has_next_page': user['posts'] > TIMELINE_SIZE, 'end_cursor': None},
+                'edges': [{'node': {'shortcode': post['shortcode'], 'taken_at_timestamp': post['timestamp'],
+                                    'is_video': post['video']}} for post in posts]
+            }
+        }}}]}}
+        badge = '<span class="mrEK_ Szr5J coreSpriteVerifiedBadge" title="인증됨">인증됨</span>' if user['verified'] else ''
+        tiles = ''.join(
+            f'<div class="v1Nh3 kIKUG _bz0w"><a href="/p/{post["shortcode"]}/"><div class="eLAPa"><div class="KL4Bh">'
+            f'<img alt="사진 설명이 없습니다." class="FFVAD" src="/media/{post["shortcode"]}.jpg"></div><div class="_9AhH0"></div></div></a></div>\n'
+            for post in posts)
+        return 200, f'''<!DOCTYPE html>
+<html lang="ko" class="js logged-in client-root">
+<head><meta charset="utf-8"><title>{username} • Instagram 사진 및 동영상</title>{FONT_STYLE}</head>
+<body>
+<div id="react-root">
+<section class="_9eogI E3X2T"><main class="SCxLW o64aR" role="main"><div class="v9tJq AAaSh VfzDr">
+<header class="vtbgv"><section class="zwlfE">
+<div class="nZSzR"><h2 class="_7UhW9 fKFbl yUEEX KV-D4 fDxYl">{username}</h2>{badge}</div>
+<ul class="k9GMp">
+<li class="Y8-fY">게시물 <span class="g47SY">{user["posts"]:,}</span></li>
+<li class="Y8-fY"><a class="-nal3" href="/{username}/followers/">팔로워 <span class="g47SY" title="{user["followers"]:,}">{user["followers"]:,}</span></a></li>
+<li class="Y8-fY"><a class="-nal3" href="/{username}/following/">팔로우 <span class="g47SY">{user["following"]:,}</span></a></li>
+</ul>
+<div class="-vDIg"><h1 class="rhpdm">{html.escape(user["full_name"])}</h1><br><span>{html.escape(user["biography"])}</span></div>
+</section></header>
+<div class="_2z6nI"><article class="ySN3v"><div><div class="Nnq7C weEfm">
+{tiles}</div></div></article></div>
+</div></main></section>
+<div class="Z2m7o"><div class="tHaIX Igw0E rBNOH YBx95 _4EzTm">
+<button class="dCJp8 afkep xqRnw" type="button" onclick="this.parentNode.parentNode.remove()"><span aria-label="닫기"></span></button>
+</div></div>
+</div>
+<script type="text/javascript">window._sharedData = {_json(shared_data)};</script>
+</body>
+</html>'''
+
+    @staticmethod
+    def _private_page(user: dict) -> str:
+        return f'''<!DOCTYPE html>
+<html lang="ko"><head><meta charset="utf-8"><title>Instagram</title></head>
+<body><div id="react-root"><section class="_9eogI E3X2T"><main class="SCxLW o64aR" role="main">
+<div class="v9tJq AAaSh VfzDr"><header class="vtbgv"><section class="zwlfE">
+<ul class="k9GMp">
+<li class="Y8-fY">게시물 <span class="g47SY">{user["posts"]:,}</span></li>
+<li class="Y8-fY"><span class="-nal3">팔로워 <span class="g47SY" title="{user["followers"]:,}">{user["followers"]:,}</span></span></li>
+<li class="Y8-fY"><span class="-nal3">팔로우 <span class="g47SY">{user["following"]:,}</span></span></li>
+</ul>
+</section></header>
+<div class="_4Kbb_ _54f4m"><div class="QlxVY"><h2 class="rkEop">비공개 계정입니다</h2><div class="VIsJD">사진 및 동영상을 보려면 팔로우하세요.</div></div></div>
+</div></main></section></div>
+<script type="text/javascript">window._sharedData = {{"config": {{"viewer": null}}, "entry_data": {{}}}};</script>
+</body></html>'''
+
+    def post_page(self, shortcode: str) -> (int, str):
+        username, _, index = shortcode.rpartition('-')
+        if not username or not index.isdigit() or self.kind(username) != 'public' or \
+                int(index) >= self.options['POSTS']:
+            return 404, NOT_FOUND_PAGE
+        index = int(index)
+        post = self.post(username, index)
+
+        comments = ''.join(
+            '<ul class="Mr508"><div role="button" class="ZyFrc"><li class="gElp9" role="menuitem"><div class="P9YgZ">'
+            '<div class="C7I1f"><div class="C4VMK">\n'
+            f'<h3 class="_6lAjh"><a class="FPmhX notranslate TlrDj" href="/{comment["username"]}/" '
+            f'title="{comment["username"]}">{comment["username"]}</a></h3>\n'
+            f'<span>{html.escape(comment["text"])}</span>\n'
+            f'<div class="_7UhW9 PIoXz MMzan _0PwGv uL8Hv"><time class="FH9sR Nzb55" '
+            f'datetime="{_iso(comment["timestamp"])}">1일</time></div>\n'
+            '</div></div></div></li></div></ul>\n'
+            for comment in post['comments'])
+        # 본문의 해쉬태그는 인스타그램과 같이 링크로 만든다
+        caption = ' '.join(
+            f'<a class="xil3i" href="/explore/tags/{word[1:]}/">{html.escape(word)}</a>' if word.startswith('#')
+            else html.escape(word) for word in post['caption'].split(' '))
+        if post['video']:
+            like = f'<div class="HbPOm _9Ytll"><span class="vcOH2" onclick="{html.escape(SHOW_LIKE_SCRIPT.format(like=post["like"]))}">' \
+                   f'조회 <span>{post["views"]:,}</span>회</span></div>'
+        else:
+            like = f'<div class="Nm9Fw"><button class="sqdOP yWX7d _8A5w5" type="button">좋아요 <span>{post["like"]:,}</span>개</button></div>'
+        if post['video']:
+            media_tag = f'<video class="tWeCl" src="/media/{shortcode}.mp4" preload="auto" autoplay muted></video>'
+        else:
+            media_tag = f'<img class="FFVAD" alt="" src="/media/{shortcode}.jpg">'
+        next_page = ''
+        if index + 1 < self.options['POSTS']:
+            next_page = f'<div class="D1AKJ"><a class="HBoOv coreSpriteRightPaginationArrow _65Bje" tabindex="0" ' \
+                        f'href="/p/{username}-{index + 1}/">다음</a></div>'
+
+        media = {'graphql': {'shortcode_media': {
+            'shortcode': shortcode,
+            'is_video': post['video'],
+            'video_view_count': post['views'],
+            'taken_at_timestamp': post['timestamp'],
+            'owner': {'username': username},
+            'edge_media_to_caption': {'edges': [{'node': {'text': post['caption']}}]},
+            'edge_media_preview_like': {'count': post['like']},
+            'edge_media_to_parent_comment': {'count': len(post['comments']), 'edges': [
+                {'node': {'text': comment['text'], 'created_at': comment['timestamp'],
+                          'owner': {'username': comment['username']}}} for comment in post['comments']]}
+        }}}
+        return 200, f'''<!DOCTYPE html>
+<html lang="ko" class="js logged-in client-root">
+<head><meta charset="utf-8"><title>Instagram</title>{FONT_STYLE}</head>
+<body>
+<div id="react-root"></div>
+<div class="_2dDPU vCf6V" role="dialog"><div class="zZYga" role="dialog">
+<article class="M9sTE L_LMM JyscU">
+<div class="_97aPb">{media_tag}</div>
+<div class="eo2As"><div class="EtaWk"><ul class="XQXOT">
+<div role="button" class="ZyFrc"><li class="gElp9" role="menuitem"><div class="P9YgZ"><div class="C7I1f X7jCj"><div class="C4VMK">
+<h2 class="_6lAjh"><a class="FPmhX notranslate TlrDj" href="/{username}/" title="{username}">{username}</a></h2>
+<span>{caption}</span>
+<div class="_7UhW9 PIoXz MMzan _0PwGv uL8Hv"><time class="FH9sR Nzb55" datetime="{_iso(post["timestamp"])}">1일</time></div>
+</div></div></div></li></div>
+{comments}</ul></div>
+<section class="EDfFK ygqzn">{like}</section>
+<div class="k_Q0X NnvRN"><a class="c-Yi7" href="/p/{shortcode}/"><time class="_1o9PC Nzb55" datetime="{_iso(post["timestamp"])}">1일 전</time></a></div>
+</div>
+</article>
+</div>
+{next_page}
+<div class="Igw0E IwRSH eGOV_ _4EzTm BI4qX qJPeX fm1AK TxciK yiMZG"><button class="wpO6b" type="button"><svg aria-label="닫기"></svg></button></div>
+</div>
+<script type="text/javascript">window._sharedData = {{"config": {{"viewer": null}}, "entry_data": {{}}}};</script>
+<script type="text/javascript">window.__additionalDataLoaded('/p/{shortcode}/',{_json(media)});</script>
+</body>
+</html>'''
+
+    def delay(self) -> None:
+        latency = self.options['LATENCY']
+        if latency > 0:
+            jitter = self.options['JITTER']
+            time.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+
+    def media(self, name: str) -> (int, bytes, str):
+        content_type = MEDIA_TYPES.get(name.rpartition('.')[2])
+        if content_type is None:
+            self.count('not_found')
+            return 404, NOT_FOUND_PAGE.encode('utf-8'), 'text/html; charset=utf-8'
+        self.count('media')
+        return 200, b'\0' * self.options['MEDIA_BYTES'], content_type
+
+    def page(self, path: str) -> (int, str or bytes, str):
+        """
+        요청 경로에 해당하는 응답 코드, 본문, Content-Type 을 반환한다
+        proxy 로 사용하는 경우에는 전체 주소(http://host/path)로 요청되므로 경로만 사용한다
+        :param path: 요청 경로
+        :return: (status code, html or media bytes, content type)
+        """
+        paths = [part for part in urlsplit(path).path.split('/') if part]
+        if len(paths) == 2 and paths[0] == 'media':
+            self.delay()
+            return self.media(paths[1])
+        if len(paths) == 2 and paths[0] == 'p':
+            name, page = 'post', lambda: self.post_page(paths[1])
+        elif len(paths) == 1 and paths[0] != 'favicon.ico':
+            name, page = 'profile', lambda: self.profile_page(paths[0])
+        else:
+            self.count('not_found')
+            return 404, NOT_FOUND_PAGE, 'text/html; charset=utf-8'
+
+        self.delay()
+        if random.random() < self.options['ERROR_RATE']:
+            self.count('error')
+            return 500, '', 'text/html; charset=utf-8'
+        self.count(name)
+        return page() + ('text/html; charset=utf-8',)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    site = None
+
+    def do_GET(self):
+        status, body, content_type = self.site.page(self.path)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 0, site: StandInSite = None) -> ThreadingHTTPServer:
+    """
+    stand-in 서버를 background thread 로 실행한다
+    :param port: 0 인 경우 사용 가능한 port 를 선택한다
+    :param site: 반환할 페이지 설정, 없는 경우 SITE 기본값을 사용한다
+    :return: ThreadingHTTPServer (server.site 로 요청 수를 확인하고, server.shutdown() 으로 종료한다)
+    """
+    handler = type('Handler', (StandInHandler,), {'site': site or StandInSite()})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.site = handler.site
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    handler = type('Handler', (StandInHandler,), {'site': StandInSite()})
+    ThreadingHTTPServer(('127.0.0.1', int(sys.argv[1]) if len(sys.argv) > 1 else 8000), handler).serve_forever()
@@ -0,0 +1,286 @@
+"""
+저장된 인스타그램 페이지(benchmark/fixtures)로 InstagramCrawler 의 파싱 함수와 strip_emoji 의 실행 시간을 측정한다
+브라우저 대신 page_source 만 가지고 있는 FixtureDriver 를 사용하므로, 인스타그램과 proxy 없이 실행할 수 있다
+결과는 JSON 파일로 저장하며, --baseline 으로 저장된 결과와 비교하여 느려진 항목이 있는 경우 exit code 1 로 종료한다
+
+usage: python -m benchmark.suite [--repeat N] [--warmup N] [--parser lxml|soup] [--output PATH]
+                                 [--baseline PATH] [--threshold 0.2] [--stat median] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+import utils.crawler
+from utils.crawler import InstagramCrawler
+from utils.emoji_text import strip_emoji
+from utils.metrics import init_stage_metrics
+from utils.parser import get_parser
+
+from benchmark import METRICS_PATH
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_PATH = os.path.join(BENCHMARK_PATH, 'fixtures')
+RESULT_PATH = os.path.join(BENCHMARK_PATH, 'results')
+USERNAME = 'sample_shop'
+# fixture 포스트의 작성시간(2020-03)이 크롤링 기간(30일) 안에 들어가도록 크롤링 날짜를 고정한다
+CRAWL_DATE = datetime(2020, 3, 8, 12, 0, 0)
+
+
+class FixtureElement:
+    def __init__(self, driver, text: str = '', on_click=None):
+        self.driver = driver
+        self.text = text
+        self._on_click = on_click
+
+    def click(self) -> None:
+        if self._on_click is not None:
+            self._on_click()
+
+
+class FixtureDriver:
+    """
+    저장된 페이지를 page_source 로 반환하는 webdriver 대용
+    동영상 포스트는 '조회' 를 클릭한 다음에만 좋아요 수(like_count)가 보이도록 만든다
+    """
+    def __init__(self, html: str, like_count: str = None):
+        self.page_source = html
+        self.current_url = f'https://www.instagram.com/{USERNAME}/'
+        self.proxy_key = None
+        self.like_count = like_count
+        self.like_opened = False
+
+    def _open_like(self) -> None:
+        self.like_opened = True
+
+    def find_element_by_css_selector(self, selector: str) -> FixtureElement:
+        return self.find_element(By.CSS_SELECTOR, selector)
+
+    def find_element(self, by: str = By.ID, value: str = None) -> FixtureElement:
+        if self.like_count is not None:
+            if value == 'div.HbPOm._9Ytll > span.vcOH2':
+                return FixtureElement(self, on_click=self._open_like)
+            if self.like_opened and value == 'div.vJRqr > span':
+                return FixtureElement(self, self.like_count)
+            if self.like_opened and value == '.QhbhU':
+                return FixtureElement(self)
+        raise NoSuchElementException(f'{by}: {value}')
+
+    def execute_async_script(self, script: str, selector: str, *args) -> dict:
+        # utils.readiness.wait_ready() 의 결과와 같은 형식으로, selector 가 있는 경우 바로 'ready' 를 반환한다
+        try:
+            return {'state': 'ready', 'element': self.find_element(By.CSS_SELECTOR, selector)}
+        except NoSuchElementException:
+            return {'state': 'timeout'}
+
+    # READINESS['MODE'] 가 'polling' 인 경우
+    execute_script = execute_async_script
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_PATH, name), 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def load_captions() -> list:
+    # 한 줄에 포스트 본문 하나이며, 본문의 줄바꿈은 '\n' 문자열로 저장되어 있다
+    with open(os.path.join(FIXTURE_PATH, 'captions.txt'), 'rt', encoding='utf-8') as f:
+        return [line.rstrip('\n').replace('\\n', '\n') for line in f if line.strip()]
+
+
+def crawler() -> InstagramCrawler:
+    instance = InstagramCrawler(USERNAME)
+    instance.CRAWL_DATE = CRAWL_DATE
+    return instance
+
+
+def cases() -> list:
+    """
+    측정할 항목 목록을 반환한다
+    :return: [(항목 이름, 인자 없이 호출하는 함수)]
+    """
+    crawler_ = crawler()
+    profile = FixtureDriver(load_fixture('profile.html'))
+    page_info = crawler_.parse_user_info(profile)
+    captions = load_captions()
+
+    def page_available(name: str):
+        html = load_fixture(name)
+        return lambda: crawler_.page_available(html)
+
+    def parse_content(name: str):
+        driver = FixtureDriver(load_fixture(name))
+        return lambda: crawler_.parse_content(driver)
+
+    video_html = load_fixture('post_video.html')
+
+    def parse_video():
+        # 좋아요 수를 클릭으로 열어야 하므로 호출할 때마다 새로 만든다
+        driver = FixtureDriver(video_html, like_count='1,024')
+        return crawler_.parse_content(driver)
+
+    return [
+        ('parse_user_info/profile', lambda: crawler_.parse_user_info(profile)),
+        ('daily_user_info/profile', lambda: crawler_.daily_user_info(page_info)),
+        ('page_available/profile', page_available('profile.html')),
+        ('page_available/private', page_available('private.html')),
+        ('page_available/not_found', page_available('not_found.html')),
+        ('parse_content/post', parse_content('post.html')),
+        ('parse_content/post_video', parse_video),
+        ('parse_content/post_many_comments', parse_content('post_many_comments.html')),
+        ('strip_emoji/captions', lambda: [strip_emoji(caption) for caption in captions]),
+    ]
+
+
+def calibrate(func, min_seconds: float = 0.005) -> int:
+    """
+    한번의 측정이 min_seconds 이상 걸리도록 측정마다 함수를 호출할 횟수를 정한다(timeit.autorange 와 같다)
+    수 us 이내의 함수는 한번씩 측정하면 timer 오차가 실행 시간보다 커진다
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_seconds:
+            return number
+        number *= 2
+
+
+def summarize(timings: list, number: int) -> dict:
+    timings = sorted(timings)
+    return {
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'p90': timings[min(int(len(timings) * 0.9), len(timings) - 1)],
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'repeat': len(timings),
+        'number': number
+    }
+
+
+def run(warmup: int = 20, repeat: int = 30) -> dict:
+    """
+    모든 항목을 warmup 만큼 실행한 다음, repeat 번 측정한 호출 1회당 실행 시간(ms)의 통계를 반환한다
+    항목을 하나씩 측정하지 않고 한 라운드에 모든 항목을 한번씩 측정하여, 측정 중 머신 상태의 변화가 모든 항목에 고르게 섞이도록 한다
+    :param warmup: 측정하지 않고 실행하는 횟수
+    :param repeat: 측정 횟수
+    :return: {'meta': 실행 환경, 'results': {항목 이름: {'min', 'median', 'mean', 'p90', 'stdev', 'repeat', 'number'}}}
+    """
+    measured = []
+    for name, func in cases():
+        for _ in range(warmup):
+            func()
+        measured.append((name, func, calibrate(func), []))
+
+    for _ in range(repeat):
+        for name, func, number, timings in measured:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) * 1000 / number)
+
+    return {
+        'meta': {
+            'createdAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parser': utils.crawler.parser.name,
+            'warmup': warmup,
+            'repeat': repeat
+        },
+        'results': {name: summarize(timings, number) for name, _, number, timings in measured}
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float, stat: str = 'median') -> list:
+    """
+    측정 결과를 baseline 과 비교한다
+    기본값은 한두번의 빠르거나 느린 측정에 영향을 받지 않는 중간값(median)으로 비교한다
+    :param report: run() 결과
+    :param baseline: 저장된 run() 결과
+    :param threshold: baseline 보다 이 비율 이상 느려진 경우 regression 으로 판단한다(ex. 0.2 = 20%)
+    :param stat: 비교할 통계('min', 'median', 'mean', 'p90')
+    :return: regression 항목 이름 list
+    """
+    regressions = []
+    if baseline['meta'].get('parser') != report['meta']['parser']:
+        print(f'warning: baseline parser is {baseline["meta"].get("parser")}, current parser is {report["meta"]["parser"]}')
+    print(f'{"case":<36}{"baseline " + stat:>15}{"current " + stat:>15}{"change":>10}')
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:<36}{"-":>15}{result[stat]:>15.4f}{"new":>10}')
+            continue
+        change = result[stat] / base[stat] - 1 if base[stat] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<36}{base[stat]:>15.4f}{result[stat]:>15.4f}{change:>+9.1%}{flag}')
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f'parser: {report["meta"]["parser"]} warmup: {report["meta"]["warmup"]} repeat: {report["meta"]["repeat"]}')
+    print(f'{"case":<36}{"median (ms)":>13}{"p90 (ms)":>13}{"min (ms)":>13}{"stdev":>10}')
+    for name, result in report['results'].items():
+        print(f'{name:<36}{result["median"]:>13.4f}{result["p90"]:>13.4f}{result["min"]:>13.4f}{result["stdev"]:>10.4f}')
+
+
+def save(report: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(description='offline crawler benchmark over saved instagram pages')
+    args.add_argument('--repeat', type=int, default=30)
+    args.add_argument('--warmup', type=int, default=20)
+    args.add_argument('--parser', choices=('lxml', 'soup'), help='HTML parser backend (default: config.PARSER)')
+    args.add_argument('--output', default=os.path.join(RESULT_PATH, 'latest.json'))
+    args.add_argument('--baseline', default=os.path.join(RESULT_PATH, 'baseline.json'))
+    args.add_argument('--threshold', type=float, default=0.2)
+    args.add_argument('--stat', choices=('min', 'median', 'mean', 'p90'), default='median',
+                      help='statistic compared with the baseline')
+    args.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+    args = args.parse_args(argv)
+
+    # 크롤러 함수가 기록하는 단계별 실행 시간은 크롤링 결과(METRICS['PATH'])가 아닌 benchmark 결과 경로에 저장한다
+    init_stage_metrics(METRICS_PATH)
+    if args.parser:
+        utils.crawler.parser = get_parser(args.parser)
+
+    report = run(args.warmup, args.repeat)
+    print_report(report)
+    save(report, args.output)
+
+    if args.save_baseline:
+        save(report, args.baseline)
+        print(f'baseline saved: {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'baseline not found: {args.baseline} (run with --save-baseline)')
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print()
+    regressions = compare(report, baseline, args.threshold, args.stat)
+    if regressions:
+        print(f'{len(regressions)} regressions over {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
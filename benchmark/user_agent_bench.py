@@ -0,0 +1,58 @@
+"""
+User-Agent 를 가져오는 시간을 측정한다
+매번 UserAgent 를 새로 만드는 기존 방식과 UserAgentPool 의 random(), for_proxy() 를 비교하며,
+UserAgentPool 은 캐시 파일이 없는 경우와 있는 경우의 생성 시간도 측정한다
+
+usage: python -m benchmark.user_agent_bench [repeat]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from utils.user_agent import UserAgentPool, _load_user_agents
+
+LIMIT = 100
+
+
+def legacy_user_agent() -> str:
+    # 기존 random_user_agent() 와 같이 호출할 때마다 User-Agent 데이터를 읽고 필터링한다
+    from random_user_agent.user_agent import UserAgent
+    from random_user_agent.params import SoftwareName, OperatingSystem
+
+    software_names = [SoftwareName.CHROME.value]
+    operating_systems = [OperatingSystem.WINDOWS.value, OperatingSystem.MAC_OS_X.value]
+
+    user_agent_rotator = UserAgent(software_names=software_names, operating_systems=operating_systems, limit=LIMIT)
+
+    return user_agent_rotator.get_random_user_agent()
+
+
+def per_call_ms(func, repeat: int) -> float:
+    func()
+    return timeit.timeit(func, number=repeat) / repeat * 1000
+
+
+def run(repeat: int = 20) -> None:
+    cache_path = os.path.join(tempfile.mkdtemp(), 'user_agents.json')
+
+    build = per_call_ms(lambda: _load_user_agents(LIMIT), max(repeat // 10, 1))
+    UserAgentPool(LIMIT, cache_path)
+    cached = per_call_ms(lambda: UserAgentPool(LIMIT, cache_path), repeat)
+    pool = UserAgentPool(LIMIT, cache_path)
+
+    timings = [
+        ('legacy random_user_agent()', per_call_ms(legacy_user_agent, repeat)),
+        ('UserAgentPool() without cache', build),
+        ('UserAgentPool() with cache', cached),
+        ('UserAgentPool.random()', per_call_ms(pool.random, repeat * 10000)),
+        ('UserAgentPool.for_proxy()', per_call_ms(lambda: pool.for_proxy('127.0.0.1:8080'), repeat * 10000)),
+    ]
+    legacy = timings[0][1]
+    print(f'{"case":<34}{"ms/call":>14}{"speedup":>12}')
+    for name, elapsed in timings:
+        print(f'{name:<34}{elapsed:>14.5f}{legacy / elapsed:>11.0f}x')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
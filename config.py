@@ -13,6 +13,94 @@ else:
     proc_numbers = (os.cpu_count() * 2) + 1
     retry_proc_numbers = os.cpu_count()
 
+# Selenium Driver Pool configuration
+# worker 프로세스마다 브라우저를 재사용하며, MAX_USES 명의 유저를 크롤링한 다음에는 브라우저를 새로 띄운다
+DRIVER_POOL = {
+    'MAX_USES': 50
+}
+
+# Browsing configuration
+# 'lean': 텍스트, 작성시간, 좋아요 수만 읽으므로 이미지, 동영상, 폰트, 트래커를 받지 않는다(proxy 전송량 절약)
+# 'normal': 모든 리소스를 받는다
+# lean 모드는 benchmark.lean_bench 로 전송량과 selector(프로필, 포스트, 동영상 좋아요 수, readiness)를 확인한 다음에 사용한다
+# (ex. BROWSING_MODE=lean python main.py)
+BROWSING = {
+    'MODE': os.environ.get('BROWSING_MODE', 'normal'),
+    # Chrome prefs, 2 = 차단
+    'PREFS': {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.managed_default_content_settings.media_stream': 2,
+        'profile.managed_default_content_settings.plugins': 2,
+        'profile.managed_default_content_settings.notifications': 2,
+        'profile.managed_default_content_settings.geolocation': 2
+    },
+    'ARGUMENTS': [
+        '--blink-settings=imagesEnabled=false',
+        '--autoplay-policy=user-gesture-required',
+        '--mute-audio'
+    ],
+    # DevTools(Network.setBlockedURLs)로 요청하지 않는 주소, '*' 는 wildcard 이다
+    'BLOCKED_URLS': [
+        # 동영상
+        '*.mp4*', '*.m4s*', '*.m4v*', '*.webm*', '*.m3u8*', '*.mpd*',
+        # 이미지
+        '*.jpg*', '*.jpeg*', '*.png*', '*.gif*', '*.webp*', '*.heic*', '*.ico*',
+        # 폰트
+        '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+        # 트래커
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*connect.facebook.net*',
+        '*facebook.com/tr*', '*/logging_client_events*', '*/falco*'
+    ],
+    # 포스트 본문(div.C4VMK)과 작성시간(time._1o9PC)을 그리는 script, BLOCKED_URLS 가 이 주소를 포함하는 경우에는 차단하지 않는다
+    'ALLOWED_URLS': [
+        'https://www.instagram.com/static/bundles/*.js',
+        'https://static.cdninstagram.com/rsrc.php/*.js',
+        'https://www.instagram.com/graphql/query/*',
+        'https://www.instagram.com/p/*'
+    ]
+}
+
+# Page readiness configuration
+# 'observer': MutationObserver 로 selector 가 나타나는 즉시 다음 단계로 넘어간다, 'polling': POLL_INTERVAL 초마다 확인한다
+# selector 대신 MARKERS 의 element 가 나타나거나 로그인 페이지로 이동된 경우에는 timeout 까지 기다리지 않는다
+# SCRIPT_TIMEOUT 은 브라우저의 async script 최대 실행 시간이며, 가장 긴 대기 시간(30초)보다 길어야 한다
+READINESS = {
+    'MODE': os.environ.get('READINESS_MODE', 'observer'),
+    'POLL_INTERVAL': 0.5,
+    'SCRIPT_TIMEOUT': 60,
+    # 다음 포스트로 바뀌었는지 확인하기 위한 포스트 작성시간 element
+    'TIME_SELECTOR': 'time._1o9PC.Nzb55',
+    'LOGIN_PATH': '/accounts/login',
+    'MARKERS': {
+        'not_found': 'div.error-container',
+        'private': 'div.VIsJD',
+        'no_posts': 'div.FuWoR.-wdIA.A2kdl',
+        'login_form': 'form#loginForm'
+    }
+}
+
+
+# HTML Parser configuration
+# 'lxml': 미리 컴파일한 XPath 로 파싱한다, 'soup': BeautifulSoup 으로 파싱한다
+PARSER = 'lxml'
+
+# Fetch mode configuration
+# 'selenium': 브라우저로 크롤링한다, 'http': 페이지의 JSON 으로 크롤링하며 실패하는 경우에만 브라우저를 사용한다
+FETCH_MODE = os.environ.get('FETCH_MODE', 'selenium')
+HTTP_CRAWL = {
+    'POST_URL': 'https://www.instagram.com/p/{shortcode}/',
+    'TIMEOUT': 10,
+    'POOL_SIZE': 4
+}
+
+# asyncio crawl configuration
+# CONCURRENCY: 한 프로세스에서 동시에 크롤링하는 유저 수, PER_PROXY: proxy 하나로 동시에 보내는 요청 수
+ASYNC_CRAWL = {
+    'CONCURRENCY': 32,
+    'PER_PROXY': 2,
+    'WRITERS': 4,
+    'REPORT_INTERVAL': 60
+}
 
 # 수집 원천을 표시하기 위한 필드
 SOURCE = 'instagram'
@@ -24,18 +112,97 @@ if DEV:
         'HOST': '',
         'PASSWORD': '',
         'PORT': 6379,
-        'DB': 1,
-        'ERROR_TABLE': 'error_table'
+        'DB': 1
     }
 else:
     REDIS = {
         'HOST': '',
         'PASSWORD': '',
         'PORT': 6379,
-        'DB': 1,
-        'ERROR_TABLE': 'error_table'
+        'DB': 1
     }
 
+# Redis retry queue configuration
+# 실패한 유저는 다음 시도 시간을 score 로 하는 sorted set 에 한 번만 저장되며,
+# 실패할 때마다 BASE_DELAY * 2^(실패횟수-1) 초(최대 MAX_DELAY, jitter 포함) 뒤에 retry 한다
+# MAX_ATTEMPTS 번 실패한 유저는 retry 하지 않고 DEAD_LETTER 에 저장한다
+# LEGACY_ERRORS 는 이전 버전의 에러 list 이며, retry.py 를 시작할 때 retry queue 로 옮긴다
+RETRY_QUEUE = {
+    'QUEUE': 'retry_queue',
+    'ERRORS': 'retry_errors',
+    'DEAD_LETTER': 'retry_dead_letter',
+    'LEGACY_ERRORS': 'error_table',
+    'BASE_DELAY': 60,
+    'MAX_DELAY': 60 * 60 * 6,
+    'MAX_ATTEMPTS': 5,
+    'BATCH_SIZE': 100
+}
+
+# Redis job queue configuration
+# 여러 노드가 같은 RUN_ID 로 실행하면 하나의 유저 목록을 나누어 크롤링한다(ex. JOB_QUEUE=1 RUN_ID=2020-03-08 python main.py)
+JOB_QUEUE = {
+    'ENABLED': os.environ.get('JOB_QUEUE') == '1',
+    'PREFIX': 'job_queue',
+    'RUN_ID': os.environ.get('RUN_ID', CRAWL_DATE.strftime('%Y-%m-%d')),
+    'VISIBILITY_TIMEOUT': 1800,
+    'POLL_INTERVAL': 5,
+    # 유저 목록을 넣는 노드가 SEED_TTL 초 동안 진행이 없으면(ex. 비정상 종료) 기다리던 노드가 대신 넣는다
+    'SEED_TTL': 300,
+    # 작업(run)의 key 들은 마지막 사용 후 KEY_TTL 초가 지나면 삭제된다
+    'KEY_TTL': 60 * 60 * 24 * 3
+}
+
+# Proxy pool configuration
+# proxy 목록은 Redis 에 LIST_TTL 초, 프로세스 안에서는 LOCAL_TTL 초 동안 재사용한다
+# MAX_FAILURES 번 연속 실패하거나 차단된 proxy 는 COOLDOWN 초 동안 사용하지 않으며,
+# 평균 페이지 로딩 시간이 LATENCY_REF 초인 proxy 는 선택 가중치가 절반이 된다
+# proxy 별 기록은 실행(METRICS['RUN_ID'])마다 따로 저장하며, 마지막 기록 후 STATS_TTL 초가 지나면 삭제된다
+PROXY_POOL = {
+    'PREFIX': 'proxy',
+    'LIST_TTL': 600,
+    'LOCAL_TTL': 60,
+    'COOLDOWN': 600,
+    'MAX_FAILURES': 3,
+    'LATENCY_REF': 5,
+    'STATS_TTL': 60 * 60 * 24
+}
+
+# Rate limit configuration
+# 모든 worker 프로세스가 Redis 로 공유하는 token bucket 이며, 페이지를 열 때마다 proxy 와 host bucket 에서 token 을 하나씩 사용한다
+# RATE 는 초당 요청 수, BURST 는 한번에 몰아서 보낼 수 있는 요청 수이며, 기다린 다음에 JITTER 범위의 딜레이를 더한다
+# 차단(로그인 페이지, HTTP 429)이나 timeout 이 발생하면 rate 를 BACKOFF_FACTOR 배씩(최대 MAX_BACKOFF) 줄이고, BACKOFF_TTL 초 뒤에 되돌린다
+RATE_LIMIT = {
+    'PREFIX': 'rate_limit',
+    'PROXY_RATE': 1.0,
+    'PROXY_BURST': 3,
+    'HOST_RATE': 20.0,
+    'HOST_BURST': 40,
+    'JITTER': (0.1, 0.5),
+    'BACKOFF_FACTOR': 2,
+    'MAX_BACKOFF': 16,
+    'BACKOFF_TTL': 300
+}
+
+# User-Agent configuration
+# 필터링한 User-Agent 목록을 CACHE_PATH 에 저장하여 CACHE_TTL 초 동안 재사용한다
+USER_AGENT = {
+    'LIMIT': 100,
+    'CACHE_PATH': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'user_agents.json'),
+    'CACHE_TTL': 60 * 60 * 24 * 7
+}
+
+# Checkpoint configuration
+# 크롤링 작업(run)별 완료 유저와 유저별 포스트 cursor 를 저장하여, 다시 실행하는 경우 이어서 크롤링한다
+# STORE 는 'redis' 또는 'file' 이며, 'file' 인 경우 PATH 아래에 저장한다(ex. CHECKPOINT_STORE=file python main.py)
+CHECKPOINT = {
+    'STORE': os.environ.get('CHECKPOINT_STORE', 'redis'),
+    'PREFIX': 'checkpoint',
+    'PATH': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints'),
+    'RUN_ID': JOB_QUEUE['RUN_ID'],
+    'RUN_TTL': 60 * 60 * 24 * 3,
+    'CURSOR_TTL': 60 * 60 * 24
+}
+
 # MongoDB Configuration
 if DEV:
     MONGODB = {
@@ -60,6 +227,56 @@ else:
         'COLLECTION': ''
     }
 
+# MongoDB bulk write configuration
+# BATCH_SIZE 개의 요청이 모이거나, MAX_WAIT 초가 지난 경우에 한번에 저장한다
+MONGODB_WRITE = {
+    'BATCH_SIZE': 50,
+    'MAX_WAIT': 5
+}
+
+# Daily user snapshot configuration
+# 'document': 일짜별 유저 정보를 날짜마다 document 하나({date}_{username})로 저장한다
+# 'bucket': 유저별 월 단위 bucket({username}_{YYYY-MM}) 에 날짜마다 (시간, 포스트 수, 팔로워 수, 팔로잉 수)를 저장하며(같은 날은 덮어쓴다),
+# 유저 설명과 인증배지는 바뀐 경우에만 저장한다(ex. DAILY_STORAGE=bucket python main.py)
+# 저장된 document 는 python migrate_snapshots.py 로 bucket 으로 옮긴다
+DAILY_SNAPSHOT = {
+    'STORAGE': os.environ.get('DAILY_STORAGE', 'document'),
+    'COLLECTION': 'daily_user_bucket'
+}
+
+# Known post configuration
+# overwrite 가 False 인 경우, 유저마다 미리 가져오는 저장된 포스트 '_id' 의 최대 개수
+KNOWN_POSTS = {
+    'MAX_IDS': 1000
+}
+
+# Incremental crawl configuration
+# 유저별 크롤링 상태를 저장하는 collection 이며, 기본 크롤링(main.py, async_main.py)은 크롤링 상태로 포스트 수가 같은 유저와
+# 이전 크롤링보다 오래된 포스트를 건너뛰는 incremental 크롤링이다
+# OVERWRITE 인 경우에는 크롤링 상태를 프로필 확인에만 사용하고, 30일 이내의 포스트(좋아요 수, 댓글)를 모두 다시 저장한다
+# (ex. 좋아요 수와 댓글을 다시 가져오는 경우: OVERWRITE=1 python main.py)
+# retry.py 는 실패 전에 저장한 최신 포스트에서 크롤링이 멈추지 않도록 기본값이 overwrite 이다(RETRY_OVERWRITE=0 인 경우 incremental)
+# FULL_REFRESH 인 경우에는 크롤링 상태를 사용하지 않는다
+CRAWL_STATE = {
+    'COLLECTION': 'crawl_state',
+    'FULL_REFRESH': os.environ.get('FULL_REFRESH') == '1',
+    'OVERWRITE': os.environ.get('OVERWRITE') == '1',
+    'RETRY_OVERWRITE': os.environ.get('RETRY_OVERWRITE', '1') == '1'
+}
+
+# Recrawl scheduler configuration
+# 최근 HISTORY_DAYS 일의 포스팅 빈도로 유저별 크롤링 간격(MIN ~ MAX_INTERVAL_DAYS)을 정하고,
+# 크롤링 시점이 된 유저만 우선순위 순서로 한번에 BUDGET 명까지 크롤링한다(ex. SCHEDULER=1 python main.py)
+# MAX_INTERVAL_DAYS 는 포스트를 놓치지 않도록 MAX_CRAWL_DATE(30일) 보다 짧아야 한다
+SCHEDULER = {
+    'ENABLED': os.environ.get('SCHEDULER') == '1',
+    'COLLECTION': 'crawl_schedule',
+    'BUDGET': 20000,
+    'HISTORY_DAYS': 30,
+    'MIN_INTERVAL_DAYS': 1,
+    'MAX_INTERVAL_DAYS': 14
+}
+
 # Logging Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_CFG = os.path.join(BASE_DIR, 'logging.json')
@@ -69,7 +286,38 @@ LOG_FILENAME = f'{LOG_PATH}/{PROJECT}.log'
 if not os.path.exists(LOG_PATH):
     os.mkdir(LOG_PATH)
 
+# worker 프로세스의 로그는 queue 로 main 프로세스에 보내서 한 곳에서 파일에 저장한다
+# 로그 메시지가 dict(ex. 포스트 정보)인 경우 PAYLOAD_SAMPLE_RATE 비율만 전체를 남기고, 나머지는 요약하여 남긴다
+LOG = {
+    'QUEUE': os.environ.get('LOG_QUEUE', '1') == '1',
+    'PAYLOAD_SAMPLE_RATE': 0.01,
+    'MAX_VALUE_LENGTH': 100
+}
+
+
+# Metrics configuration
+# 단계별 실행 시간을 PATH/{RUN_ID} 에 저장하며, 크롤링이 끝나면 summary.json 과 metrics.prom 으로 내보낸다
+# RUN_ID 는 실행(main 프로세스와 fork 된 worker 프로세스)마다 다르며, 같은 날 실행한 다른 크롤링의 기록과 합쳐지지 않는다
+METRICS = {
+    'PATH': os.path.join(BASE_DIR, 'metrics'),
+    'RUN_ID': os.environ.get('METRICS_RUN_ID', f'{CRAWL_DATE.strftime("%Y-%m-%d-%H%M%S")}-{os.getpid()}'),
+    'PREFIX': 'instagram_crawler',
+    'QUANTILES': (0.5, 0.9, 0.99),
+    'MAX_SAMPLES': 10000
+}
+
 
 # Telegram Configuration
 TELEGRAM_TOKEN = ''
 TELEGRAM_CHAT_ID = ''
+
+# Alert Configuration
+# send_error 메시지는 WINDOW 초 동안 모아서 같은 에러끼리 묶어 발송하며, 한번에 최대 MAX_MESSAGES 개까지 발송한다
+# QUEUE_SIZE 를 넘는 메시지는 크롤링을 멈추지 않도록 버린다, SINK 가 'stub' 인 경우 발송하지 않고 메모리에 저장한다
+ALERT = {
+    'SINK': os.environ.get('ALERT_SINK', 'telegram'),
+    'WINDOW': 60,
+    'QUEUE_SIZE': 1000,
+    'MAX_MESSAGES': 10,
+    'MAX_USERS': 10
+}
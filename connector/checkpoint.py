@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import config
+from connector.connector import RedisConnector
+
+
+class RedisCheckpointStore:
+    """
+    크롤링 작업(run)별 완료 유저 목록과 유저별 포스트 cursor 를 Redis 에 저장한다
+    여러 노드가 같은 run 을 나누어 크롤링하는 경우에도 완료 유저 목록을 공유한다
+
+    keys: {PREFIX}:{run_id}:done(set), :stats(hash), :cursor:{username}(string)
+    """
+    name = 'redis'
+    checkpoint_config = config.CHECKPOINT
+
+    def __init__(self, run_id: str = None, client=None):
+        self.client = client or RedisConnector().conn()
+        self.run_id = run_id or self.checkpoint_config['RUN_ID']
+        prefix = self.checkpoint_config['PREFIX']
+        self.done_key = f'{prefix}:{self.run_id}:done'
+        self.stats_key = f'{prefix}:{self.run_id}:stats'
+        # cursor 도 run 별로 저장하여, 이전 run 에서 중단된 cursor 로 이번 run 의 포스트를 건너뛰지 않도록 한다
+        self.cursor_prefix = f'{prefix}:{self.run_id}:cursor'
+
+    def is_done(self, username: str) -> bool:
+        return bool(self.client.sismember(self.done_key, username))
+
+    def mark_done(self, username: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.sadd(self.done_key, username)
+        pipe.expire(self.done_key, self.checkpoint_config['RUN_TTL'])
+        pipe.delete(f'{self.cursor_prefix}:{username}')
+        pipe.execute()
+
+    def cursor(self, username: str) -> dict or None:
+        """
+        유저의 이전 크롤링에서 저장한 포스트 범위를 반환한다
+        :param username: 인스타그램 유저이름이다
+        :return: {'newest': 가장 최신 포스트 작성시간, 'oldest': 마지막으로 저장한 포스트 작성시간}, 없는 경우 None
+        """
+        cursor = self.client.get(f'{self.cursor_prefix}:{username}')
+        return json.loads(cursor) if cursor else None
+
+    def save_cursor(self, username: str, newest: int, oldest: int) -> None:
+        """
+        저장이 끝난 포스트 범위를 저장한다, 유저 크롤링이 끝나면(mark_done) 삭제된다
+        :param username: 인스타그램 유저이름이다
+        :param newest: 저장한 포스트 중 가장 최신 포스트의 작성시간(timestamp)
+        :param oldest: 저장한 포스트 중 가장 오래된 포스트의 작성시간(timestamp)
+        :return: None
+        """
+        self.client.set(f'{self.cursor_prefix}:{username}', json.dumps({'newest': newest, 'oldest': oldest}),
+                        ex=self.checkpoint_config['CURSOR_TTL'])
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.stats_key, name, amount)
+        pipe.expire(self.stats_key, self.checkpoint_config['RUN_TTL'])
+        pipe.execute()
+
+    def summary(self) -> dict:
+        pipe = self.client.pipeline()
+        pipe.scard(self.done_key)
+        pipe.hgetall(self.stats_key)
+        done, stats = pipe.execute()
+        return dict({name: int(value) for name, value in stats.items()}, done=done)
+
+
+class FileCheckpointStore:
+    """
+    크롤링 작업(run)별 완료 유저 목록과 유저별 포스트 cursor 를 로컬 파일에 저장한다
+    Redis 없이 한 서버에서 실행하는 경우에 사용하며, worker 프로세스끼리는 append 와 rename 으로만 파일을 공유한다
+
+    files: {PATH}/{run_id}/done.txt, stats.txt, cursor/{username}.json
+    """
+    name = 'file'
+    checkpoint_config = config.CHECKPOINT
+
+    def __init__(self, run_id: str = None, path: str = None):
+        self.run_id = run_id or self.checkpoint_config['RUN_ID']
+        path = path or self.checkpoint_config['PATH']
+        self.run_path = os.path.join(path, self.run_id)
+        self.cursor_path = os.path.join(self.run_path, 'cursor')
+        os.makedirs(self.run_path, exist_ok=True)
+        os.makedirs(self.cursor_path, exist_ok=True)
+        self.done_file = os.path.join(self.run_path, 'done.txt')
+        self.stats_file = os.path.join(self.run_path, 'stats.txt')
+        self._done = None
+
+    def _append(self, filename: str, line: str) -> None:
+        # 한 줄씩 O_APPEND 로 쓰므로 여러 프로세스가 동시에 추가해도 줄이 섞이지 않는다
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(f'{line}\n')
+
+    def _lines(self, filename: str) -> list:
+        if not os.path.exists(filename):
+            return []
+        with open(filename, encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+
+    def is_done(self, username: str) -> bool:
+        # 완료 유저 목록은 처음 확인할 때 한번만 읽는다
+        if self._done is None:
+            self._done = set(self._lines(self.done_file))
+        return username in self._done
+
+    def mark_done(self, username: str) -> None:
+        self._append(self.done_file, username)
+        if self._done is not None:
+            self._done.add(username)
+        try:
+            os.remove(self._cursor_file(username))
+        except FileNotFoundError:
+            pass
+
+    def _cursor_file(self, username: str) -> str:
+        return os.path.join(self.cursor_path, f'{username}.json')
+
+    def cursor(self, username: str) -> dict or None:
+        filename = self._cursor_file(username)
+        try:
+            if time.time() - os.path.getmtime(filename) > self.checkpoint_config['CURSOR_TTL']:
+                return None
+            with open(filename, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_cursor(self, username: str, newest: int, oldest: int) -> None:
+        # 임시 파일에 쓴 다음 rename 하여, 저장 도중에 종료되어도 이전 cursor 가 남도록 한다
+        filename = self._cursor_file(username)
+        with open(f'{filename}.{os.getpid()}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'newest': newest, 'oldest': oldest}, f)
+        os.replace(f'{filename}.{os.getpid()}.tmp', filename)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self._append(self.stats_file, f'{name} {amount}')
+
+    def summary(self) -> dict:
+        stats = {}
+        for line in self._lines(self.stats_file):
+            name, amount = line.rsplit(' ', 1)
+            stats[name] = stats.get(name, 0) + int(amount)
+        return dict(stats, done=len(set(self._lines(self.done_file))))
+
+
+CHECKPOINT_STORES = {
+    RedisCheckpointStore.name: RedisCheckpointStore,
+    FileCheckpointStore.name: FileCheckpointStore
+}
+
+
+def get_checkpoint_store(name: str = None, run_id: str = None):
+    """
+    설정된 이름의 checkpoint store 를 생성하여 반환한다
+    알 수 없는 이름인 경우에는 Redis store 를 사용한다
+    :param name: 'redis' or 'file'
+    :param run_id: 크롤링 작업 id, 기본값은 CHECKPOINT['RUN_ID']
+    :return: checkpoint store
+    """
+    name = name or config.CHECKPOINT['STORE']
+    return CHECKPOINT_STORES.get(name, RedisCheckpointStore)(run_id)
@@ -1,24 +1,112 @@
+import hashlib
+import heapq
 import json
+import logging
+import time
+import uuid
 from datetime import datetime
 from operator import itemgetter
+from random import uniform
 
-from pymongo import MongoClient
+from bson import BSON
+from pymongo import DESCENDING, MongoClient, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from redis import Redis
 
 import config
+from connector.snapshot import get_snapshot_store
+from utils.hash import comment_hash
+from utils.metrics import stage_metrics
 
 
 class RedisConnector:
+    """
+    실패한 유저를 retry 하기 위한 Redis 연결
+
+    keys: RETRY_QUEUE['QUEUE'](zset, score=다음 시도 시간), ['ERRORS'](hash, 유저별 마지막 에러와 실패 횟수),
+          ['DEAD_LETTER'](zset, score=retry 를 포기한 시간), ['LEGACY_ERRORS'](list, 이전 버전의 에러 기록)
+    """
     connectionString = config.REDIS
+    retry_config = config.RETRY_QUEUE
+
+    # 유저의 실패 횟수를 늘리고 다음 시도 시간을 정한다
+    # 이미 retry 를 기다리고 있는 유저는 에러 내용만 갱신하며, MAX_ATTEMPTS 번 실패한 유저는 dead letter 로 옮긴다
+    SAVE_ERROR_SCRIPT = """
+    local username = ARGV[1]
+    local now = tonumber(ARGV[2])
+    local record = {username = username, date = ARGV[3], error = ARGV[4], attempts = 1}
+    local previous = redis.call('hget', KEYS[2], username)
+    if previous then
+        record['attempts'] = cjson.decode(previous)['attempts']
+    end
+    if redis.call('zscore', KEYS[1], username) then
+        redis.call('hset', KEYS[2], username, cjson.encode(record))
+        return 0
+    end
+    if previous then
+        record['attempts'] = record['attempts'] + 1
+    end
+    redis.call('hset', KEYS[2], username, cjson.encode(record))
+
+    if record['attempts'] >= tonumber(ARGV[7]) then
+        redis.call('zadd', KEYS[3], now, username)
+        return -1
+    end
+    local delay = math.min(tonumber(ARGV[5]) * 2 ^ (record['attempts'] - 1), tonumber(ARGV[6]))
+    redis.call('zadd', KEYS[1], now + delay * tonumber(ARGV[8]), username)
+    return record['attempts']
+    """
+    # 다음 시도 시간이 된 유저를 최대 ARGV[2] 명까지 꺼낸다
+    CLAIM_SCRIPT = """
+    local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    if #due > 0 then
+        redis.call('zrem', KEYS[1], unpack(due))
+    end
+    return due
+    """
+    # 크롤링에 성공하여 다시 retry 를 기다리지 않는 유저의 실패 기록을 지운다
+    # dead letter 로 옮긴 유저는 확인할 수 있도록 기록을 남긴다
+    RESOLVE_SCRIPT = """
+    if redis.call('zscore', KEYS[1], ARGV[1]) or redis.call('zscore', KEYS[3], ARGV[1]) then
+        return 0
+    end
+    return redis.call('hdel', KEYS[2], ARGV[1])
+    """
+    # 이전 버전의 에러 list 에서 최대 ARGV[2] 개를 꺼내, retry 를 기다리지 않는 유저를 바로 retry 하도록 추가한다
+    # 이미 retry queue 나 dead letter 에 있는 유저는 그대로 두며, 꺼낸 기록 수를 반환한다
+    MIGRATE_LEGACY_SCRIPT = """
+    local popped = 0
+    for _ = 1, tonumber(ARGV[2]) do
+        local legacy = redis.call('rpop', KEYS[4])
+        if not legacy then
+            break
+        end
+        popped = popped + 1
+        local ok, record = pcall(cjson.decode, legacy)
+        if ok and type(record) == 'table' and type(record['username']) == 'string' then
+            local username = record['username']
+            if not redis.call('zscore', KEYS[1], username) and not redis.call('zscore', KEYS[3], username) then
+                redis.call('hsetnx', KEYS[2], username, cjson.encode({
+                    username = username, date = record['date'] or '', error = record['error'] or '', attempts = 1
+                }))
+                redis.call('zadd', KEYS[1], ARGV[1], username)
+            end
+        end
+    end
+    return popped
+    """
 
     def __init__(self, encoding='utf-8', db=None):
         self.client = self._default(db)
         self.encoding = encoding
-        self.error_table = self._error_table()
-
-    @classmethod
-    def _error_table(cls):
-        return cls.connectionString['ERROR_TABLE']
+        self.retry_queue = self.retry_config['QUEUE']
+        self.retry_errors = self.retry_config['ERRORS']
+        self.dead_letter = self.retry_config['DEAD_LETTER']
+        self.legacy_errors = self.retry_config['LEGACY_ERRORS']
+        self._save_error = self.client.register_script(self.SAVE_ERROR_SCRIPT)
+        self._claim = self.client.register_script(self.CLAIM_SCRIPT)
+        self._resolve = self.client.register_script(self.RESOLVE_SCRIPT)
+        self._migrate_legacy = self.client.register_script(self.MIGRATE_LEGACY_SCRIPT)
 
     @classmethod
     def _default(cls, db):
@@ -36,28 +124,295 @@ class RedisConnector:
     def conn(self):
         return self.client
 
-    def saved_error(self, username: str, error: str = None) -> None:
+    def _keys(self) -> list:
+        return [self.retry_queue, self.retry_errors, self.dead_letter]
+
+    def saved_error(self, username: str, error: str = None) -> int:
         """
         인스타그램 유저 크롤링 시에 에러가 발생하는 경우, 유저 이름과 에러 내용을 Redis에 저장한다
+        실패 횟수에 따라 지수적으로 늘어나는 시간(jitter 포함)이 지난 다음에 retry 하도록 retry queue 에 추가한다
         :param username: instagram username
         :param error: error message
-        :return: None
+        :return: 실패 횟수, 이미 retry 를 기다리는 경우 0, dead letter 로 옮긴 경우 -1
+        """
+        return self._save_error(keys=self._keys(), args=[
+            username,
+            time.time(),
+            datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+            error or '',
+            self.retry_config['BASE_DELAY'],
+            self.retry_config['MAX_DELAY'],
+            self.retry_config['MAX_ATTEMPTS'],
+            uniform(0.5, 1)
+        ])
+
+    def claim_due(self, count: int = None, until: float = None) -> list:
+        """
+        다음 시도 시간이 된 유저를 시도 시간 순서로 한번에 꺼낸다
+        꺼낸 유저는 retry queue 에서 제거되며, 다시 실패하는 경우 saved_error 로 다시 추가된다
+        :param count: 한번에 꺼내는 최대 유저 수
+        :param until: 이 시간(timestamp)까지 시도 시간이 된 유저만 꺼낸다, 기본값은 현재 시간
+        :return: username list
+        """
+        return self._claim(keys=[self.retry_queue], args=[
+            until or time.time(),
+            count or self.retry_config['BATCH_SIZE']
+        ])
+
+    def error_usernames(self, count: int = None, until: float = None):
+        """
+        다음 시도 시간이 된 유저를 count 명씩 묶어서 반환한다
+        :param count: 한번에 꺼내는 최대 유저 수
+        :param until: 이 시간(timestamp)까지 시도 시간이 된 유저만 꺼낸다, 기본값은 처음 호출한 시간
+        :return: username list generator
+        """
+        until = until or time.time()
+        while True:
+            usernames = self.claim_due(count, until)
+            if not usernames:
+                return
+            yield usernames
+
+    def resolve_error(self, username: str) -> bool:
+        """
+        크롤링에 성공한 유저의 실패 횟수를 지운다
+        크롤링 중에 다시 실패하여 retry 를 기다리거나 dead letter 로 옮긴 경우에는 지우지 않는다
+        :param username: instagram username
+        :return: 지운 기록이 있는 경우 True
         """
-        error_data = {
-            'username': username,
-            'date': datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
-            'error': error
+        return bool(self._resolve(keys=self._keys(), args=[username]))
+
+    def migrate_legacy_errors(self, count: int = None) -> int:
+        """
+        이전 버전의 에러 list(LEGACY_ERRORS)에 남은 유저를 retry queue 로 옮긴다
+        옮긴 유저는 바로 retry 하며, 같은 유저의 기록이 여러 개인 경우에도 한 번만 추가된다
+        :param count: 한번의 script 로 꺼내는 최대 기록 수
+        :return: 에러 list 에서 꺼낸 기록 수
+        """
+        count = count or self.retry_config['BATCH_SIZE']
+        migrated = 0
+        while True:
+            popped = self._migrate_legacy(keys=self._keys() + [self.legacy_errors], args=[time.time(), count])
+            migrated += popped
+            if popped < count:
+                return migrated
+
+    def dead_letters(self) -> list:
+        """
+        MAX_ATTEMPTS 번 실패하여 retry 하지 않는 유저의 마지막 에러 정보를 반환한다
+        :return: [{'username', 'date', 'error', 'attempts'}, ...]
+        """
+        usernames = self.client.zrange(self.dead_letter, 0, -1)
+        if not usernames:
+            return []
+        return [json.loads(error) for error in self.client.hmget(self.retry_errors, usernames) if error]
+
+    def retry_stats(self) -> dict:
+        """
+        retry 를 기다리는 유저 수, 시도 시간이 된 유저 수, dead letter 유저 수를 반환한다
+        :return: dict
+        """
+        pipe = self.client.pipeline()
+        pipe.zcard(self.retry_queue)
+        pipe.zcount(self.retry_queue, '-inf', time.time())
+        pipe.zcard(self.dead_letter)
+        queued, due, dead = pipe.execute()
+        return {
+            'queued': queued,
+            'due': due,
+            'dead': dead
         }
-        self.client.lpush(self.error_table, json.dumps(error_data))
 
-    def error_usernames(self) -> dict:
+
+class RedisJobQueue:
+    """
+    여러 크롤러 노드가 하나의 크롤링 작업(run)을 나누어 처리하기 위한 Redis 작업 queue
+    작업을 가져갈 때(lease) visibility timeout 동안 다른 노드가 가져가지 않도록 하며,
+    완료(ack)되지 않고 timeout 이 지난 작업은 다시 queue 에 넣는다
+    모든 key 는 마지막 사용 후 KEY_TTL 이 지나면 삭제된다
+
+    keys: {PREFIX}:{run_id}:pending(list), :inflight(zset, score=만료시간), :stats(hash),
+          :seeded(string, 넣는 중인 노드의 token(SEED_TTL) 또는 'done')
+    """
+    queue_config = config.JOB_QUEUE
+
+    # pending 에서 하나를 꺼내 inflight 에 만료시간과 함께 추가한다
+    LEASE_SCRIPT = """
+    local username = redis.call('rpop', KEYS[1])
+    if username then
+        redis.call('zadd', KEYS[2], ARGV[1], username)
+        redis.call('expire', KEYS[2], ARGV[2])
+    end
+    return username
+    """
+    # 만료시간이 지난 inflight 작업을 pending 으로 되돌린다
+    REQUEUE_SCRIPT = """
+    local expired = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])
+    for _, username in ipairs(expired) do
+        redis.call('zrem', KEYS[2], username)
+        redis.call('rpush', KEYS[1], username)
+    end
+    if #expired > 0 then
+        redis.call('hincrby', KEYS[3], 'requeued', #expired)
+        redis.call('expire', KEYS[1], ARGV[2])
+    end
+    return #expired
+    """
+    # 유저 목록을 넣는 노드가 아직 자신인 경우에만 seeded key 의 만료시간을 늘린다
+    REFRESH_SEED_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('expire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    def __init__(self, run_id: str = None, client=None):
+        self.client = client or RedisConnector().conn()
+        self.run_id = run_id or self.queue_config['RUN_ID']
+        self.visibility_timeout = self.queue_config['VISIBILITY_TIMEOUT']
+        self.key_ttl = self.queue_config['KEY_TTL']
+        prefix = f'{self.queue_config["PREFIX"]}:{self.run_id}'
+        self.pending_key = f'{prefix}:pending'
+        self.inflight_key = f'{prefix}:inflight'
+        self.stats_key = f'{prefix}:stats'
+        self.seeded_key = f'{prefix}:seeded'
+        self._lease = self.client.register_script(self.LEASE_SCRIPT)
+        self._requeue = self.client.register_script(self.REQUEUE_SCRIPT)
+        self._refresh_seed = self.client.register_script(self.REFRESH_SEED_SCRIPT)
+
+    def enqueue(self, usernames, batch_size: int = 1000) -> int:
+        """
+        유저이름을 순서대로 queue 에 넣는다, 먼저 넣은 유저부터 lease 된다
+        :param usernames: 인스타그램 유저이름 iterable
+        :param batch_size: 한번의 pipeline 으로 넣는 유저 수
+        :return: queue 에 넣은 유저 수
+        """
+        count = 0
+        batch = []
+        for username in usernames:
+            batch.append(username)
+            if len(batch) >= batch_size:
+                count += self._push(batch)
+                batch = []
+        count += self._push(batch)
+        return count
+
+    def _push(self, batch: list) -> int:
+        if not batch:
+            return 0
+        pipe = self.client.pipeline()
+        # lease 는 오른쪽에서 꺼내므로, 왼쪽으로 넣어야 순서가 유지된다
+        pipe.lpush(self.pending_key, *batch)
+        pipe.hincrby(self.stats_key, 'enqueued', len(batch))
+        pipe.hsetnx(self.stats_key, 'startedAt', time.time())
+        pipe.expire(self.pending_key, self.key_ttl)
+        pipe.expire(self.stats_key, self.key_ttl)
+        pipe.execute()
+        return len(batch)
+
+    def enqueue_once(self, usernames) -> bool:
         """
-        인스타그램 크롤링에 실패한 유저 정보를 한개씩 반환한다
-        :return:
+        여러 노드 중에 처음 실행된 노드만 유저 목록을 queue 에 넣는다
+        다른 노드는 유저 목록을 모두 넣을 때까지 기다리며, 넣던 노드가 SEED_TTL 동안 진행이 없는 경우(ex. 비정상 종료)
+        기다리던 노드 중 하나가 처음부터 다시 넣는다
+        :param usernames: 인스타그램 유저이름 iterable 또는 iterable 을 반환하는 함수(다시 넣는 경우를 위해 함수를 권장한다)
+        :return: 이 노드가 유저 목록을 넣은 경우 True
         """
-        error_user_counts = self.client.llen(self.error_table)
-        for _ in range(error_user_counts):
-            yield self.client.rpop(self.error_table)
+        while True:
+            token = f'seeding:{uuid.uuid4().hex}'
+            if self.client.set(self.seeded_key, token, nx=True, ex=self.queue_config['SEED_TTL']) and \
+                    self._seed(usernames() if callable(usernames) else usernames, token):
+                return True
+            if self.client.get(self.seeded_key) == 'done':
+                return False
+            time.sleep(self.queue_config['POLL_INTERVAL'])
+
+    def _seed(self, usernames, token: str, batch_size: int = 1000) -> bool:
+        # 중단된 노드가 넣던 유저 목록은 지우고 처음부터 다시 넣는다, 이미 크롤링한 유저는 checkpoint 로 건너뛴다
+        pipe = self.client.pipeline()
+        pipe.delete(self.pending_key)
+        pipe.hdel(self.stats_key, 'enqueued')
+        pipe.execute()
+
+        batch = []
+        for username in usernames:
+            batch.append(username)
+            if len(batch) >= batch_size:
+                self._push(batch)
+                batch = []
+                # 넣는 동안 seeded key 의 만료시간을 늘리며, 다른 노드가 대신 넣기 시작한 경우에는 중단한다
+                if not self._refresh_seed(keys=[self.seeded_key], args=[token, self.queue_config['SEED_TTL']]):
+                    logging.warning(f'job queue {self.run_id}: seeding taken over by another node')
+                    return False
+        self._push(batch)
+        self.client.set(self.seeded_key, 'done', ex=self.key_ttl)
+        return True
+
+    def lease(self) -> str or None:
+        """
+        queue 에서 유저 하나를 가져온다, visibility timeout 안에 ack 하지 않으면 다시 queue 에 들어간다
+        :return: username, queue 가 비어있는 경우 None
+        """
+        self.requeue_expired()
+        return self._lease(keys=[self.pending_key, self.inflight_key],
+                           args=[time.time() + self.visibility_timeout, self.key_ttl])
+
+    def ack(self, username: str) -> None:
+        """
+        유저 크롤링이 끝난 경우 호출하여 inflight 에서 제거한다
+        :param username: 인스타그램 유저이름이다
+        :return: None
+        """
+        pipe = self.client.pipeline()
+        pipe.zrem(self.inflight_key, username)
+        pipe.hincrby(self.stats_key, 'acked', 1)
+        pipe.expire(self.stats_key, self.key_ttl)
+        pipe.execute()
+
+    def requeue_expired(self) -> int:
+        """
+        visibility timeout 이 지난 작업을 다시 queue 에 넣는다
+        :return: 다시 넣은 작업 수
+        """
+        return self._requeue(keys=[self.pending_key, self.inflight_key, self.stats_key],
+                             args=[time.time(), self.key_ttl])
+
+    def drain(self):
+        """
+        queue 의 유저를 하나씩 반환한다
+        queue 가 비어있어도 다른 노드에서 처리 중인 작업이 있으면, 만료되어 다시 들어올 수 있으므로 기다린다
+        :return: username generator
+        """
+        while True:
+            username = self.lease()
+            if username is not None:
+                yield username
+            elif self.client.zcard(self.inflight_key):
+                time.sleep(self.queue_config['POLL_INTERVAL'])
+            else:
+                return
+
+    def stats(self) -> dict:
+        """
+        queue 에 남은 작업 수, 처리 중인 작업 수, 분당 처리량을 반환한다
+        :return: dict
+        """
+        pipe = self.client.pipeline()
+        pipe.llen(self.pending_key)
+        pipe.zcard(self.inflight_key)
+        pipe.hgetall(self.stats_key)
+        depth, inflight, stats = pipe.execute()
+
+        acked = int(stats.get('acked', 0))
+        elapsed = time.time() - float(stats.get('startedAt', time.time()))
+        return {
+            'depth': depth,
+            'inflight': inflight,
+            'enqueued': int(stats.get('enqueued', 0)),
+            'acked': acked,
+            'requeued': int(stats.get('requeued', 0)),
+            'users_per_minute': acked / elapsed * 60 if elapsed > 0 else 0.0
+        }
 
 
 class MongoDBConnector:
@@ -93,17 +448,388 @@ class MongoDBConnector:
 
         return conn
 
-    def over_500_followers(self):
+    def ensure_indexes(self) -> None:
+        """
+        크롤링할 유저 목록과 일짜별 유저 정보 조회에 사용하는 index 를 만든다
+        조회할 때마다 만들지 않도록, 크롤링을 시작하기 전에 한 번만 호출한다(이미 있는 index 는 다시 만들지 않는다)
+        :return: None
+        """
+        for collection in (self.client[self.collection][''], self.client[self.collection]['']):
+            collection.create_index([('followersCount', DESCENDING)], background=True)
+        get_snapshot_store(self.client, self.client['']['']).ensure_indexes()
+
+    def over_500_followers(self, batch_size: int = 1000):
+        """
+        팔로워 수가 500 이상인 유저이름을 팔로워 수 순서로 하나씩 반환한다
+        두 collection 을 각각 팔로워 수 순서로 조회하여 병합하며, 두 collection 에 모두 있는 유저는 한번만 반환한다
+        전체 목록을 메모리에 올리지 않으므로, 첫번째 유저는 전체 목록을 읽기 전에 반환된다
+        :param batch_size: cursor 의 batch 크기이며, 중복 유저를 확인하는 단위이다
+        :return: username generator
+        """
         fixed_pages_list = self.client[self.collection]['']
         keyword_user_stats = self.client[self.collection]['']
-        ret = []
-        # 팔로워 수가 500이상인 유저의 수만 가져온다
-        for i in fixed_pages_list.find({'followersCount': {'$gte': 500}}).sort([('followersCount', -1)]):
-            ret.append({'username': i['_id'], 'followersCount': i['followersCount']})
 
-        for i in keyword_user_stats.find({'followersCount': {'$gte': 500}}).sort([('followersCount', -1)]):
-            ret.append({'username': i['_id'], 'followersCount': i['followersCount']})
+        # 팔로워 수가 500이상인 유저만 팔로워 순으로 가져온다
+        query = {'followersCount': {'$gte': 500}}
+        projection = {'followersCount': 1}
+        fixed_pages = fixed_pages_list.find(query, projection).sort([('followersCount', DESCENDING)])
+        keyword_users = keyword_user_stats.find(query, projection).sort([('followersCount', DESCENDING)])
+        # 두 collection 에 모두 있는 유저는 fixed_pages_list 의 유저로만 반환한다
+        keyword_users = self._exclude_exists(keyword_users.batch_size(batch_size), fixed_pages_list, query, batch_size)
+
+        # 두 collection 에서 가져온 유저를 다시 팔로워 순으로 병합한다
+        merged = heapq.merge(fixed_pages.batch_size(batch_size), keyword_users,
+                             key=itemgetter('followersCount'), reverse=True)
+        for document in merged:
+            yield document['_id']
+
+    @staticmethod
+    def _exclude_exists(cursor, collection, query: dict, batch_size: int):
+        # cursor 의 document 를 batch_size 개씩 모아서, collection 에 이미 있는 유저를 한번의 query 로 확인하여 제외한다
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) < batch_size:
+                continue
+            yield from MongoDBConnector._not_in(batch, collection, query)
+            batch = []
+        yield from MongoDBConnector._not_in(batch, collection, query)
+
+    @staticmethod
+    def _not_in(batch: list, collection, query: dict):
+        if not batch:
+            return
+        exists = {document['_id'] for document in collection.find(
+            dict(query, _id={'$in': [document['_id'] for document in batch]}), {'_id': 1}
+        )}
+        for document in batch:
+            if document['_id'] not in exists:
+                yield document
+
+
+class MongoWriteBuffer:
+    """
+    MongoDB 저장 요청을 모아서 collection 별로 unordered bulk_write 로 저장한다
+    모인 요청 수가 BATCH_SIZE 이상이거나, 가장 오래된 요청이 MAX_WAIT 초를 넘은 경우에 저장하며,
+    유저 크롤링이 끝나는 경우에는 flush() 를 호출하여 남은 요청을 저장한다
+    """
+    write_config = config.MONGODB_WRITE
 
-        # 두 개의 collection 에서 가져온 유저의 수를 다시 팔로워 순으로 정렬한다
-        ret.sort(key=itemgetter('followersCount'), reverse=True)
-        return [i['username']for i in ret]
+    def __init__(self, batch_size: int = None, max_wait: float = None):
+        self.batch_size = batch_size or self.write_config['BATCH_SIZE']
+        self.max_wait = max_wait or self.write_config['MAX_WAIT']
+        self._collections = {}
+        self._operations = {}
+        self._pending = 0
+        self._oldest = None
+        self.duplicates = []
+        self.counters = {
+            'flushes': 0,
+            'operations': 0,
+            'max_batch': 0,
+            'flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'synced': 0,
+            'sync_bytes': 0,
+            'document_bytes': 0,
+            'comments_new': 0,
+            'comments_stored': 0
+        }
+
+    def replace(self, collection, document: dict) -> None:
+        """
+        document 를 '_id' 기준으로 덮어쓰거나 새로 저장한다(replace_one upsert 와 같다)
+        :param collection: pymongo collection
+        :param document: 저장할 document
+        :return: None
+        """
+        self._add(collection, ReplaceOne({'_id': document['_id']}, document, upsert=True), document['_id'])
+
+    def insert(self, collection, document: dict, known=None) -> bool:
+        """
+        document 를 새로 저장한다(insert_one 과 같으며, 이미 저장된 document 는 덮어쓰지 않는다)
+        중복 키 에러는 flush 할 때 확인되므로, 이미 저장된 '_id' 를 바로 확인하려면 known 을 전달한다
+        :param collection: pymongo collection
+        :param document: 저장할 document
+        :param known: 이미 저장된 '_id' 목록(ex. KnownPostIndex), 포함된 document 는 저장하지 않고 False 를 반환한다
+        :return: 이미 저장되어 있는 '_id' 이거나, 이번 요청으로 저장한 document 중에 이미 저장되어 있던 '_id' 가 있는 경우 False
+        """
+        if known is not None and document['_id'] in known:
+            self.duplicates.append(document['_id'])
+            return False
+        duplicates = len(self.duplicates)
+        self._add(collection, InsertOne(document), document['_id'])
+        return len(self.duplicates) == duplicates
+
+    def sync(self, collection, document: dict, stored: set = None) -> None:
+        """
+        포스트 document 를 저장하며, 이미 저장된 포스트는 document 전체를 덮어쓰지 않고 바뀐 부분만 저장한다
+        댓글은 저장되지 않은 commentHash 의 댓글만 추가하고, 좋아요 수 같은 나머지 필드는 $set 으로 바꾼다
+        사이트에서 삭제된 댓글은 저장된 document 에 그대로 남는다
+        :param collection: pymongo collection
+        :param document: 저장할 포스트 document(parse_content 결과)
+        :param stored: 저장된 댓글 hash(CommentIndex.get()), None 인 경우 replace() 로 전체를 저장한다
+        :return: None
+        """
+        comments = document.get('comments', [])
+        if stored is None:
+            self.counters['comments_new'] += len(comments)
+            self.replace(collection, document)
+            return
+
+        new = []
+        seen = set(stored)
+        for comment in comments:
+            if comment['commentHash'] not in seen:
+                seen.add(comment['commentHash'])
+                new.append(comment)
+        update = {'$set': {key: value for key, value in document.items() if key not in ('_id', 'comments')}}
+        if new:
+            # 저장된 댓글과 합쳐서 parse_content 와 같이 작성 시간 역순으로 정렬한다
+            update['$push'] = {'comments': {'$each': new, '$sort': {'publishedAt': DESCENDING}}}
+
+        self.counters['synced'] += 1
+        self.counters['sync_bytes'] += len(BSON.encode(update))
+        self.counters['document_bytes'] += len(BSON.encode(document))
+        self.counters['comments_new'] += len(new)
+        self.counters['comments_stored'] += len(comments) - len(new)
+        self._add(collection, UpdateOne({'_id': document['_id']}, update, upsert=True), document['_id'])
+
+    def write(self, collection, operation, _id) -> None:
+        """
+        pymongo 요청(ex. UpdateOne)을 그대로 추가한다
+        :param collection: pymongo collection
+        :param operation: pymongo 요청
+        :param _id: 요청하는 document 의 '_id'
+        :return: None
+        """
+        self._add(collection, operation, _id)
+
+    @property
+    def pending(self) -> int:
+        """
+        아직 저장하지 않은 요청 수, 0 인 경우 지금까지의 요청은 모두 저장된 상태이다
+        """
+        return self._pending
+
+    def _add(self, collection, operation, _id) -> None:
+        name = collection.full_name
+        self._collections[name] = collection
+        # 에러가 발생한 요청의 '_id' 를 찾기 위해 요청과 '_id' 를 함께 저장한다
+        self._operations.setdefault(name, []).append((operation, _id))
+        self._pending += 1
+        if self._oldest is None:
+            self._oldest = time.time()
+
+        if self._pending >= self.batch_size or time.time() - self._oldest >= self.max_wait:
+            self.flush()
+
+    def flush(self) -> list:
+        """
+        모아둔 요청을 collection 별로 저장한다
+        이미 저장되어 있어 insert 하지 못한 '_id' 는 self.duplicates 에 추가한다
+        :return: 이번 flush 에서 중복된 '_id' 목록
+        """
+        if not self._pending:
+            return []
+
+        start = time.time()
+        duplicates = []
+        operations, self._operations = self._operations, {}
+        batch, self._pending, self._oldest = self._pending, 0, None
+
+        with stage_metrics().timer('db_write') as timer:
+            for name, ops in operations.items():
+                try:
+                    self._collections[name].bulk_write([op for op, _ in ops], ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details.get('writeErrors', [])
+                    # 중복 키(11000) 에러가 아닌 경우에는 그대로 발생시킨다
+                    if any(error.get('code') != 11000 for error in errors):
+                        raise
+                    duplicates.extend(ops[error['index']][1] for error in errors)
+            if duplicates:
+                timer.outcome = 'duplicate'
+
+        elapsed = time.time() - start
+        self.counters['flushes'] += 1
+        self.counters['operations'] += batch
+        self.counters['max_batch'] = max(self.counters['max_batch'], batch)
+        self.counters['flush_seconds'] += elapsed
+        self.counters['max_flush_seconds'] = max(self.counters['max_flush_seconds'], elapsed)
+        self.duplicates.extend(duplicates)
+
+        return duplicates
+
+    def stats(self) -> dict:
+        """
+        flush 횟수, 평균/최대 batch 크기, 평균/최대 flush 시간과
+        sync() 로 저장한 포스트의 평균 요청 크기(document 전체 크기와 비교), 새로 추가한/이미 저장된 댓글 수를 반환한다
+        :return: dict
+        """
+        flushes = self.counters['flushes']
+        synced = self.counters['synced']
+        return {
+            'flushes': flushes,
+            'operations': self.counters['operations'],
+            'avg_batch': self.counters['operations'] / flushes if flushes else 0,
+            'max_batch': self.counters['max_batch'],
+            'avg_flush_ms': self.counters['flush_seconds'] / flushes * 1000 if flushes else 0,
+            'max_flush_ms': self.counters['max_flush_seconds'] * 1000,
+            'synced': synced,
+            'avg_sync_bytes': self.counters['sync_bytes'] / synced if synced else 0,
+            'avg_document_bytes': self.counters['document_bytes'] / synced if synced else 0,
+            'comments_new': self.counters['comments_new'],
+            'comments_stored': self.counters['comments_stored']
+        }
+
+
+class KnownPostIndex:
+    """
+    유저의 이미 저장된 포스트 '_id'({userName}_{publishedAtTimestamp})를 한번의 query 로 가져와 메모리에 가지고 있는다
+    포스트를 파싱하기 전에 저장 여부를 확인하기 위해 사용하며,
+    '_id' index 로 조회할 수 있도록 '_id' 범위로 조회하고 타임스탬프(int)만 저장한다
+    저장된 포스트가 MAX_IDS 개보다 많아 일부만 가져온 경우, 가져온 범위보다 오래된 '_id' 는 collection 에서 확인한다
+    """
+    def __init__(self, collection, username: str, since_timestamp: int, limit: int = None):
+        self.collection = collection
+        self.username = username
+        self.prefix = f'{username}_'
+        self.limit = limit or config.KNOWN_POSTS['MAX_IDS']
+        self.timestamps = self._load(collection, since_timestamp)
+        # 최신 포스트부터 limit 개만 가져온 경우, 가져온 포스트 중 가장 오래된 포스트의 작성시간
+        self.oldest = min(self.timestamps) if len(self.timestamps) >= self.limit else None
+
+    def _load(self, collection, since_timestamp: int) -> set:
+        # 타임스탬프는 10자리 숫자이므로, '_id' 문자열 범위로 since_timestamp 이후의 포스트만 조회할 수 있다
+        # 'abc' 와 'abc_1' 처럼 접두어가 같은 다른 유저의 '_id' 가 포함될 수 있어, 숫자가 아닌 경우에는 제외한다
+        cursor = collection.find(
+            {'_id': {'$gte': f'{self.prefix}{since_timestamp}', '$lt': f'{self.prefix}:'}},
+            {'_id': 1}
+        ).sort([('_id', -1)]).limit(self.limit)
+
+        timestamps = set()
+        for document in cursor:
+            timestamp = document['_id'][len(self.prefix):]
+            if timestamp.isdigit():
+                timestamps.add(int(timestamp))
+        return timestamps
+
+    def __contains__(self, _id: str) -> bool:
+        if not _id or not _id.startswith(self.prefix):
+            return False
+        timestamp = _id[len(self.prefix):]
+        if not timestamp.isdigit():
+            return False
+        if int(timestamp) in self.timestamps:
+            return True
+        if self.oldest is not None and int(timestamp) < self.oldest:
+            return self.collection.find_one({'_id': _id}, {'_id': 1}) is not None
+        return False
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class CommentIndex:
+    """
+    유저의 저장된 포스트별 댓글 hash(commentHash)를 한번의 query 로 가져와 메모리에 가지고 있는다
+    overwrite 로 크롤링하는 경우, 저장된 포스트는 document 전체를 다시 저장하지 않고 새로운 댓글만 추가하기 위해 사용한다
+    저장된 commentHash 는 이전 방식(댓글 내용 포함)일 수 있으므로, 저장된 댓글의 작성자와 작성시간으로 hash 를 다시 만든다
+    작성자나 작성시간이 없는 댓글이 있는 포스트는 한번 전체를 다시 저장한다
+    """
+    def __init__(self, collection, username: str, since_timestamp: int, limit: int = None):
+        self.username = username
+        self.prefix = f'{username}_'
+        self.limit = limit or config.KNOWN_POSTS['MAX_IDS']
+        self.posts = self._load(collection, since_timestamp)
+
+    def _load(self, collection, since_timestamp: int) -> dict:
+        # KnownPostIndex 와 같이 '_id' 범위로 조회하며, 댓글은 hash 를 만드는 필드만 가져온다
+        cursor = collection.find(
+            {'_id': {'$gte': f'{self.prefix}{since_timestamp}', '$lt': f'{self.prefix}:'}},
+            {'comments.username': 1, 'comments.publishedAtTimestamp': 1}
+        ).sort([('_id', -1)]).limit(self.limit)
+
+        posts = {}
+        for document in cursor:
+            if not document['_id'][len(self.prefix):].isdigit():
+                continue
+            try:
+                posts[document['_id']] = {comment_hash(comment, document['_id'])
+                                          for comment in document.get('comments') or []}
+            except KeyError:
+                posts[document['_id']] = None
+        return posts
+
+    def get(self, _id: str) -> set or None:
+        """
+        저장된 포스트의 댓글 hash 를 반환한다
+        :param _id: 포스트 '_id'
+        :return: 댓글 hash set, 저장되지 않았거나 댓글 hash 가 없는 포스트인 경우 None
+        """
+        return self.posts.get(_id)
+
+    def __len__(self) -> int:
+        return len(self.posts)
+
+
+class CrawlStateStore:
+    """
+    유저별 크롤링 상태(가장 최신 포스트의 작성시간, 포스트 수, 프로필 hash)를 저장한다
+    다음 크롤링 시에 바뀐 내용이 없는 유저는 포스트를 크롤링하지 않고, 이전에 크롤링한 포스트까지만 크롤링한다
+    """
+    state_config = config.CRAWL_STATE
+    # 크롤링 시간과 같이 매번 바뀌는 필드는 프로필 hash 에 포함하지 않는다
+    PROFILE_FIELDS = ('postCount', 'followerCount', 'followingCount', 'userDescription', 'VerifiedBadge')
+
+    def __init__(self, client):
+        self.collection = client[config.MONGODB['COLLECTION']][self.state_config['COLLECTION']]
+
+    def get(self, username: str) -> dict or None:
+        """
+        유저의 크롤링 상태를 반환한다
+        :param username: 인스타그램 유저이름이다
+        :return: {'_id', 'newestPostTimestamp', 'postCount', 'profileHash', 'updatedAt'} 또는 None
+        """
+        return self.collection.find_one({'_id': username})
+
+    def save(self, username: str, newest_post_timestamp: int or None, post_count: str, profile_hash: str) -> None:
+        """
+        유저의 크롤링 상태를 저장한다, 포스트 크롤링이 에러 없이 끝난 경우에만 호출한다
+        :param username: 인스타그램 유저이름이다
+        :param newest_post_timestamp: 저장된 포스트 중 가장 최신 포스트의 작성시간
+        :param post_count: 유저 페이지의 포스트 수
+        :param profile_hash: profile_hash() 로 만든 프로필 hash
+        :return: None
+        """
+        self.collection.replace_one({'_id': username}, {
+            '_id': username,
+            'newestPostTimestamp': newest_post_timestamp,
+            'postCount': post_count,
+            'profileHash': profile_hash,
+            'updatedAt': datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+        }, upsert=True)
+
+    @classmethod
+    def profile_hash(cls, page_info: dict) -> str:
+        """
+        parse_user_info 로 파싱한 유저 정보에서 프로필 hash 를 만든다
+        :param page_info: 인스타그램 유저 정보
+        :return: sha256 hex digest
+        """
+        sha256 = hashlib.new('sha256')
+        sha256.update(json.dumps([page_info.get(field) for field in cls.PROFILE_FIELDS]).encode())
+        return sha256.hexdigest()
+
+    @staticmethod
+    def post_timestamp(post_id: str) -> int or None:
+        """
+        포스트 '_id'({userName}_{publishedAtTimestamp}) 에서 작성시간을 반환한다
+        :param post_id: 포스트 '_id'
+        :return: timestamp
+        """
+        if not post_id:
+            return None
+        timestamp = post_id.rsplit('_', 1)[-1]
+        return int(timestamp) if timestamp.isdigit() else None
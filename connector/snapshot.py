@@ -0,0 +1,302 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, UpdateOne
+
+import config
+
+# 날짜별로 바뀌는 필드와, 거의 바뀌지 않아 바뀐 경우에만 저장하는 필드
+COUNT_FIELDS = ('postCount', 'followerCount', 'followingCount')
+STATIC_FIELDS = ('userDescription', 'VerifiedBadge')
+
+
+def _count(value):
+    # 포스트/팔로워/팔로잉 수는 문자열로 파싱되므로, bucket 에는 숫자로 저장한다
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _month(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m')
+
+
+class DocumentSnapshotStore:
+    """
+    일짜별 유저 정보를 날짜마다 document 하나({date}_{username})로 저장한다(crawler.daily_user_info 결과 그대로)
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self) -> None:
+        """
+        조회에 필요한 index 를 만든다, 날짜별 조회는 '_id' 범위로 하므로 만들 index 가 없다
+        :return: None
+        """
+
+    def save(self, writes, daily_page_info: dict) -> None:
+        """
+        일짜별 유저 정보를 write buffer 에 추가한다
+        :param writes: MongoWriteBuffer
+        :param daily_page_info: crawler.daily_user_info 결과
+        :return: None
+        """
+        writes.replace(self.collection, daily_page_info)
+
+    def day(self, date: str, usernames=None, batch_size: int = 1000):
+        """
+        date 의 일짜별 유저 정보를 반환한다
+        :param date: 'YYYY-MM-DD'
+        :param usernames: 유저이름 iterable, None 인 경우 모든 유저
+        :param batch_size: 한번에 조회하는 유저 수
+        :return: daily_user_info 형식의 dict generator
+        """
+        if usernames is None:
+            yield from self.collection.find({'_id': {'$gte': f'{date}_', '$lt': f'{date}`'}})
+            return
+        usernames = list(usernames)
+        for i in range(0, len(usernames), batch_size):
+            ids = [f'{date}_{username}' for username in usernames[i:i + batch_size]]
+            yield from self.collection.find({'_id': {'$in': ids}})
+
+    def history(self, username: str, since: int = 0) -> list:
+        """
+        유저의 일짜별 유저 정보를 날짜 순서로 반환한다
+        :param username: 인스타그램 유저이름이다
+        :param since: 이 시간(timestamp) 이후의 정보만 반환한다
+        :return: daily_user_info 형식의 dict list
+        """
+        return list(self.collection.find(
+            {'userName': username, 'publishedAtTimestamp': {'$gte': since}}
+        ).sort([('publishedAtTimestamp', ASCENDING)]))
+
+    def post_count_ranges(self, since: int):
+        """
+        since 이후의 기록으로 유저별 첫/마지막 기록 시간과 최소/최대 포스트 수를 반환한다(RecrawlScheduler 에서 사용한다)
+        :param since: timestamp
+        :return: {'_id': username, 'firstSnapshotAt', 'lastSnapshotAt', 'minPostCount', 'maxPostCount'} iterable
+        """
+        # postCount 는 문자열로 저장되어 있으므로 숫자로 변환하여 비교한다
+        return self.collection.aggregate([
+            {'$match': {'publishedAtTimestamp': {'$gte': since}}},
+            {'$project': {
+                'userName': 1,
+                'publishedAtTimestamp': 1,
+                'postCount': {'$convert': {'input': '$postCount', 'to': 'int', 'onError': None, 'onNull': None}}
+            }},
+            {'$group': {
+                '_id': '$userName',
+                'firstSnapshotAt': {'$min': '$publishedAtTimestamp'},
+                'lastSnapshotAt': {'$max': '$publishedAtTimestamp'},
+                'minPostCount': {'$min': '$postCount'},
+                'maxPostCount': {'$max': '$postCount'}
+            }}
+        ], allowDiskUse=True)
+
+
+class BucketSnapshotStore:
+    """
+    일짜별 유저 정보를 유저별 월 단위 bucket({username}_{YYYY-MM}) 하나에 모아서 저장한다
+    날짜마다 snapshots.{DD} 에 [timestamp, 포스트 수, 팔로워 수, 팔로잉 수] 를 저장하며(유저마다 하루 한번의 upsert),
+    같은 날 다시 저장하는 경우(ex. retry.py)에는 그 날의 기록을 덮어쓴다
+    유저 설명과 인증배지는 bucket 을 만들 때와 바뀐 경우에만 profiles 에 [시간, 값] 으로 저장한다
+
+    document: {'_id', 'userName', 'month', 'userDescription', 'VerifiedBadge'(가장 최근 값),
+               'profiles': [{'t', 'userDescription', 'VerifiedBadge'}, ...],
+               'snapshots': {'01': [t, post, follower, following], ...}}
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self) -> None:
+        """
+        월 단위 조회(day, post_count_ranges)에 사용하는 'month' index 를 만든다
+        크롤링 중에 조회할 때마다 만들지 않도록, 크롤링을 시작하기 전에 한 번만 호출한다
+        :return: None
+        """
+        self.collection.create_index([('month', ASCENDING)], background=True)
+
+    @staticmethod
+    def bucket_id(username: str, month: str) -> str:
+        return f'{username}_{month}'
+
+    @staticmethod
+    def _snapshot(daily_page_info: dict) -> (str, list):
+        # 날짜(DD)와 [timestamp, 포스트 수, 팔로워 수, 팔로잉 수]
+        timestamp = daily_page_info['publishedAtTimestamp']
+        snapshot = [timestamp] + [_count(daily_page_info.get(field)) for field in COUNT_FIELDS]
+        return datetime.fromtimestamp(timestamp).strftime('%d'), snapshot
+
+    def operations(self, daily_page_info: dict) -> list:
+        """
+        일짜별 유저 정보를 bucket 에 저장하는 요청을 반환한다
+        첫번째 요청은 그 날의 snapshot 을 저장하는 upsert 이며, 두번째 요청은 유저 설명이나 인증배지가 바뀐 경우에만 저장된다
+        :param daily_page_info: crawler.daily_user_info 결과
+        :return: [(pymongo 요청, bucket '_id')]
+        """
+        timestamp = daily_page_info['publishedAtTimestamp']
+        username = daily_page_info['userName']
+        _id = self.bucket_id(username, _month(timestamp))
+        static = {field: daily_page_info.get(field) for field in STATIC_FIELDS}
+        day, snapshot = self._snapshot(daily_page_info)
+
+        changed = {'$or': [{field: {'$ne': value}} for field, value in static.items()]}
+        return [
+            (UpdateOne({'_id': _id}, {
+                '$set': {f'snapshots.{day}': snapshot},
+                '$setOnInsert': dict(static, userName=username, month=_month(timestamp),
+                                     profiles=[dict(static, t=timestamp)])
+            }, upsert=True), _id),
+            (UpdateOne(dict(changed, _id=_id), {
+                '$set': static,
+                '$push': {'profiles': dict(static, t=timestamp)}
+            }), _id)
+        ]
+
+    def save(self, writes, daily_page_info: dict) -> None:
+        """
+        일짜별 유저 정보를 bucket 에 저장하는 요청을 write buffer 에 추가한다
+        :param writes: MongoWriteBuffer
+        :param daily_page_info: crawler.daily_user_info 결과
+        :return: None
+        """
+        for operation, _id in self.operations(daily_page_info):
+            writes.write(self.collection, operation, _id)
+
+    @staticmethod
+    def expand(bucket: dict) -> list:
+        """
+        bucket 을 날짜 순서의 일짜별 유저 정보로 되돌린다
+        :param bucket: bucket document
+        :return: daily_user_info 형식의 dict list
+        """
+        profiles = sorted(bucket.get('profiles') or [], key=lambda profile: profile['t'])
+        dailies = []
+        for _, (timestamp, *counts) in sorted((bucket.get('snapshots') or {}).items()):
+            # 기록 시간 이전에 마지막으로 바뀐 유저 설명과 인증배지를 사용한다
+            static = profiles[0] if profiles else {}
+            for profile in profiles:
+                if profile['t'] > timestamp:
+                    break
+                static = profile
+            published_at = datetime.fromtimestamp(timestamp)
+            date = published_at.strftime('%Y-%m-%d')
+            dailies.append(dict(
+                {'_id': f'{date}_{bucket["userName"]}', 'userName': bucket['userName']},
+                **{field: str(count) for field, count in zip(COUNT_FIELDS, counts)},
+                **{field: static.get(field) for field in STATIC_FIELDS},
+                publishedAt=published_at.strftime('%Y-%m-%d %H:%M:%S'),
+                publishedAtTimestamp=timestamp
+            ))
+        return dailies
+
+    def day(self, date: str, usernames=None, batch_size: int = 1000):
+        """
+        date 의 일짜별 유저 정보를 DocumentSnapshotStore 와 같은 형식으로 반환한다
+        :param date: 'YYYY-MM-DD'
+        :param usernames: 유저이름 iterable, None 인 경우 모든 유저
+        :param batch_size: 한번에 조회하는 유저 수
+        :return: daily_user_info 형식의 dict generator
+        """
+        month = date[:7]
+        # bucket 에서 그 날의 snapshot 만 가져온다
+        projection = {'userName': 1, 'profiles': 1, f'snapshots.{date[8:10]}': 1}
+        if usernames is None:
+            cursors = [self.collection.find({'month': month}, projection)]
+        else:
+            usernames = list(usernames)
+            cursors = (
+                self.collection.find({'_id': {'$in': [self.bucket_id(username, month)
+                                                      for username in usernames[i:i + batch_size]]}}, projection)
+                for i in range(0, len(usernames), batch_size)
+            )
+        for cursor in cursors:
+            for bucket in cursor:
+                yield from self.expand(bucket)
+
+    def history(self, username: str, since: int = 0) -> list:
+        """
+        유저의 일짜별 유저 정보를 날짜 순서로 반환한다
+        :param username: 인스타그램 유저이름이다
+        :param since: 이 시간(timestamp) 이후의 정보만 반환한다
+        :return: daily_user_info 형식의 dict list
+        """
+        # 'abc' 와 'abc_1' 처럼 접두어가 같은 다른 유저의 bucket 이 포함될 수 있어, userName 도 확인한다
+        buckets = self.collection.find({
+            '_id': {'$gte': self.bucket_id(username, _month(since)), '$lt': f'{username}_:'},
+            'userName': username
+        }).sort([('_id', ASCENDING)])
+        return [daily for bucket in buckets for daily in self.expand(bucket)
+                if daily['publishedAtTimestamp'] >= since]
+
+    def post_count_ranges(self, since: int):
+        """
+        since 이후의 기록으로 유저별 첫/마지막 기록 시간과 최소/최대 포스트 수를 반환한다(RecrawlScheduler 에서 사용한다)
+        :param since: timestamp
+        :return: {'_id': username, 'firstSnapshotAt', 'lastSnapshotAt', 'minPostCount', 'maxPostCount'} iterable
+        """
+        return self.collection.aggregate([
+            {'$match': {'month': {'$gte': _month(since)}}},
+            {'$project': {'userName': 1, 'snapshots': {'$objectToArray': '$snapshots'}}},
+            {'$unwind': '$snapshots'},
+            {'$project': {
+                'userName': 1,
+                'timestamp': {'$arrayElemAt': ['$snapshots.v', 0]},
+                'postCount': {'$arrayElemAt': ['$snapshots.v', 1]}
+            }},
+            {'$match': {'timestamp': {'$gte': since}}},
+            {'$group': {
+                '_id': '$userName',
+                'firstSnapshotAt': {'$min': '$timestamp'},
+                'lastSnapshotAt': {'$max': '$timestamp'},
+                'minPostCount': {'$min': '$postCount'},
+                'maxPostCount': {'$max': '$postCount'}
+            }}
+        ], allowDiskUse=True)
+
+    def migrate_operations(self, documents: list) -> list:
+        """
+        한 유저의 일짜별 유저 document 들을 bucket 으로 옮기는 요청을 반환한다, ordered bulk_write 로 순서대로 저장해야 한다
+        bucket 을 읽어서 다시 쓰지 않고 날짜마다 아직 저장되지 않은 경우에만 저장하므로,
+        크롤링 중에 저장되는 snapshot 을 덮어쓰지 않으며 여러번 실행해도 결과가 같다
+        :param documents: 한 유저의 daily_user_info 형식의 document list(날짜 순서)
+        :return: pymongo 요청 list
+        """
+        months = {}
+        for document in documents:
+            months.setdefault(_month(document['publishedAtTimestamp']), []).append(document)
+
+        operations = []
+        for month, dailies in months.items():
+            _id = self.bucket_id(dailies[0]['userName'], month)
+            # 유저 설명과 인증배지가 바뀐 시점들, $addToSet 이므로 다시 실행해도 중복되지 않는다
+            profiles = []
+            for daily in dailies:
+                static = {field: daily.get(field) for field in STATIC_FIELDS}
+                if not profiles or any(profiles[-1][field] != value for field, value in static.items()):
+                    profiles.append(dict(static, t=daily['publishedAtTimestamp']))
+            # bucket 이 없는 경우에만 만들며, 가장 최근 값은 크롤링으로 저장된 값을 그대로 둔다
+            latest = {field: profiles[-1][field] for field in STATIC_FIELDS}
+            operations.append(UpdateOne({'_id': _id}, {
+                '$setOnInsert': dict(latest, userName=dailies[0]['userName'], month=month),
+                '$addToSet': {'profiles': {'$each': profiles}}
+            }, upsert=True))
+            for daily in dailies:
+                day, snapshot = self._snapshot(daily)
+                operations.append(UpdateOne({'_id': _id, f'snapshots.{day}': {'$exists': False}},
+                                            {'$set': {f'snapshots.{day}': snapshot}}))
+        return operations
+
+
+def get_snapshot_store(client, daily_user_collection, storage: str = None):
+    """
+    설정(DAILY_SNAPSHOT['STORAGE'])에 따라 일짜별 유저 정보 저장소를 반환한다
+    :param client: pymongo MongoClient
+    :param daily_user_collection: 'document' 저장소의 collection
+    :param storage: 'document' or 'bucket'
+    :return: DocumentSnapshotStore or BucketSnapshotStore
+    """
+    storage = storage or config.DAILY_SNAPSHOT['STORAGE']
+    if storage == 'bucket':
+        return BucketSnapshotStore(client[config.MONGODB['COLLECTION']][config.DAILY_SNAPSHOT['COLLECTION']])
+    return DocumentSnapshotStore(daily_user_collection)
@@ -0,0 +1,106 @@
+"""
+날짜마다 document 하나({date}_{username})로 저장된 일짜별 유저 정보를 유저별 월 단위 bucket({username}_{YYYY-MM})으로 옮긴다
+bucket 을 읽어서 다시 쓰지 않고 아직 저장되지 않은 날짜만 저장하므로, 크롤링 중에 실행해도 크롤러가 저장하는 snapshot 을
+덮어쓰지 않으며 여러번 실행해도 같은 결과가 된다, document 는 지우지 않는다
+--verify 인 경우 옮긴 유저마다 bucket 에서 되돌린 일짜별 유저 정보가 document 와 같은지 확인한다
+
+usage: python migrate_snapshots.py [--since 2020-03-01] [--verify]
+"""
+import time
+import logging
+import argparse
+from datetime import datetime
+
+from config import DAILY_SNAPSHOT, MONGODB
+from connector.connector import MongoDBConnector
+from connector.snapshot import COUNT_FIELDS, STATIC_FIELDS, get_snapshot_store
+from utils.logger import custom_logger
+
+custom_logger = custom_logger()
+logger = custom_logger.getLogger(__name__)
+
+# bucket 에 저장하는 필드, 그 외의 필드는 옮기지 않는다
+FIELDS = ('_id', 'userName') + COUNT_FIELDS + STATIC_FIELDS + ('publishedAt', 'publishedAtTimestamp')
+
+
+def user_documents(collection, since: int = 0):
+    """
+    일짜별 유저 정보 document 를 유저별로 묶어서 날짜 순서로 반환한다
+    :param collection: 일짜별 유저 정보 collection
+    :param since: 이 시간(timestamp) 이후의 document 만 옮긴다
+    :return: (username, document list) generator
+    """
+    cursor = collection.aggregate([
+        {'$match': {'publishedAtTimestamp': {'$gte': since}}},
+        {'$project': {field: 1 for field in FIELDS}},
+        {'$sort': {'userName': 1, 'publishedAtTimestamp': 1}}
+    ], allowDiskUse=True)
+    username, documents = None, []
+    for document in cursor:
+        if document['userName'] != username and documents:
+            yield username, documents
+            documents = []
+        username = document['userName']
+        documents.append(document)
+    if documents:
+        yield username, documents
+
+
+def verify(store, username: str, documents: list) -> bool:
+    """
+    bucket 에서 되돌린 일짜별 유저 정보에 document 들이 그대로 있는지 확인한다
+    """
+    days = {daily['_id']: daily for daily in store.history(username, documents[0]['publishedAtTimestamp'])}
+    for document in documents:
+        daily = days.get(document['_id'])
+        if daily is None or any(str(daily.get(field)) != str(document.get(field)) for field in FIELDS):
+            logging.warning(f'{username}: {document["_id"]} mismatch {daily}')
+            return False
+    return True
+
+
+def migrate(since: int = 0, check: bool = False, batch_size: int = 1000) -> dict:
+    conn = MongoDBConnector().conn()
+    documents_collection = conn['']['']
+    store = get_snapshot_store(conn, documents_collection, 'bucket')
+    store.ensure_indexes()
+    counters = {'users': 0, 'documents': 0, 'operations': 0, 'snapshots': 0, 'mismatches': 0}
+    operations = []
+
+    def write():
+        # bucket 을 만드는 요청이 그 bucket 의 날짜별 요청보다 먼저 실행되도록 ordered 로 저장한다
+        if operations:
+            result = store.collection.bulk_write(operations, ordered=True)
+            counters['operations'] += len(operations)
+            counters['snapshots'] += result.modified_count
+            operations.clear()
+
+    for username, documents in user_documents(documents_collection, since):
+        counters['users'] += 1
+        counters['documents'] += len(documents)
+        operations.extend(store.migrate_operations(documents))
+        if check:
+            # 확인하기 전에 이 유저의 요청을 모두 저장한다
+            write()
+            if not verify(store, username, documents):
+                counters['mismatches'] += 1
+        elif len(operations) >= batch_size:
+            write()
+        if counters['users'] % 1000 == 0:
+            logging.info(f'## migrating... {counters}')
+    write()
+    return counters
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='move daily user documents into monthly per-user buckets')
+    args.add_argument('--since', help='migrate documents published on or after this date (YYYY-MM-DD)')
+    args.add_argument('--verify', action='store_true', help='compare every migrated user with its documents')
+    args = args.parse_args()
+
+    since = int(time.mktime(datetime.strptime(args.since, '%Y-%m-%d').timetuple())) if args.since else 0
+    logging.info(f'## START: migrating daily user snapshots into '
+                 f'{MONGODB["COLLECTION"]}.{DAILY_SNAPSHOT["COLLECTION"]}....{datetime.now()}')
+    start = time.time()
+    result = migrate(since, args.verify)
+    logging.info(f'## END: migrating... {result} time taken: {time.time() - start}')
@@ -0,0 +1,89 @@
+"""
+utils.emoji_text 의 미리 컴파일한 정규식이 호출할 때마다 정규식을 만들던 기존 구현과 같은 결과를 반환하는지 확인한다
+"""
+import os
+import random
+import re
+
+import emoji
+import pytest
+
+from utils.emoji_text import _REMOVE_RE, remove_emoji, strip_emoji, strip_many
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark', 'fixtures')
+
+
+def legacy_strip_emoji(text):
+    new_text = re.sub(emoji.get_emoji_regexp(), r'', text)
+    emoji_pattern = re.compile("["
+                               u"\u2800"
+                               "]+", flags=re.UNICODE)
+    return emoji_pattern.sub(r' ', new_text).strip()
+
+
+def legacy_remove_emoji(string):
+    NON_BMP_RE = re.compile(u"[^\U00000000-\U0000d7ff\U0000e000-\U0000ffff]", flags=re.UNICODE)
+    rem_emoji_text = NON_BMP_RE.sub(r'', string)
+
+    emoji_pattern = re.compile("["
+                               u"\u200d"
+                               u"\u2640-\u2642"
+                               u"\u2600-\u2B55"
+                               u"\u23cf"
+                               u"\u23e9"
+                               u"\u231a"
+                               u"\u3030"
+                               u"\ufe0f"
+                               "]+", flags=re.UNICODE)
+
+    return emoji_pattern.sub(r'', rem_emoji_text)
+
+
+def load_captions() -> list:
+    # 한 줄에 포스트 본문 하나이며, 본문의 줄바꿈은 '\n' 문자열로 저장되어 있다
+    with open(os.path.join(FIXTURE_PATH, 'captions.txt'), 'rt', encoding='utf-8') as f:
+        return [line.rstrip('\n').replace('\\n', '\n') for line in f if line.strip()]
+
+
+def random_texts(count: int, seed: int = 0) -> list:
+    # BMP 안의 emoji 기호(☀, ❤ 등), BMP 밖의 emoji, ZWJ/variation selector/skin tone, 공백 문자(\u2800),
+    # 한글, 영문이 섞인 문자열을 만든다
+    rng = random.Random(seed)
+    emojis = list(emoji.unicode_codes.EMOJI_UNICODE.values())
+    parts = ['\u2800', '\u200d', '\ufe0f', '\u20e3', '\u2600', '❤', '\u2b55', '\u3030', '\u231a',
+             '\U0001F3FB', '\U0001F600', '\U00020000', '#', '1', ' ', '\n', '가', '나', 'a', 'b']
+    texts = []
+    for _ in range(count):
+        pieces = [rng.choice(emojis) if rng.random() < 0.4 else rng.choice(parts) for _ in range(rng.randint(0, 20))]
+        texts.append(''.join(pieces))
+    return texts
+
+
+CORPUS = load_captions() + [
+    '',
+    'emoji 없는 문장',
+    '\u2800\u2800\u2800',
+    '앞 😀 뒤',
+    '❤\ufe0f❤\ufe0f 하트 \u2600\ufe0f 날씨 \u2b55',
+    '가족 👨\u200d👩\u200d👧\u200d👦 사진 👍🏻',
+    '\u2800😀\u2800🌸\u2800 공백 사이 emoji',
+    '1\ufe0f\u20e3 #\ufe0f\u20e3 키캡',
+    '𠀀 BMP 밖의 한자',
+] + random_texts(3000)
+
+
+@pytest.mark.parametrize('text', CORPUS[:50])
+def test_strip_emoji(text):
+    assert strip_emoji(text) == legacy_strip_emoji(text)
+
+
+@pytest.mark.parametrize('text', CORPUS[:50])
+def test_remove_emoji(text):
+    assert remove_emoji(text) == legacy_remove_emoji(text)
+    assert _REMOVE_RE.sub('', text) == legacy_remove_emoji(text)
+
+
+def test_whole_corpus():
+    assert strip_many(CORPUS) == [legacy_strip_emoji(text) for text in CORPUS]
+    assert [strip_emoji(text) for text in CORPUS] == [legacy_strip_emoji(text) for text in CORPUS]
+    assert [remove_emoji(text) for text in CORPUS] == [legacy_remove_emoji(text) for text in CORPUS]
@@ -0,0 +1,98 @@
+"""
+SoupParser 와 LxmlParser 가 같은 인스타그램 페이지에서 같은 결과를 반환하는지 확인한다
+benchmark/fixtures 의 페이지와, 페이지에서 요소를 지우거나 비운 경우를 함께 확인한다
+"""
+import os
+import re
+
+import pytest
+
+from utils.parser import LxmlParser, SoupParser
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark', 'fixtures')
+USERNAME = 'sample_shop'
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_PATH, name), 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def remove(html: str, pattern: str) -> str:
+    # pattern 에 맞는 부분을 지운 페이지를 반환한다, 지울 부분이 없는 경우에는 fixture 가 바뀐 것이므로 실패한다
+    removed, count = re.subn(pattern, '', html, flags=re.S)
+    assert count, f'pattern not found: {pattern}'
+    return removed
+
+
+def empty_caption(html: str) -> str:
+    # 첫번째 댓글(포스트 본문)의 span 내용만 비운다
+    emptied, count = re.subn(r'(<div class="C4VMK">\s*<h2.*?</h2>\s*<span>).*?(</span>)', r'\1\2', html, count=1,
+                             flags=re.S)
+    assert count
+    return emptied
+
+
+def parse(parser, method: str, html: str):
+    # 결과 또는 발생한 예외 타입을 반환한다
+    try:
+        if method == 'content':
+            return parser.content(html, USERNAME)
+        return getattr(parser, method)(html)
+    except Exception as e:
+        return type(e)
+
+
+PAGES = {
+    'profile': lambda: load_fixture('profile.html'),
+    'private': lambda: load_fixture('private.html'),
+    'not_found': lambda: load_fixture('not_found.html'),
+    'post': lambda: load_fixture('post.html'),
+    'post_video': lambda: load_fixture('post_video.html'),
+    'post_many_comments': lambda: load_fixture('post_many_comments.html'),
+    'empty': lambda: '',
+    'profile_without_description': lambda: remove(load_fixture('profile.html'), r'<div class="-vDIg">.*?</div>'),
+    'profile_without_counts': lambda: remove(load_fixture('profile.html'), r'<ul class="k9GMp">.*?</ul>'),
+    'post_empty_caption': lambda: empty_caption(load_fixture('post.html')),
+    'post_without_caption': lambda: remove(load_fixture('post.html'), r'<div class="C4VMK">.*?</div>\s*</div>'),
+    'post_without_like': lambda: remove(load_fixture('post.html'), r'<div class="Nm9Fw">.*?</div>'),
+    'post_without_date': lambda: remove(load_fixture('post.html'), r'<time class="_1o9PC Nzb55"[^>]*>.*?</time>'),
+    'post_without_comment_date': lambda: remove(load_fixture('post.html'),
+                                                r'<time class="FH9sR Nzb55" datetime="2020-03-06T10:01:02[^>]*>.*?</time>'),
+}
+
+CASES = [
+    (page, method)
+    for page in PAGES
+    for method in ('page_available', 'has_login_popup', 'user_info', 'content')
+]
+
+
+@pytest.mark.parametrize('page, method', CASES)
+def test_parsers_return_same_result(page, method):
+    html = PAGES[page]()
+    assert parse(LxmlParser, method, html) == parse(SoupParser, method, html)
+
+
+def test_fixture_fields():
+    # 두 parser 가 같은 잘못된 결과를 반환하지 않도록, 대표 필드는 값을 직접 확인한다
+    profile = LxmlParser.user_info(load_fixture('profile.html'))
+    assert (profile['postCount'], profile['followerCount'], profile['followingCount']) == ('1204', '48213', '312')
+    assert profile['title'] == 'Sample Shop 공식 계정'
+
+    post = LxmlParser.content(load_fixture('post.html'), USERNAME)
+    assert post['like'] == '1,482'
+    assert post['date'] == '2020-03-06T09:12:44.000Z'
+    assert post['hashtags'] == ['handmade', 'accessory', '선물추천']
+    assert [writer for writer, _, _ in post['comments']] == ['jiwoo_kim', 'minseo.p']
+
+
+def test_missing_elements():
+    empty_caption_post = LxmlParser.content(PAGES['post_empty_caption'](), USERNAME)
+    assert empty_caption_post['content'] == ''
+    assert LxmlParser.content(PAGES['post_without_like'](), USERNAME)['like'] is None
+
+    profile = LxmlParser.user_info(PAGES['profile_without_description']())
+    assert (profile['title'], profile['description']) == ('', '')
+    assert parse(LxmlParser, 'user_info', PAGES['profile_without_counts']()) is AttributeError
+    assert parse(LxmlParser, 'content', PAGES['post_without_date']()) is TypeError
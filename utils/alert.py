@@ -0,0 +1,202 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing.util import Finalize
+
+from config import ALERT, TELEGRAM_CHAT_ID, TELEGRAM_TOKEN
+
+# 텔레그램 메시지의 최대 길이
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TelegramSink:
+    """
+    텔레그램으로 메시지를 발송한다, Bot 은 한번만 생성하여 재사용한다
+    """
+    name = 'telegram'
+
+    def __init__(self):
+        self._bot = None
+
+    def send(self, message: str) -> None:
+        if self._bot is None:
+            from telegram import Bot
+            self._bot = Bot(token=TELEGRAM_TOKEN)
+        self._bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message[:MAX_MESSAGE_LENGTH])
+
+
+class StubSink:
+    """
+    메시지를 발송하지 않고 메모리에 저장한다(로컬 실행 및 테스트용)
+    """
+    name = 'stub'
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message: str) -> None:
+        self.messages.append(message)
+        logging.info(f'alert: {message}')
+
+
+SINKS = {
+    TelegramSink.name: TelegramSink,
+    StubSink.name: StubSink
+}
+
+
+class AlertDispatcher:
+    """
+    send_error 메시지를 main 프로세스의 background thread 에서 발송한다
+    메시지는 크기가 제한된 프로세스 간 queue 에 넣기만 하므로 크롤링이 발송을 기다리지 않으며, queue 가 가득 찬 경우에는 버린다
+    fork 된 worker 프로세스는 같은 queue 로 보내므로, 모든 프로세스의 메시지를 모아서 WINDOW 초마다 최대 MAX_MESSAGES 개만 발송하며,
+    같은 에러는 '37 users failed with ...' 처럼 하나의 메시지로 묶어서 발송한다
+    """
+    def __init__(self, sink=None, window: float = None, queue_size: int = None):
+        self.sink = sink or SINKS.get(ALERT['SINK'], TelegramSink)()
+        self.window = window if window is not None else ALERT['WINDOW']
+        self._queue = multiprocessing.Queue(maxsize=queue_size or ALERT['QUEUE_SIZE'])
+        self._closed = threading.Event()
+        self.counters = {
+            'submitted': 0,
+            'dropped': 0,
+            'sent': 0,
+            'failed': 0
+        }
+        self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, message: str) -> bool:
+        """
+        발송할 메시지를 queue 에 넣는다, 기다리지 않고 바로 반환한다
+        worker 프로세스에서 호출한 경우에도 main 프로세스의 thread 가 발송한다(counters 는 호출한 프로세스에 남는다)
+        :param message: Error message
+        :return: queue 가 가득 차서 버린 경우 False
+        """
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.counters['dropped'] += 1
+            return False
+        self.counters['submitted'] += 1
+        return True
+
+    @staticmethod
+    def split(message: str) -> (str or None, str):
+        """
+        '{username}: \\n{error}' 형식의 메시지를 유저이름과 에러로 나눈다
+        :param message: Error message
+        :return: (username, error), 형식이 다른 경우 (None, message)
+        """
+        username, separator, error = message.partition(': \n')
+        if not separator or not username or '\n' in username:
+            return None, message
+        return username, error
+
+    def digest(self, messages: list) -> list:
+        """
+        모은 메시지 중 같은 에러를 하나로 묶은 발송 메시지 목록을 반환한다
+        유저별 에러가 아닌 메시지(ex. 크롤링 종료 메시지)는 그대로 발송한다
+        :param messages: Error message list
+        :return: 발송할 메시지 list
+        """
+        groups = {}
+        plain = []
+        for message in messages:
+            username, error = self.split(message)
+            if username is None:
+                plain.append(message)
+            else:
+                groups.setdefault(error, []).append(username)
+
+        # 많은 유저가 실패한 에러부터 발송한다
+        digests = []
+        for error, usernames in sorted(groups.items(), key=lambda group: len(group[1]), reverse=True):
+            if len(usernames) == 1:
+                digests.append(f'{usernames[0]}: \n{error}')
+                continue
+            shown = ', '.join(usernames[:ALERT['MAX_USERS']])
+            more = f' (+{len(usernames) - ALERT["MAX_USERS"]})' if len(usernames) > ALERT['MAX_USERS'] else ''
+            digests.append(f'{len(usernames)} users failed with {error}\n{shown}{more}')
+
+        # 한번에 발송하는 메시지 수를 제한하여, 텔레그램의 발송 제한에 걸리지 않도록 한다
+        # 발송하지 않은 메시지는 로그에만 남긴다
+        messages = plain + digests
+        if len(messages) > ALERT['MAX_MESSAGES']:
+            suppressed = messages[ALERT['MAX_MESSAGES'] - 1:]
+            for message in suppressed:
+                logging.warning(f'alert suppressed: {message}')
+            messages = messages[:ALERT['MAX_MESSAGES'] - 1]
+            messages.append(f'{len(suppressed)} more alerts suppressed in {self.window}s')
+        return messages
+
+    def _drain(self, timeout: float) -> list:
+        messages = []
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0 and not self._closed.is_set():
+                    message = self._queue.get(timeout=remaining)
+                else:
+                    message = self._queue.get_nowait()
+            except queue.Empty:
+                return messages
+            # flush() 가 기다리는 thread 를 깨우기 위해 넣은 None 은 발송하지 않는다
+            if message is not None:
+                messages.append(message)
+
+    def _run(self) -> None:
+        while not (self._closed.is_set() and self._queue.empty()):
+            messages = self._drain(self.window)
+            if not messages:
+                continue
+            for message in self.digest(messages):
+                try:
+                    self.sink.send(message)
+                except Exception as e:
+                    self.counters['failed'] += 1
+                    logging.warning(f'alert send failed: {repr(e)}')
+                else:
+                    self.counters['sent'] += 1
+
+    def flush(self, timeout: float = 10) -> None:
+        """
+        남은 메시지를 모두 발송하고 background thread 를 종료한다
+        :param timeout: 발송을 기다리는 최대 시간
+        :return: None
+        """
+        self._closed.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        try:
+            queued = self._queue.qsize()
+        except NotImplementedError:
+            queued = None
+        return dict(self.counters, queued=queued)
+
+
+_alert_dispatcher = None
+_lock = threading.Lock()
+
+
+def alert_dispatcher() -> AlertDispatcher:
+    """
+    AlertDispatcher 를 반환한다
+    처음 호출될 때 생성하며, 프로세스가 종료될 때 남은 메시지를 발송하도록 등록한다
+    main 프로세스에서 worker 프로세스를 fork 하기 전에 생성해야(custom_logger()) worker 프로세스가 같은 dispatcher 의 queue 를 사용한다
+    :return: AlertDispatcher
+    """
+    global _alert_dispatcher
+    with _lock:
+        if _alert_dispatcher is None:
+            _alert_dispatcher = AlertDispatcher()
+            Finalize(_alert_dispatcher, _alert_dispatcher.flush, exitpriority=20)
+    return _alert_dispatcher
@@ -0,0 +1,346 @@
+"""
+main.py, retry.py, async_main.py 가 함께 사용하는 유저 한 명의 크롤링 흐름
+'http' 모드인 경우 페이지의 JSON 으로 먼저 크롤링하고, 실패한 경우에만 Driver Pool 의 브라우저로 크롤링한다
+"""
+import time
+import logging
+
+import requests
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+
+from utils.logger import send_error
+from utils.crawler import InstagramCrawler
+from utils.driver_pool import driver_pool
+from utils.metrics import stage_metrics
+from utils.rate_limit import rate_limiter
+from utils.readiness import wait_ready
+from utils.http_crawler import InstagramHttpCrawler, JSONExtractError
+from config import CRAWL_STATE, FETCH_MODE
+from connector.connector import CommentIndex, CrawlStateStore, KnownPostIndex, MongoDBConnector, MongoWriteBuffer, \
+    RedisConnector
+from connector.checkpoint import get_checkpoint_store
+from connector.snapshot import get_snapshot_store
+
+
+def crawl_http(overwrite: bool, username: str, writes: MongoWriteBuffer, states: CrawlStateStore,
+               user_collection, snapshots, data_collection) -> bool:
+    """
+    Selenium 없이 페이지의 JSON 으로 인스타그램 유저 페이지를 크롤링한다
+    :param overwrite: 포스트 정보를 저장할 때, 중복여부에 따라 크롤링을 종료한다
+    :param username: 인스타그램 유저이름이다
+    :param writes: 유저 정보와 포스트 정보를 모아서 저장하는 write buffer
+    :param states: 유저별 크롤링 상태 저장소
+    :return: 크롤링에 성공한 경우 True, Selenium 으로 다시 크롤링해야 하는 경우 False
+    """
+    crawler = InstagramHttpCrawler(username)
+    # 'overwrite' 가 False 라면, 이미 저장된 포스트는 포스트 페이지를 요청하기 전에 확인하여 크롤링을 중지한다
+    known_posts = None if overwrite else KnownPostIndex(data_collection, username, crawler.crawl_since())
+    state = None if CRAWL_STATE['FULL_REFRESH'] else states.get(username)
+    try:
+        # 'overwrite' 가 True 라면 30일 이내의 포스트를 모두 다시 저장하므로, 크롤링 상태는 프로필 확인에만 사용한다
+        page_info, posts = crawler.crawl(known_posts, None if overwrite else state)
+    except (JSONExtractError, requests.RequestException) as e:
+        # 저장된 정보가 없으므로, Selenium 으로 다시 크롤링한다
+        logging.warning(f'{username}: {repr(e)} fallback to selenium')
+        return False
+    if page_info is None:
+        logging.info(f'{username}: Private user or page not found.')
+        return True
+
+    logging.info(page_info)
+    # 프로필이 바뀌지 않은 경우에는 최신 유저 정보를 저장하지 않는다
+    profile_hash = states.profile_hash(page_info)
+    if state is None or state['profileHash'] != profile_hash:
+        writes.replace(user_collection, page_info)
+    snapshots.save(writes, crawler.daily_user_info(page_info))
+
+    newest = state['newestPostTimestamp'] if state else None
+    # 'overwrite' 가 True 라면, 저장된 포스트는 새로운 댓글과 바뀐 필드만 저장한다
+    stored_comments = CommentIndex(data_collection, username, crawler.crawl_since()) if overwrite and posts else None
+    for data in posts:
+        if overwrite:
+            writes.sync(data_collection, data, stored_comments.get(data['_id']))
+        elif not writes.insert(data_collection, data, known_posts):
+            logging.warning(f'Duplicate document: key {writes.duplicates}')
+            break
+        newest = max(newest or 0, data['publishedAtTimestamp'])
+        logging.info(data)
+
+    states.save(username, newest, page_info['postCount'], profile_hash)
+    return True
+
+
+def crawl_selenium(overwrite: bool, username: str, writes: MongoWriteBuffer, states: CrawlStateStore,
+                   user_collection, snapshots, data_collection, crawler: InstagramCrawler, driver,
+                   checkpoints=None) -> tuple:
+    """
+    Driver Pool 에서 가져온 브라우저로 인스타그램의 유저 페이지를 크롤링한다
+    브라우저는 반납하지 않으며, crawl_user() 에서 반납한다
+    :param driver: webdriver Instance
+    :param checkpoints: checkpoint store, 이전에 중단된 포스트 크롤링을 cursor 부터 이어서 크롤링한다
+    :return: (유저 크롤링을 끝까지 마친 경우 True, 브라우저를 재사용하지 않아야 하는 경우 True)
+    """
+    redis_conn = RedisConnector()
+    state = None if CRAWL_STATE['FULL_REFRESH'] else states.get(username)
+    # 단계별 실행 시간을 proxy 별로 기록한다
+    metrics = stage_metrics()
+    load_start = time.time()
+    driver.get(crawler.url())
+
+    # 인스타그램 유저의 페이지 정보를 크롤링한다
+    # 비공개 계정, 페이지를 찾을 수 없는 경우, 로그인 페이지로 이동된 경우에는 timeout 까지 기다리지 않는다
+    try:
+        wait_ready(driver, 'div._9AhH0', 20, 'profile')
+    except TimeoutException as e:
+        load_seconds = time.time() - load_start
+        # page not-found, 비공개 계정등인 경우에는 로깅을 하지 않는다
+        available = crawler.page_available(driver.page_source)
+        if available:
+            # 에러가 발생하는 경우, retry 를 위해 redis-logging
+            logging.error(f'{username} Page GET: Timed out waiting for page to load')
+            redis_conn.saved_error(username, repr(e))
+            send_error(f'{username}: \n{repr(e)} crawl_user(): Timed out waiting for page to load')
+            # proxy 가 차단되었거나 연속으로 실패하여 격리된 경우, 다음 유저는 다른 proxy 로 브라우저를 다시 띄운다
+            # 차단된 경우에는 인스타그램으로 보내는 요청 간격을, timeout 인 경우에는 proxy 의 요청 간격을 늘린다
+            if crawler.login_required(driver):
+                outcome = 'blocked'
+                quarantined = crawler.proxy.record_block(driver.proxy_key)
+                rate_limiter().backoff(driver.proxy_key, rate_limiter().host)
+            else:
+                outcome = 'timeout'
+                quarantined = crawler.proxy.record_failure(driver.proxy_key)
+                rate_limiter().backoff(driver.proxy_key)
+        else:
+            logging.info(f'{username}: Private user or page not found.')
+            outcome = 'unavailable'
+            quarantined = False
+        metrics.observe('page_load', load_seconds, driver.proxy_key, outcome)
+        return not available, quarantined
+    else:
+        load_seconds = time.time() - load_start
+        metrics.observe('page_load', load_seconds, driver.proxy_key)
+        crawler.proxy.record_success(driver.proxy_key, load_seconds)
+        page_info = crawler.parse_user_info(driver)
+        logging.info(page_info)
+
+        # 최신 유저 정보를 저장한다, 프로필이 바뀌지 않은 경우에는 저장하지 않는다
+        profile_hash = states.profile_hash(page_info)
+        if state is None or state['profileHash'] != profile_hash:
+            writes.replace(user_collection, page_info)
+        # 일짜별로 유저 정보를 저장한다
+        daily_page_info = crawler.daily_user_info(page_info)
+        snapshots.save(writes, daily_page_info)
+
+        # 포스트 수가 이전 크롤링과 같은 경우에는 새로운 포스트가 없으므로 포스트를 크롤링하지 않는다
+        # 'overwrite' 가 True 라면 저장된 포스트의 좋아요 수와 댓글도 다시 저장해야 하므로 크롤링한다
+        if not overwrite and state is not None and state['postCount'] == page_info['postCount']:
+            logging.info(f'{username}: post count unchanged, skip crawling posts')
+            states.save(username, state['newestPostTimestamp'], page_info['postCount'], profile_hash)
+            writes.flush()
+            return True, False
+
+        # 다음 페이지를 열기 전에 proxy 와 인스타그램의 요청 간격만큼 기다린다
+        rate_limiter().wait(driver.proxy_key)
+
+    # 인스타그램 페이지 하단에 로그인이 필요하다는 팝업을 닫는다
+    # 이 팝업을 닫지 않는 경우, 첫번째 포스트 클릭 시 방해가 되어 에러가 발생하는 경우가 있다
+    with metrics.timer('popup', driver.proxy_key):
+        crawler.popup_check_and_close(driver)
+
+    # 인스타그램 유저의 가장 최신의 포스트를 선택한다
+    try:
+        with metrics.timer('first_post', driver.proxy_key):
+            crawler.select_first_post(driver)
+    except TimeoutException as e:
+        # 에러가 발생하는 경우, retry 를 위해 redis-logging
+        logging.error(f'{username}: {repr(e)}')
+        redis_conn.saved_error(username, repr(e))
+        send_error(f'{username}: \n{repr(e)}')
+        writes.flush()
+        return False, False
+
+    # 'overwrite' 가 False 라면, 이미 저장된 포스트 '_id' 를 한번에 가져온다
+    # 포스트를 파싱하기 전에 작성시간만으로 저장 여부를 확인하여, 좋아요 수 클릭과 댓글 파싱을 하지 않는다
+    known_posts = None if overwrite else KnownPostIndex(data_collection, username, crawler.crawl_since())
+    # 'overwrite' 가 True 라면, 저장된 포스트의 댓글 hash 를 한번에 가져와서 새로운 댓글과 바뀐 필드만 저장한다
+    stored_comments = CommentIndex(data_collection, username, crawler.crawl_since()) if overwrite else None
+    # 이전 크롤링에서 가장 최신 포스트의 작성시간이며, 이 시간 이전의 포스트는 크롤링하지 않는다('overwrite' 가 False 인 경우)
+    newest = state['newestPostTimestamp'] if state else None
+    watermark = None if overwrite else newest
+    # 이전 크롤링이 중단된 경우, cursor 범위의 포스트는 이미 저장되어 있으므로 파싱하지 않고 넘긴다
+    cursor = checkpoints.cursor(username) if checkpoints is not None else None
+    # 이번 크롤링에서 저장한 포스트 범위(newest, oldest)와 cursor 범위까지 내려왔는지 여부
+    stored = None
+    resumed = False
+    skipped = 0
+    # 에러 없이 포스트 크롤링이 끝난 경우에만 크롤링 상태를 저장한다
+    completed = False
+    broken = False
+    while True:
+        post_timestamp = None
+        if known_posts is not None or watermark is not None or cursor is not None:
+            post_id = crawler.post_id(driver)
+            if known_posts is not None and post_id in known_posts:
+                logging.warning(f'Known document: key {post_id}')
+                completed = True
+                break
+            post_timestamp = states.post_timestamp(post_id)
+            if watermark is not None and post_timestamp is not None and post_timestamp <= watermark:
+                logging.info(f'{username}: reached last crawled post {post_id}')
+                completed = True
+                break
+
+        if cursor is not None and post_timestamp is not None and \
+                cursor['oldest'] <= post_timestamp <= cursor['newest']:
+            resumed = True
+            skipped += 1
+            newest = max(newest or 0, post_timestamp)
+        else:
+            try:
+                with metrics.timer('parse', driver.proxy_key):
+                    data = crawler.parse_content(driver)
+            except ValueError:
+                # 30일이 지난 포스트인 경우 'ValueError'를 발생시킨다
+                # 다음 유저 정보의 크롤링을 위해 이번 유저의 크롤링 루프를 종료한다
+                completed = True
+                break
+            except TimeoutException as e:
+                # 에러가 발생하는 경우, retry 를 위해 redis-logging
+                logging.error(f'{username}: {repr(e)}')
+                redis_conn.saved_error(username, repr(e))
+                send_error(f'{username}: \n{repr(e)}')
+                break
+
+            # 포스트 정보를 저장한다
+            # 'overwrite' 가 True 라면, 30일 이내의 모든 포스트 정보를 중복여부에 상관없이 다시 저장한다
+            # (이미 저장된 포스트는 새로운 댓글만 추가하고, 좋아요 수 등의 필드만 바꾼다)
+            # 'overwrite '가 False 라면, 30일 이내의 포스트를 크롤링 시에 이미 저장되어 있는 포스트가 있다면 크롤링을 중지한다
+            # 저장 요청은 모아서 저장하므로, 중복 여부는 요청을 저장하는 시점에 확인된다
+            if overwrite:
+                writes.sync(data_collection, data, stored_comments.get(data['_id']))
+            elif not writes.insert(data_collection, data, known_posts):
+                logging.warning(f'Duplicate document: key {writes.duplicates}')
+                completed = True
+                break
+
+            newest = max(newest or 0, data['publishedAtTimestamp'])
+            stored = (max(stored[0], data['publishedAtTimestamp']) if stored else data['publishedAtTimestamp'],
+                      data['publishedAtTimestamp'])
+            logging.info(data)
+            # 요청이 저장된 경우에만 cursor 를 옮긴다
+            if checkpoints is not None and not writes.pending:
+                save_cursor(checkpoints, username, stored, cursor, resumed)
+
+        # 다음 포스트로 넘긴다
+        try:
+            with metrics.timer('next_page', driver.proxy_key):
+                crawler.next_page(driver)
+        except NoSuchElementException as e:
+            logging.error(f'{username}: {repr(e)}')
+            redis_conn.saved_error(username, repr(e))
+            send_error(f'{username}: \n{repr(e)}')
+            # 페이지 상태를 알 수 없으므로, 브라우저를 재사용하지 않는다
+            broken = True
+            break
+        except TimeoutException as e:
+            # 에러가 발생하는 경우, retry 를 위해 redis-logging
+            logging.error(f'{username}: {repr(e)}')
+            redis_conn.saved_error(username, repr(e))
+            break
+        except EOFError as e:
+            logging.warning(f'{username}: {repr(e)}')
+            completed = True
+            break
+
+    writes.flush()
+    if completed:
+        states.save(username, newest, page_info['postCount'], profile_hash)
+    elif checkpoints is not None:
+        save_cursor(checkpoints, username, stored, cursor, resumed)
+    if skipped:
+        logging.info(f'{username}: resumed from cursor {cursor}, skipped {skipped} posts')
+        checkpoints.incr('resumed_users')
+        checkpoints.incr('skipped_posts', skipped)
+    logging.info(f'{username}: mongodb writes {writes.stats()}')
+    return completed, broken
+
+
+def crawl_user(overwrite: bool, username: str, checkpoints=None) -> bool:
+    """
+    인스타그램의 유저 페이지를 크롤링한다
+    :param overwrite: 포스트 정보를 저장할 때, 중복여부에 따라 크롤링을 종료한다
+    :param username: 인스타그램 유저이름이다
+    :param checkpoints: checkpoint store, 이전에 중단된 포스트 크롤링을 cursor 부터 이어서 크롤링한다
+    :return: 유저 크롤링을 끝까지 마친 경우 True, retry 가 필요한 경우 False
+    """
+    conn = MongoDBConnector().conn()
+    user_collection = conn['']['']
+    # 일짜별 유저 정보 저장소, DAILY_SNAPSHOT['STORAGE'] 가 'bucket' 인 경우 유저별 월 단위 bucket 에 저장한다
+    snapshots = get_snapshot_store(conn, conn[''][''])
+    data_collection = conn['']['']
+    # 저장 요청을 모아서 bulk_write 로 저장하며, 유저 크롤링이 끝나는 경우에 남은 요청을 저장한다
+    writes = MongoWriteBuffer()
+    # 유저별 크롤링 상태, FULL_REFRESH 인 경우에는 이전 크롤링 상태를 사용하지 않는다
+    states = CrawlStateStore(conn)
+
+    # 'http' 모드인 경우 페이지의 JSON 으로 먼저 크롤링하고, 실패한 경우에만 Selenium 으로 크롤링한다
+    if FETCH_MODE == 'http' and crawl_http(overwrite, username, writes, states,
+                                           user_collection, snapshots, data_collection):
+        writes.flush()
+        return True
+
+    crawler = InstagramCrawler(username)
+    # worker 프로세스의 Driver Pool 에서 재사용 가능한 브라우저를 가져온다
+    drivers = driver_pool()
+    driver = drivers.acquire(crawler.driver)
+    # 크롤링 도중에 예외가 발생한 경우에는 페이지 상태를 알 수 없으므로, 브라우저를 초기화하지 않고 종료한다
+    broken = True
+    try:
+        completed, broken = crawl_selenium(overwrite, username, writes, states, user_collection, snapshots,
+                                           data_collection, crawler, driver, checkpoints)
+        return completed
+    finally:
+        drivers.release(driver, broken=broken)
+
+
+def save_cursor(checkpoints, username: str, stored: tuple, cursor: dict, resumed: bool) -> None:
+    """
+    이번 크롤링에서 저장한 포스트 범위를 cursor 로 저장한다
+    이전 cursor 가 있는 경우, cursor 범위까지 내려온 다음에만 두 범위를 합쳐서 저장한다
+    (그 전에는 최신 포스트와 cursor 사이에 아직 크롤링하지 않은 포스트가 있을 수 있다)
+    """
+    if stored is None:
+        return
+    if cursor is None:
+        checkpoints.save_cursor(username, *stored)
+    elif resumed:
+        checkpoints.save_cursor(username, max(stored[0], cursor['newest']), min(stored[1], cursor['oldest']))
+
+
+def crawl_job(overwrite: bool, username: str) -> str:
+    """
+    유저 목록, job queue 또는 retry queue 에서 가져온 유저를 크롤링한다
+    에러가 발생하는 경우에도 retry 를 위해 redis-logging 한 다음, ack 할 수 있도록 유저이름을 반환한다
+    끝까지 크롤링한 유저는 이전 실패 기록을 지워서 retry 횟수가 누적되지 않도록 한다
+    :param overwrite: 포스트 정보를 저장할 때, 중복여부에 따라 크롤링을 종료한다
+    :param username: 인스타그램 유저이름이다
+    :return: username
+    """
+    redis_conn = RedisConnector()
+    checkpoints = get_checkpoint_store()
+    # 유저 한 명의 전체 크롤링 시간을 결과(완료, 중단, 에러)별로 기록한다
+    with stage_metrics().timer('user') as timer:
+        try:
+            completed = crawl_user(overwrite, username, checkpoints)
+        except Exception as e:
+            timer.outcome = type(e).__name__
+            logging.error(f'{username}: {repr(e)}')
+            redis_conn.saved_error(username, repr(e))
+        else:
+            timer.outcome = 'completed' if completed else 'incomplete'
+            # 끝까지 크롤링한 유저는 실패 기록을 지우고 완료로 기록하여, 다시 실행하는 경우 크롤링하지 않는다
+            # 끝까지 크롤링하지 못한 유저는 crawl_user() 에서 저장한 실패 기록을 그대로 둔다
+            if completed:
+                redis_conn.resolve_error(username)
+                checkpoints.mark_done(username)
+    return username
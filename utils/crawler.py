@@ -1,21 +1,26 @@
+import logging
 import os
 import platform
 import time
+from fnmatch import fnmatchcase
 from datetime import datetime, timedelta
 from operator import itemgetter
-from random import uniform
 
-from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-from selenium.webdriver.support.wait import WebDriverWait
 
 import config
 from utils.emoji_text import strip_emoji
-from utils.proxy import RandProxy
-from utils.user_agent import random_user_agent
+from utils.hash import comment_hash
+from utils.metrics import stage_metrics
+from utils.parser import get_parser
+from utils.proxy import ProxyManager, proxy_manager
+from utils.rate_limit import rate_limiter
+from utils.readiness import post_time, wait_ready
+from utils.user_agent import user_agent_pool
+
+# 설정에 따라 HTML 파싱 backend 를 선택한다('lxml' or 'soup')
+parser = get_parser(config.PARSER)
 
 
 class InstagramCrawler:
@@ -24,7 +29,8 @@ class InstagramCrawler:
     크롤링 날짜 기준으로 최대 30일 이내의 포스트 정보를 가져온다
     """
     def __init__(self, username: str = None):
-        self.proxy = RandProxy()
+        # proxy 목록은 프로세스마다 한번만 가져오며, worker 프로세스들과 proxy 상태를 공유한다
+        self.proxy = proxy_manager()
         self.user = username
         self.base_url = config.BASE_URL
         self._driver_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin')
@@ -38,10 +44,12 @@ class InstagramCrawler:
         """
         return self.base_url.format(username=self.user)
 
-    def driver(self, hide=True) -> webdriver.Chrome:
+    def driver(self, hide=True, mode: str = None, performance_log: bool = False) -> webdriver.Chrome:
         """
         Selenium Driver를 반환한다
         :param hide: browser의 숨김여부를 설정한다
+        :param mode: 'lean' 인 경우 이미지, 동영상, 폰트, 트래커를 받지 않는다(기본값: config.BROWSING['MODE'])
+        :param performance_log: 페이지별 전송량을 확인할 수 있도록 DevTools network 로그를 남긴다
         :return: webdriver Instance
         """
         path = self._driver_path
@@ -61,14 +69,66 @@ class InstagramCrawler:
             chrome_options.add_argument('--disable-gpu')
             chrome_options.add_argument('--no-sandbox')
             chrome_options.add_argument('--disable-dev-shm-usage')
-        # Settings User-Agent
-        chrome_options.add_argument(f'user-agent={random_user_agent()}')
+        # Settings User-Agent, proxy 마다 같은 User-Agent 를 사용한다
+        chrome_options.add_argument(f'user-agent={user_agent_pool().for_proxy(ProxyManager.key(proxies))}')
         # Settings Proxy
         chrome_options.add_argument(f'--proxy-server={proxies["protocol"]}://{proxies["ip"]}:{proxies["port"]}')
         chrome_options.add_argument(f'"--proxy-auth={proxies["user"]}:{proxies["password"]}"')
         chrome_options.add_argument('lang=ko_KR')
+        # 'lean' 모드에서는 이미지, 동영상 등 크롤링에 필요 없는 리소스를 proxy 로 받지 않는다
+        mode = mode or config.BROWSING['MODE']
+        if mode == 'lean':
+            chrome_options.add_experimental_option('prefs', config.BROWSING['PREFS'])
+            for argument in config.BROWSING['ARGUMENTS']:
+                chrome_options.add_argument(argument)
+        if performance_log:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+        with stage_metrics().timer('driver_start', ProxyManager.key(proxies)):
+            driver = webdriver.Chrome(path, chrome_options=chrome_options)
+            if mode == 'lean':
+                self.block_urls(driver)
+            # wait_ready() 의 MutationObserver 가 timeout 까지 기다릴 수 있도록 async script 실행 시간을 늘린다
+            driver.set_script_timeout(config.READINESS['SCRIPT_TIMEOUT'])
+        driver.browsing_mode = mode
+        # 브라우저를 재사용하는 동안 같은 proxy 를 사용하므로, 페이지 로딩 결과를 기록할 수 있도록 proxy 를 저장한다
+        driver.proxy_key = ProxyManager.key(proxies)
+        return driver
 
-        return webdriver.Chrome(path, chrome_options=chrome_options)
+    @staticmethod
+    def blocked_urls() -> list:
+        """
+        DevTools 로 차단할 주소 목록을 반환한다
+        차단할 주소가 ALLOWED_URLS 의 주소를 포함하는 경우(ex. '*.js*')에는 페이지가 그려지지 않으므로 차단하지 않는다
+        :return: Network.setBlockedURLs 의 주소 목록
+        """
+        blocked = []
+        for pattern in config.BROWSING['BLOCKED_URLS']:
+            allowed = [url for url in config.BROWSING['ALLOWED_URLS'] if fnmatchcase(url, pattern)]
+            if allowed:
+                logging.warning(f'blocked url pattern {pattern} overlaps allowed urls {allowed}, not blocked')
+                continue
+            blocked.append(pattern)
+        return blocked
+
+    def block_urls(self, driver: webdriver.Chrome) -> None:
+        """
+        브라우저의 첫번째 탭에서 blocked_urls() 의 주소를 요청하지 않도록 설정한다
+        DriverPool 은 첫번째 탭을 재사용하므로, 브라우저를 띄울 때 한번만 설정한다
+        :param driver: selenium webdriver instance
+        :return: None
+        """
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_urls()})
+
+    @staticmethod
+    def login_required(driver: webdriver.Chrome) -> bool:
+        """
+        로그인 페이지로 이동되었는지 확인한다, proxy 가 차단된 경우 유저 페이지 대신 로그인 페이지로 이동된다
+        :param driver: selenium webdriver instance
+        :return: bool
+        """
+        return '/accounts/login' in driver.current_url
 
     @staticmethod
     def popup_check_and_close(driver: webdriver.Chrome) -> None:
@@ -77,17 +137,14 @@ class InstagramCrawler:
         :param driver: selenium webdriver instance
         :return: None
         """
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'lxml')
-
-        if soup.select_one('button.dCJp8.afkep.xqRnw'):
+        if parser.has_login_popup(driver.page_source):
             driver.find_element_by_css_selector('button.dCJp8.afkep.xqRnw').click()
 
     @staticmethod
     def select_first_post(driver: webdriver.Chrome) -> None:
         """
         인스타그램의 첫번째 포스트를 클릭하여 페이지를 연다
-        페이지를 연 다음에, 강제적으로 1 ~ 1.5sec 사이의 딜레이를 준다
+        페이지를 연 다음에, proxy 와 인스타그램의 요청 간격이 RATE_LIMIT 를 넘지 않도록 기다린다
         :param driver: selenium webdriver instance
         :return: None
         """
@@ -97,13 +154,11 @@ class InstagramCrawler:
         try:
             # 포스트의 오른쪽 본문 내용의 Tag가 로드될 때 까지 기다린다.
             # 최대 30초까지 기다리며, 이전에 완료된 경우에는 바로 넘어간다
-            WebDriverWait(driver, 30).until(
-                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.C4VMK > span'))
-            )
+            wait_ready(driver, 'div.C4VMK > span', 30, 'first_post')
         except TimeoutException:
             raise TimeoutException('select_first_post(): Timed out waiting for page to load')
         else:
-            time.sleep(uniform(1, 1.5))
+            rate_limiter().wait(getattr(driver, 'proxy_key', None))
             return None
 
     def parse_user_info(self, driver: webdriver.Chrome) -> dict:
@@ -112,31 +167,11 @@ class InstagramCrawler:
         :param driver: selenium webdriver instance
         :return: user page info(dict)
         """
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'lxml')
-
-        # 인증배지 여부를 파싱한다
-        if soup.select_one('span.mrEK_.Szr5J.coreSpriteVerifiedBadge'):
-            verified_badge = True
-        else:
-            verified_badge = False
-        # 포스트 수, 팔로워, 팔로잉 수를 파싱한다
-        count_info_li = soup.select_one('ul.k9GMp').find_all('li')
-        post_count = count_info_li[0].find('span').get_text(strip=True).replace(',', '')
-        follower = count_info_li[1].find('span')['title'].replace(',', '')
-        follow = count_info_li[2].find('span').get_text(strip=True).replace(',', '')
-
-        # 유저 설명 부분을 파싱한다
-        # 첫줄의 bold 라인과 아닌 부분을 나누어 파싱하여 합친다
-        try:
-            title = soup.select_one('div.-vDIg > h1').get_text(strip=True)
-        except (AttributeError, TypeError):
-            title = ''
-        try:
-            description = soup.select_one('div.-vDIg > span').get_text()
-        except AttributeError:
-            description = ''
+        info = parser.user_info(driver.page_source)
 
+        # 유저 설명 부분은 첫줄의 bold 라인과 아닌 부분을 나누어 파싱하여 합친다
+        title = info['title']
+        description = info['description']
         if title or description:
             user_description = f'{title}\n{description}'
         else:
@@ -149,11 +184,11 @@ class InstagramCrawler:
         return {
             '_id': self.user,
             'userName': self.user,
-            'postCount': post_count,
-            'followerCount': follower,
-            'followingCount': follow,
+            'postCount': info['postCount'],
+            'followerCount': info['followerCount'],
+            'followingCount': info['followingCount'],
             'userDescription': user_description,
-            'VerifiedBadge': verified_badge,
+            'VerifiedBadge': info['VerifiedBadge'],
             'crawlAtTimestamp': crawlAtTimestamp,
             'crawlAt': crawlAt
         }
@@ -181,92 +216,97 @@ class InstagramCrawler:
 
         return daily_page_info
 
+    def crawl_since(self) -> int:
+        """
+        크롤링할 포스트의 최소 작성시간(크롤링 날짜 기준 MAX_CRAWL_DATE 일 전)을 타임스탬프로 반환한다
+        :return: timestamp
+        """
+        x_days_ago = (self.CRAWL_DATE - timedelta(days=self.MAX_CRAWL_DATE)).strftime("%Y-%m-%d %H:%M:%S")
+        return int(time.mktime(datetime.strptime(x_days_ago, "%Y-%m-%d %H:%M:%S").timetuple()))
+
+    def post_id(self, driver: webdriver.Chrome) -> str or None:
+        """
+        열려 있는 포스트의 '_id' 를 반환한다(parse_content 가 반환하는 '_id' 와 같다)
+        페이지 전체를 파싱하지 않고, 작성시간 element 만 가져와서 만든다
+        :param driver: selenium webdriver instance
+        :return: '{username}_{publishedAtTimestamp}', 작성시간을 찾을 수 없는 경우 None
+        """
+        try:
+            date = driver.find_element_by_css_selector('time._1o9PC.Nzb55').get_attribute('datetime')
+        except NoSuchElementException:
+            return None
+        if not date:
+            return None
+
+        date = date[:19].replace('T', ' ')
+        date_timestamp = int(time.mktime(datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timetuple()))
+        return f'{self.user}_{date_timestamp}'
+
     def parse_content(self, driver: webdriver.Chrome) -> dict:
         """
         인스타그램의 포스트 내용과 댓글을 파싱하여 정보를 반환한다
         :param driver: selenium webdriver instance
         :return: post and comment data(dict)
         """
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'lxml')
+        metrics = stage_metrics()
+        proxy = getattr(driver, 'proxy_key', None)
+        with metrics.timer('html_parse', proxy):
+            parsed = parser.content(driver.page_source, self.user)
 
-        # 포스트 본문 내용을 파싱한다
-        try:
-            content = soup.select_one('div.C4VMK > span').get_text()
-        except:
+        # 본문 내용에 포함된 emoji를 제거한다
+        if parsed['content'] is None:
             content = ''
         else:
-            # 본문 내용에 포함된 emoji를 제거한다
-            content = strip_emoji(content)
+            content = strip_emoji(parsed['content'])
 
         # 포스트의 댓글 내용들을 파싱한다
+        # 댓글 작성자가 포스트 주인이 아닌 댓글만 반환된다
         comments = []
-        try:
-            comment_list = soup.select('div.C4VMK')
-        except:
-            pass
-        else:
-            for comment in comment_list:
-                try:
-                    writer = comment.find('a', {'class': 'FPmhX notranslate TlrDj'}).get_text(strip=True)
-                except (AttributeError, TypeError):
-                    continue
-
-                # 댓글 작성자가 포스트 주인이 아닌 경우에만 정보를 파싱한다
-                if not writer == self.user:
-                    commenter = writer
-                    comment_text = comment.find('span').get_text()
-                    comment_date = comment.find('time', {'class': 'FH9sR Nzb55'})['datetime'][:19].replace('T', ' ')
-                    publishedAtTimestamp = int(
-                        time.mktime(datetime.strptime(comment_date, "%Y-%m-%d %H:%M:%S").timetuple()))
-                    comments.append({
-                        'username': commenter,
-                        'commentText': comment_text,
-                        'publishedAt': comment_date,
-                        'publishedAtTimestamp': publishedAtTimestamp
-                    })
-
-        # 해쉬태그 정보를 파싱한다
-        unclean_hashtags_list = soup.select('div.C4VMK > span > a.xil3i')
-        hashtags = [tags.get_text(strip=True).replace('#', '') for tags in unclean_hashtags_list]
+        for commenter, comment_text, comment_date in parsed['comments']:
+            comment_date = comment_date[:19].replace('T', ' ')
+            publishedAtTimestamp = int(
+                time.mktime(datetime.strptime(comment_date, "%Y-%m-%d %H:%M:%S").timetuple()))
+            comments.append({
+                'username': commenter,
+                'commentText': comment_text,
+                'publishedAt': comment_date,
+                'publishedAtTimestamp': publishedAtTimestamp
+            })
+
+        hashtags = parsed['hashtags']
 
         # 포스트 작성시간을 파싱한다
-        date = soup.select_one('time._1o9PC.Nzb55')['datetime'][:19].replace('T', ' ')
+        date = parsed['date'][:19].replace('T', ' ')
         # 포스트 작성시간이 MAX_CRAWL_DATE(30일) 이내인 것만 파싱한다
-        x_days_ago = (self.CRAWL_DATE - timedelta(days=self.MAX_CRAWL_DATE)).strftime("%Y-%m-%d %H:%M:%S")
-
         date_timestamp = int(time.mktime(datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timetuple()))
-        x_days_ago_timestamp = int(time.mktime(datetime.strptime(x_days_ago, "%Y-%m-%d %H:%M:%S").timetuple()))
+        x_days_ago_timestamp = self.crawl_since()
 
         if date_timestamp < x_days_ago_timestamp:
             raise ValueError('post created at over 30 days')
 
         # 포스트의 좋아요 수를 파싱한다
-        try:
-            like = soup.select_one('div.Nm9Fw > button > span').get_text()
-        except AttributeError:
+        like = parsed['like']
+        if like is None:
             # 동영상의 경우 '조회' 를 선택하여야 좋아요 개수가 보인다
-            try:
-                show_like = driver.find_element_by_css_selector('div.HbPOm._9Ytll > span.vcOH2')
-                show_like.click()
+            with metrics.timer('like_click', proxy) as like_click:
                 try:
-                    show_like_count = WebDriverWait(driver, 15).until(
-                        expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.vJRqr > span'))
-                    )
-                except TimeoutException:
-                    raise TimeoutException('parse_content(): content like parsed timed out')
-            except:
-                like = 0
-            else:
-                like = show_like_count.text.replace(',', '')
-                try:
-                    like_on_load = WebDriverWait(driver, 15).until(
-                        expected_conditions.presence_of_element_located((By.CLASS_NAME, 'QhbhU'))
-                    )
-                except TimeoutException:
-                    raise TimeoutException('parse_content(): like load to closed timed out')
+                    show_like = driver.find_element_by_css_selector('div.HbPOm._9Ytll > span.vcOH2')
+                    show_like.click()
+                    try:
+                        show_like_count = wait_ready(driver, 'div.vJRqr > span', 15, 'like')
+                    except TimeoutException:
+                        raise TimeoutException('parse_content(): content like parsed timed out')
+                except:
+                    like = 0
+                    like_click.outcome = 'hidden'
                 else:
-                    like_on_load.click()
+                    like = show_like_count.text.replace(',', '')
+                    try:
+                        like_on_load = wait_ready(driver, '.QhbhU', 15, 'like_close')
+                    except TimeoutException:
+                        raise TimeoutException('parse_content(): like load to closed timed out')
+                    else:
+                        like_on_load.click()
 
         else:
             like = like.replace(',', '')
@@ -275,8 +315,10 @@ class InstagramCrawler:
         crawlAt = self.CRAWL_DATE.strftime('%Y-%m-%d %H:%M:%S')
         crawlAtTimestamp = int(time.mktime(datetime.strptime(crawlAt, "%Y-%m-%d %H:%M:%S").timetuple()))
 
-        # 댓글을 작성 시간순으로 정렬한다
+        # 댓글을 작성 시간순으로 정렬하고, 댓글마다 저장 여부를 확인하기 위한 hash 를 추가한다
         comments.sort(key=itemgetter('publishedAt'), reverse=True)
+        for comment in comments:
+            comment['commentHash'] = comment_hash(comment, f'{self.user}_{date_timestamp}')
 
         data = {
             '_id': f'{self.user}_{date_timestamp}',
@@ -300,19 +342,19 @@ class InstagramCrawler:
         :param driver: selenium webdriver instance
         :return: None
         """
+        # 다음 포스트의 본문이 아닌 지금 포스트의 본문을 찾지 않도록, 지금 포스트의 작성시간이 바뀔 때까지 기다린다
+        previous = post_time(driver)
         # 다음 페이지로 넘아가기 위해, 페이지 넘기기 위치를 클릭한다
         try:
             right = driver.find_element_by_css_selector('a._65Bje.coreSpriteRightPaginationArrow')
         except NoSuchElementException:
             try:
-                WebDriverWait(driver, 15).until(
-                    expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.Igw0E > button.wpO6b'))
-                )
+                close = wait_ready(driver, 'div.Igw0E > button.wpO6b', 15, 'close_button')
             except TimeoutException:
                 raise TimeoutException('next_page(): Timed out waiting for close button to load')
             else:
                 # 열려 있는 포스트를 닫는다
-                driver.find_element_by_css_selector('div.Igw0E > button.wpO6b').click()
+                close.click()
                 # 포스트 리스트를 가져와서 '추천 계정' 다음 항목의 포스트를 선택하여 오픈한다
                 post_list = driver.find_elements_by_css_selector('div._9AhH0')
                 if len(post_list) >= 9:
@@ -324,13 +366,11 @@ class InstagramCrawler:
 
         try:
             # 다음 포스트의 본문 Tag가 로드될 때까지 기다린다
-            WebDriverWait(driver, 15).until(
-                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.C4VMK > span'))
-            )
+            wait_ready(driver, 'div.C4VMK > span', 15, 'next_post', previous)
         except TimeoutException:
             raise TimeoutException('next_page(): Timed out waiting for page to load')
         else:
-            time.sleep(uniform(0.3, 1))
+            rate_limiter().wait(getattr(driver, 'proxy_key', None))
             return None
 
     @staticmethod
@@ -340,16 +380,4 @@ class InstagramCrawler:
         * 비공개 또는 페이지를 찾을 수 없는 경우를 확인한다
         :return: bool
         """
-        soup = BeautifulSoup(html, 'lxml')
-
-        # 페이지를 찾을 수 없는 경우
-        if soup.select_one('div.error-container'):
-            return False
-        # 비공개 계정인 경우
-        elif soup.select_one('div.VIsJD'):
-            return False
-        # 게시물 없음인 경우
-        elif soup.select_one('div.FuWoR.-wdIA.A2kdl'):
-            return False
-        else:
-            return True
+        return parser.page_available(html)
@@ -0,0 +1,145 @@
+import logging
+from multiprocessing import current_process
+from multiprocessing.util import Finalize
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from config import DRIVER_POOL
+
+
+class DriverPool:
+    """
+    multiprocessing.Pool 의 worker 프로세스 하나가 소유하는 Selenium Driver Pool
+    유저마다 Chrome 을 새로 띄우지 않고, 상태를 초기화한 브라우저를 재사용한다
+    """
+    def __init__(self, max_uses: int = None):
+        self.max_uses = max_uses or DRIVER_POOL['MAX_USES']
+        self._driver = None
+        self._uses = 0
+        self.counters = {
+            'startups': 0,
+            'reuses': 0,
+            'recycles': 0,
+            'crashes': 0
+        }
+
+    def acquire(self, factory) -> webdriver.Chrome:
+        """
+        사용 가능한 브라우저를 반환한다
+        브라우저가 없거나, 최대 사용 횟수를 넘었거나, 응답이 없는 경우에는 새로 띄운다
+        :param factory: 새 브라우저를 생성하는 함수(ex. InstagramCrawler.driver)
+        :return: webdriver Instance
+        """
+        if self._driver is not None:
+            if self._uses >= self.max_uses:
+                self.counters['recycles'] += 1
+                self._quit()
+            elif not self._alive():
+                self.counters['crashes'] += 1
+                self._quit()
+
+        if self._driver is None:
+            self._driver = factory()
+            self._uses = 0
+            self.counters['startups'] += 1
+        else:
+            self.counters['reuses'] += 1
+
+        self._uses += 1
+        return self._driver
+
+    def release(self, driver: webdriver.Chrome, broken: bool = False) -> None:
+        """
+        유저 크롤링이 끝난 브라우저를 반납한다
+        다음 유저를 위해 쿠키, 탭, 페이지 이동 기록을 초기화하고, 실패하는 경우에는 브라우저를 종료한다
+        :param driver: webdriver Instance
+        :param broken: True 인 경우, 초기화 없이 브라우저를 종료한다
+        :return: None
+        """
+        if driver is not self._driver:
+            return
+
+        if broken:
+            self.counters['crashes'] += 1
+            self._quit()
+            return
+
+        try:
+            self._reset(driver)
+        except WebDriverException as e:
+            logging.warning(f'driver reset failed: {repr(e)}')
+            self.counters['crashes'] += 1
+            self._quit()
+
+    def shutdown(self) -> None:
+        """
+        worker 프로세스가 종료될 때, 브라우저를 종료하고 사용 통계를 로깅한다
+        :return: None
+        """
+        self._quit()
+        logging.info(f'{current_process().name} driver pool: {self.stats()}')
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+    def _alive(self) -> bool:
+        try:
+            self._driver.window_handles
+        except WebDriverException:
+            return False
+        return True
+
+    @staticmethod
+    def _reset(driver: webdriver.Chrome) -> None:
+        # 첫번째 탭을 제외한 나머지 탭을 닫는다
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+
+        # 쿠키는 현재 도메인 기준으로 삭제되므로, 페이지를 이동하기 전에 삭제한다
+        driver.delete_all_cookies()
+        try:
+            driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except WebDriverException:
+            pass
+        driver.get('about:blank')
+
+    def _quit(self) -> None:
+        if self._driver is None:
+            return
+        try:
+            self._driver.quit()
+        except WebDriverException:
+            pass
+        finally:
+            self._driver = None
+            self._uses = 0
+
+
+_driver_pool = None
+
+
+def init_driver_pool(max_uses: int = None) -> None:
+    """
+    multiprocessing.Pool 의 initializer 로 사용한다
+    worker 프로세스마다 Driver Pool 을 하나 생성하고, 프로세스 종료 시에 브라우저를 정리하도록 등록한다
+    :param max_uses: 브라우저 하나를 재사용할 최대 유저 수
+    :return: None
+    """
+    global _driver_pool
+    _driver_pool = DriverPool(max_uses)
+    Finalize(_driver_pool, _driver_pool.shutdown, exitpriority=10)
+
+
+def driver_pool() -> DriverPool:
+    """
+    현재 프로세스의 Driver Pool 을 반환한다
+    initializer 없이 호출된 경우(ex. 단일 프로세스 실행)에는 새로 생성한다
+    :return: DriverPool
+    """
+    if _driver_pool is None:
+        init_driver_pool()
+    return _driver_pool
@@ -2,34 +2,108 @@ import re
 import emoji
 
 
+def _trie_pattern(words) -> str:
+    """
+    문자열 목록을 trie 형태의 정규식으로 만든다
+    emoji 를 하나씩 나열한 alternation 은 위치마다 모든 emoji 를 비교하지만,
+    trie 정규식은 첫 글자가 같은 emoji 만 비교한다
+    하위 문자열이 있는 경우에는 greedy 하게 긴 emoji 부터 확인하므로, 길이순으로 나열한 alternation 과 같은 결과를 반환한다
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        end = '' in node
+        leaves = []
+        branches = []
+        for char in sorted(char for char in node if char):
+            child = node[char]
+            if list(child) == ['']:
+                leaves.append(re.escape(char))
+            else:
+                branches.append(re.escape(char) + build(child))
+        if len(leaves) == 1:
+            branches.append(leaves[0])
+        elif leaves:
+            branches.append(f'[{"".join(leaves)}]')
+
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 and not end else f'(?:{"|".join(branches)})'
+        if end:
+            pattern += '?'
+        return pattern
+
+    return build(trie)
+
+
+def _char_class(chars) -> str:
+    """
+    문자 목록을 연속된 code point 끼리 묶은 문자 class 로 만든다
+    BMP 밖의 문자는 sre 에서 bitmap 으로 만들 수 없어 항목을 하나씩 비교하므로, 범위로 묶어서 비교 횟수를 줄인다
+    """
+    ranges = []
+    for code in sorted({ord(char) for char in chars}):
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return '[' + ''.join(re.escape(chr(first)) if first == last else f'{re.escape(chr(first))}-{re.escape(chr(last))}'
+                         for first, last in ranges) + ']'
+
+
+# 모든 정규식은 import 시점에 한 번만 컴파일한다
+_EMOJIS = tuple(emoji.unicode_codes.EMOJI_UNICODE.values())
+_EMOJI = _trie_pattern(_EMOJIS)
+# emoji 와 emoji 로 되어있는 공백(\u2800)에 사용되는 문자가 연속된 구간만 찾아서, 그 구간 안에서만 emoji 를 비교한다
+# emoji 는 모두 이 문자들로만 되어있으므로, 구간 밖에서 시작하거나 구간을 넘어가는 emoji 는 없다
+_CANDIDATE_RE = re.compile(_char_class(''.join(_EMOJIS) + '\u2800') + '+')
+# 공백 사이의 emoji 는 삭제된 다음 공백끼리 합쳐지므로, emoji 가 섞여있는 공백을 하나의 공백으로 바꾼다
+_STRIP_RE = re.compile(f'(\u2800(?:\u2800|{_EMOJI})*)|{_EMOJI}')
+_REMOVE_RE = re.compile("["
+                        u"\U00010000-\U0010ffff"
+                        u"\ud800-\udfff"
+                        u"\u200d"
+                        u"\u2640-\u2642"
+                        u"\u2600-\u2B55"
+                        u"\u23cf"
+                        u"\u23e9"
+                        u"\u231a"
+                        u"\u3030"
+                        u"\ufe0f"
+                        "]+", flags=re.UNICODE)
+
+
+def _blank(match) -> str:
+    return ' ' if match.group(1) else ''
+
+
+def _strip_candidate(match) -> str:
+    return _STRIP_RE.sub(_blank, match.group())
+
+
 def strip_emoji(text):
-    # emoji 삭제
-    new_text = re.sub(emoji.get_emoji_regexp(), r'', text)
-    # emoji 로 되어있는 공백/띄어쓰기 없애기
-    emoji_pattern = re.compile("["
-                               u"\u2800"
-                               "]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r' ', new_text).strip()
+    # emoji 를 삭제하고, emoji 로 되어있는 공백/띄어쓰기를 띄어쓰기로 바꾼다
+    return _CANDIDATE_RE.sub(_strip_candidate, text).strip()
 
 
-def remove_emoji(string):
-    # 첫번째 emoji 패턴으로 문장내 emoji 삭제
-    NON_BMP_RE = re.compile(u"[^\U00000000-\U0000d7ff\U0000e000-\U0000ffff]", flags=re.UNICODE)
-    rem_emoji_text = NON_BMP_RE.sub(r'', string)
+def strip_many(texts) -> list:
+    """
+    여러 문자열(ex. 댓글, 포스트 본문 목록)의 emoji 를 한번에 삭제한다
+    :param texts: 문자열 iterable
+    :return: strip_emoji 를 적용한 문자열 list
+    """
+    sub = _CANDIDATE_RE.sub
+    return [sub(_strip_candidate, text).strip() for text in texts]
 
-    # 두번째 emoji 패턴으로 문장내 emoji 삭제
-    emoji_pattern = re.compile("["
-                               u"\u200d"
-                               u"\u2640-\u2642"
-                               u"\u2600-\u2B55"
-                               u"\u23cf"
-                               u"\u23e9"
-                               u"\u231a"
-                               u"\u3030"
-                               u"\ufe0f"
-                               "]+", flags=re.UNICODE)
 
-    return emoji_pattern.sub(r'', rem_emoji_text)
+def remove_emoji(string):
+    # BMP 밖의 문자(emoji)와 BMP 안의 emoji 기호를 한번에 삭제한다
+    return _REMOVE_RE.sub(r'', string)
 
 
 """
@@ -39,4 +113,4 @@ for i in range(0x2600, 0x2B55):
     emoji = f'\\u{number}'
     emoji_pattern = re.compile(f"[u{emoji}]+", flags=re.UNICODE)
     print(emoji,' : ', emoji_pattern.sub(r'', text))
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,24 @@
+from threading import BoundedSemaphore
+
+
+class BoundedFeed:
+    """
+    multiprocessing.Pool 에 작업을 필요한 만큼만 전달하기 위한 iterator
+    Pool.imap 은 전달받은 iterable 을 별도의 thread 에서 끝까지 읽어 작업 queue 에 넣으므로,
+    처리가 끝나지 않은 작업이 size 개를 넘지 않도록 done() 이 호출될 때까지 다음 항목을 읽지 않는다
+    """
+    def __init__(self, iterable, size: int):
+        self.iterable = iterable
+        self._slots = BoundedSemaphore(size)
+
+    def __iter__(self):
+        for item in self.iterable:
+            self._slots.acquire()
+            yield item
+
+    def done(self) -> None:
+        """
+        작업 하나가 끝난 경우에 호출한다
+        :return: None
+        """
+        self._slots.release()
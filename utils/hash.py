@@ -15,3 +15,19 @@ def generator_chash(article_comment: dict, _id: str) -> hashlib.md5:
     sha256.update(hash_str.encode())
 
     return sha256.hexdigest()
+
+
+def comment_hash(comment: dict, _id: str) -> str:
+    """
+    포스트 댓글의 hash 를 생성하여 반환한다, 저장된 포스트에서 이미 저장된 댓글을 찾기 위해 사용한다
+    댓글 내용은 크롤링 방식(Selenium, JSON)마다 emoji, 공백, 멘션 링크가 다르게 파싱되므로 사용하지 않으며,
+    _id + created_at + userId 로 sha256 hash 값을 생성한다(generator_chash 에서 내용을 뺀 것과 같다)
+    :param comment: parse_content 의 댓글 정보({'username', 'publishedAtTimestamp', ...})
+    :param _id: 포스트 '_id'
+    :return: hex digest
+    """
+    return generator_chash({
+        'publishedAtTimestamp': comment['publishedAtTimestamp'],
+        'userName': comment['username'],
+        'contentText': ''
+    }, _id)
@@ -0,0 +1,338 @@
+import json
+import re
+import time
+from datetime import datetime
+from operator import itemgetter
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from utils.crawler import InstagramCrawler
+from utils.emoji_text import strip_emoji
+from utils.hash import comment_hash
+from utils.metrics import stage_metrics
+from utils.rate_limit import rate_limiter
+from utils.user_agent import user_agent_pool
+
+# 페이지에 포함된 JSON 을 찾기 위한 정규식
+SHARED_DATA_RE = re.compile(r'window\._sharedData\s*=\s*(\{.+?\});\s*</script>', re.DOTALL)
+ADDITIONAL_DATA_RE = re.compile(r'window\.__additionalDataLoaded\([^,]*,\s*(\{.+?\})\);\s*</script>', re.DOTALL)
+HASHTAG_RE = re.compile(r'#(\w+)', re.UNICODE)
+
+# proxy 별로 하나의 requests.Session 을 만들어 프로세스 안에서 재사용한다
+_sessions = {}
+
+
+class JSONExtractError(Exception):
+    """
+    페이지에서 JSON 을 찾을 수 없거나, JSON 의 구조가 예상과 다른 경우에 발생한다
+    """
+    pass
+
+
+class InstagramHttpCrawler(InstagramCrawler):
+    """
+    Selenium 없이 HTTP 요청으로 유저 페이지와 포스트 페이지를 가져와서,
+    페이지에 포함된 JSON 으로 InstagramCrawler 와 같은 형식의 유저/포스트 정보를 만든다
+    """
+    def __init__(self, username: str = None, base_url: str = None, post_url: str = None, use_proxy: bool = True):
+        super().__init__(username)
+        self.base_url = base_url or config.BASE_URL
+        self.post_url = post_url or config.HTTP_CRAWL['POST_URL']
+        self.use_proxy = use_proxy
+        self.proxy_url = None
+        self.proxy_key = None
+        self._session = None
+
+    def session(self) -> requests.Session:
+        """
+        proxy 별로 재사용하는 requests.Session 을 반환한다
+        같은 proxy 를 사용하는 경우에는 connection pool 과 User-Agent 를 그대로 사용하며,
+        한 유저를 크롤링하는 동안에는 같은 proxy 를 사용한다
+        :return: requests.Session
+        """
+        if self._session is not None:
+            return self._session
+
+        if self.use_proxy:
+            proxies = self.proxy.get()
+            self.proxy_key = self.proxy.key(proxies)
+            proxy_url = f'{proxies["protocol"]}://{proxies["user"]}:{proxies["password"]}' \
+                        f'@{proxies["ip"]}:{proxies["port"]}'
+        else:
+            proxy_url = None
+
+        session = _sessions.get(proxy_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_CRAWL['POOL_SIZE'],
+                                  pool_maxsize=config.HTTP_CRAWL['POOL_SIZE'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'User-Agent': user_agent_pool().for_proxy(self.proxy_key),
+                'Accept-Language': 'ko-KR,ko;q=0.9'
+            })
+            if proxy_url:
+                session.proxies = {'http': proxy_url, 'https': proxy_url}
+            _sessions[proxy_url] = session
+
+        self.proxy_url = proxy_url
+        self._session = session
+        return session
+
+    def _get(self, url: str) -> str:
+        session = self.session()
+        start = time.time()
+        try:
+            res = session.get(url, timeout=config.HTTP_CRAWL['TIMEOUT'])
+            res.raise_for_status()
+        except requests.RequestException as e:
+            stage_metrics().observe('http_get', time.time() - start, self.proxy_key, type(e).__name__)
+            status = getattr(e.response, 'status_code', None)
+            # 연결 실패, timeout, 429, 5xx 만 proxy 의 실패로 기록한다(404 등 유저 페이지의 문제는 기록하지 않는다)
+            if self.proxy_key and (isinstance(e, (requests.ConnectionError, requests.Timeout)) or
+                                   status == 429 or (status or 0) >= 500):
+                self.proxy.record_failure(self.proxy_key)
+            # 429 Too Many Requests 인 경우, proxy 와 host 의 요청 간격을 늘린다
+            if status == 429:
+                rate_limiter().backoff(self.proxy_key, urlparse(url).netloc)
+            raise
+        stage_metrics().observe('http_get', time.time() - start, self.proxy_key)
+        if self.proxy_key:
+            self.proxy.record_success(self.proxy_key, time.time() - start)
+        return res.text
+
+    @staticmethod
+    def extract_json(html: str, pattern=SHARED_DATA_RE) -> dict:
+        """
+        페이지에 포함된 window._sharedData 또는 window.__additionalDataLoaded 의 JSON 을 반환한다
+        :param html: page source
+        :param pattern: JSON 을 찾기 위한 정규식
+        :return: dict
+        """
+        found = pattern.search(html)
+        if not found:
+            raise JSONExtractError('extract_json(): page JSON not found')
+        try:
+            return json.loads(found.group(1))
+        except ValueError as e:
+            raise JSONExtractError(f'extract_json(): {repr(e)}')
+
+    @staticmethod
+    def _to_date(timestamp: int) -> (str, int):
+        # Selenium 에서 파싱하는 datetime 속성과 같이 UTC 기준 문자열과 타임스탬프를 만든다
+        date = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        return date, int(time.mktime(datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timetuple()))
+
+    def _crawl_at(self) -> (str, int):
+        crawlAt = self.CRAWL_DATE.strftime('%Y-%m-%d %H:%M:%S')
+        crawlAtTimestamp = int(time.mktime(datetime.strptime(crawlAt, "%Y-%m-%d %H:%M:%S").timetuple()))
+        return crawlAt, crawlAtTimestamp
+
+    def fetch_user(self) -> dict:
+        """
+        유저 페이지의 JSON 에서 유저 정보를 가져온다
+        :return: graphql user(dict)
+        """
+        data = self.extract_json(self._get(self.url()))
+        try:
+            user = data['entry_data']['ProfilePage'][0]['graphql']['user']
+        except (KeyError, IndexError, TypeError):
+            # 로그인 페이지로 이동되었거나, 페이지 구조가 바뀐 경우이다
+            if self.proxy_key and 'LoginAndSignupPage' in (data.get('entry_data') or {}):
+                self.proxy.record_block(self.proxy_key)
+                rate_limiter().backoff(self.proxy_key, urlparse(self.url()).netloc)
+            raise JSONExtractError('fetch_user(): ProfilePage not found')
+
+        return user
+
+    @staticmethod
+    def page_available(user: dict) -> bool:
+        """
+        InstagramCrawler.page_available 와 같이 인스타그램 유저의 페이지가 크롤링 할 수 있는지 확인한다
+        * 비공개 또는 게시물이 없는 경우를 확인한다(페이지를 찾을 수 없는 경우는 404 로 요청이 실패한다)
+        :param user: graphql user(dict)
+        :return: bool
+        """
+        try:
+            return not user.get('is_private') and bool(user['edge_owner_to_timeline_media']['count'])
+        except (KeyError, TypeError):
+            raise JSONExtractError('page_available(): timeline media not found')
+
+    def parse_user_info(self, user: dict) -> dict:
+        """
+        InstagramCrawler.parse_user_info 와 같은 형식의 유저 정보를 반환한다
+        :param user: graphql user(dict)
+        :return: user page info(dict)
+        """
+        try:
+            post_count = str(user['edge_owner_to_timeline_media']['count'])
+            follower = str(user['edge_followed_by']['count'])
+            follow = str(user['edge_follow']['count'])
+        except (KeyError, TypeError):
+            raise JSONExtractError('parse_user_info(): count info not found')
+
+        title = (user.get('full_name') or '').strip()
+        description = user.get('biography') or ''
+        if title or description:
+            user_description = f'{title}\n{description}'
+        else:
+            user_description = ''
+
+        crawlAt, crawlAtTimestamp = self._crawl_at()
+
+        return {
+            '_id': self.user,
+            'userName': self.user,
+            'postCount': post_count,
+            'followerCount': follower,
+            'followingCount': follow,
+            'userDescription': user_description,
+            'VerifiedBadge': bool(user.get('is_verified')),
+            'crawlAtTimestamp': crawlAtTimestamp,
+            'crawlAt': crawlAt
+        }
+
+    def fetch_content(self, shortcode: str) -> dict:
+        """
+        포스트 페이지의 JSON 에서 포스트 정보를 가져온다
+        :param shortcode: 포스트 주소의 shortcode
+        :return: graphql shortcode_media(dict)
+        """
+        html = self._get(self.post_url.format(shortcode=shortcode))
+        try:
+            # 포스트 정보는 __additionalDataLoaded 로 전달되거나, _sharedData 의 PostPage 에 포함된다
+            if ADDITIONAL_DATA_RE.search(html):
+                return self.extract_json(html, ADDITIONAL_DATA_RE)['graphql']['shortcode_media']
+            return self.extract_json(html)['entry_data']['PostPage'][0]['graphql']['shortcode_media']
+        except (KeyError, IndexError, TypeError):
+            raise JSONExtractError(f'fetch_content(): PostPage not found. shortcode: {shortcode}')
+
+    def parse_content(self, media: dict) -> dict:
+        """
+        InstagramCrawler.parse_content 와 같은 형식의 포스트 정보를 반환한다
+        :param media: graphql shortcode_media(dict)
+        :return: post and comment data(dict)
+        """
+        # JSON 의 구조가 바뀐 경우에는 Selenium 으로 다시 크롤링하도록 JSONExtractError 를 발생시킨다
+        try:
+            caption_edges = media['edge_media_to_caption']['edges']
+            taken_at = media['taken_at_timestamp']
+            like_count = str((media.get('edge_media_preview_like') or media['edge_liked_by'])['count'])
+            comment_edges = (media.get('edge_media_to_parent_comment') or media['edge_media_to_comment'])['edges']
+
+            # 포스트 본문 내용에 포함된 emoji를 제거한다
+            caption = caption_edges[0]['node']['text'] if caption_edges else ''
+            content = strip_emoji(caption) if caption_edges else ''
+
+            # 포스트의 댓글 내용들을 파싱한다
+            # 댓글 작성자가 포스트 주인이 아닌 경우에만 정보를 파싱한다
+            comments = []
+            for edge in comment_edges:
+                node = edge['node']
+                commenter = node['owner']['username']
+                if commenter == self.user:
+                    continue
+                comment_date, publishedAtTimestamp = self._to_date(node['created_at'])
+                comments.append({
+                    'username': commenter,
+                    'commentText': node['text'],
+                    'publishedAt': comment_date,
+                    'publishedAtTimestamp': publishedAtTimestamp
+                })
+            date, date_timestamp = self._to_date(taken_at)
+        except (KeyError, IndexError, TypeError) as e:
+            raise JSONExtractError(f'parse_content(): media info not found. {repr(e)}')
+
+        # 해쉬태그 정보를 파싱한다
+        hashtags = HASHTAG_RE.findall(caption)
+
+        # 포스트 작성시간이 MAX_CRAWL_DATE(30일) 이내인 것만 파싱한다
+
+        if date_timestamp < self.crawl_since():
+            raise ValueError('post created at over 30 days')
+
+        crawlAt, crawlAtTimestamp = self._crawl_at()
+
+        # 댓글을 작성 시간순으로 정렬하고, 댓글마다 저장 여부를 확인하기 위한 hash 를 추가한다
+        comments.sort(key=itemgetter('publishedAt'), reverse=True)
+        for comment in comments:
+            comment['commentHash'] = comment_hash(comment, f'{self.user}_{date_timestamp}')
+
+        return {
+            '_id': f'{self.user}_{date_timestamp}',
+            'userName': self.user,
+            'contentText': content,
+            'publishedAtTimestamp': date_timestamp,
+            'publishedAt': date,
+            'crawlAtTimestamp': crawlAtTimestamp,
+            'crawlAt': crawlAt,
+            'likeCount': like_count,
+            'hashtags': hashtags,
+            'comments': comments
+        }
+
+    def timeline(self, user: dict) -> (list, bool):
+        """
+        유저 페이지의 JSON 에 포함된 최신 포스트 목록과 다음 페이지 여부를 반환한다
+        포스트 페이지를 요청하지 않아도 저장 여부를 확인할 수 있도록 포스트의 '_id' 를 함께 반환한다
+        :param user: graphql user(dict)
+        :return: ([(shortcode, post '_id'), ...], has_next_page)
+        """
+        try:
+            timeline = user['edge_owner_to_timeline_media']
+            shortcodes = [
+                (edge['node']['shortcode'], f'{self.user}_{self._to_date(edge["node"]["taken_at_timestamp"])[1]}')
+                for edge in timeline['edges']
+            ]
+            has_next_page = timeline['page_info']['has_next_page']
+        except (KeyError, TypeError):
+            raise JSONExtractError('timeline(): timeline media not found')
+
+        return shortcodes, has_next_page
+
+    def crawl(self, known_posts=None, state: dict = None) -> (dict, list):
+        """
+        유저 정보와 30일 이내의 포스트 정보를 모두 가져온 다음에 반환한다
+        중간에 JSON 을 찾을 수 없는 경우 JSONExtractError 를 발생시키며, 이 경우 저장된 정보는 없다
+        :param known_posts: 이미 저장된 포스트 '_id' 목록, 저장된 포스트를 만나면 이후의 포스트는 가져오지 않는다
+        :param state: 이전 크롤링 상태(CrawlStateStore), 포스트 수가 같으면 포스트를 가져오지 않으며
+                      이전에 가져온 가장 최신 포스트의 작성시간 이전의 포스트는 가져오지 않는다
+        :return: (user page info, post data list), 비공개 또는 게시물이 없는 페이지인 경우 (None, [])
+        """
+        user = self.fetch_user()
+        # Selenium 으로 크롤링하는 경우와 같이, 크롤링 할 수 없는 페이지는 유저 정보도 저장하지 않는다
+        if not self.page_available(user):
+            return None, []
+        page_info = self.parse_user_info(user)
+        shortcodes, has_next_page = self.timeline(user)
+
+        watermark = None
+        if state is not None:
+            if state['postCount'] == page_info['postCount']:
+                return page_info, []
+            watermark = state['newestPostTimestamp']
+
+        posts = []
+        for shortcode, post_id in shortcodes:
+            if known_posts is not None and post_id in known_posts:
+                return page_info, posts
+            if watermark is not None and int(post_id.rsplit('_', 1)[1]) <= watermark:
+                return page_info, posts
+            # 여러 프로세스가 같은 proxy 로 포스트 페이지를 몰아서 요청하지 않도록 기다린다
+            rate_limiter().wait(self.proxy_key, urlparse(self.post_url).netloc)
+            try:
+                posts.append(self.parse_content(self.fetch_content(shortcode)))
+            except ValueError:
+                # 30일이 지난 포스트인 경우, 이후의 포스트는 가져오지 않는다
+                return page_info, posts
+
+        # 유저 페이지의 JSON 에는 최신 포스트 일부만 포함되어 있다
+        # 30일 이내의 포스트가 더 남아있는 경우에는 Selenium 으로 전체를 크롤링하도록 한다
+        if has_next_page:
+            raise JSONExtractError(f'crawl(): more than {len(shortcodes)} posts in {self.MAX_CRAWL_DATE} days')
+
+        return page_info, posts
@@ -1,14 +1,100 @@
 import os
 import json
 import logging.config
+import logging.handlers
+import random
+from multiprocessing import Queue, current_process
+from multiprocessing.util import Finalize
 
-from telegram import Bot
-from config import LOG_CFG, LOG_FILENAME, TELEGRAM_CHAT_ID, TELEGRAM_TOKEN
+from config import LOG, LOG_CFG, LOG_FILENAME
+from utils.alert import alert_dispatcher
+
+# main 프로세스에서 worker 프로세스의 로그를 받아서 저장하는 listener
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    로그를 한 줄의 JSON 으로 만든다
+    PayloadFilter 가 요약한 dict 메시지는 'payload' 필드에 그대로 저장한다
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'func': record.funcName,
+            'message': record.getMessage()
+        }
+        payload = getattr(record, 'payload', None)
+        if payload is not None:
+            data['payload'] = payload
+            data['sampled'] = record.sampled
+            del data['message']
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class PayloadFilter(logging.Filter):
+    """
+    dict 로그 메시지(ex. logging.info(data))를 로그를 남기는 프로세스에서 요약한다
+    PAYLOAD_SAMPLE_RATE 비율의 메시지만 전체를 남기며, 나머지는 list 는 길이로, 긴 문자열은 앞부분만 남긴다
+    """
+    def __init__(self, sample_rate: float = None, max_length: int = None):
+        super().__init__()
+        self.sample_rate = LOG['PAYLOAD_SAMPLE_RATE'] if sample_rate is None else sample_rate
+        self.max_length = max_length or LOG['MAX_VALUE_LENGTH']
+
+    def summarize(self, payload: dict) -> dict:
+        summary = {}
+        for key, value in payload.items():
+            if isinstance(value, (list, tuple, dict)):
+                summary[key] = f'<{len(value)} items>'
+            elif isinstance(value, str) and len(value) > self.max_length:
+                summary[key] = f'{value[:self.max_length]}...<{len(value)} chars>'
+            else:
+                summary[key] = value
+        return summary
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, dict) and not record.args:
+            record.sampled = random.random() < self.sample_rate
+            record.payload = record.msg if record.sampled else self.summarize(record.msg)
+            record.msg = record.payload
+        return True
+
+
+def _start_listener() -> None:
+    """
+    root logger 의 handler 를 listener 로 옮기고, root logger 는 queue 에만 로그를 보내도록 한다
+    fork 된 worker 프로세스는 같은 queue 를 사용하므로, 파일에는 main 프로세스만 저장한다
+    """
+    global _listener
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    queue = Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(queue)
+    queue_handler.addFilter(PayloadFilter())
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # alert 발송(exitpriority=20)의 로그까지 저장한 다음, queue 가 닫히기(exitpriority=10) 전에 listener 를 종료한다
+    Finalize(_listener, _listener.stop, exitpriority=15)
 
 
 def custom_logger(default_level='INFO'):
     path = LOG_CFG
 
+    # listener 가 이미 실행 중인 경우(ex. 여러 모듈에서 호출)에는 다시 설정하지 않는다
+    if _listener is not None:
+        return logging
+
     log_level = default_level
     if os.path.exists(path):
         with open(path, 'rt') as f:
@@ -19,15 +105,23 @@ def custom_logger(default_level='INFO'):
     else:
         logging.basicConfig(level=log_level)
 
+    if current_process().name == 'MainProcess':
+        # worker 프로세스를 fork 하기 전에 만들어서, 모든 프로세스의 alert 를 main 프로세스의 dispatcher 하나가 발송하도록 한다
+        alert_dispatcher()
+    if LOG['QUEUE'] and current_process().name == 'MainProcess':
+        _start_listener()
+    else:
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(PayloadFilter())
+
     return logging
 
 
 def send_error(message: str) -> None:
     """
     텔레그램으로 에러 메시지를 발송한다
+    메시지는 background thread 에서 같은 에러끼리 묶어서 발송하므로, 발송을 기다리지 않는다
     :param message: Error message
     :return: None
     """
-
-    bot = Bot(token=TELEGRAM_TOKEN)
-    bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+    alert_dispatcher().submit(message)
@@ -0,0 +1,222 @@
+import glob
+import json
+import os
+import random
+import threading
+import time
+from multiprocessing.util import Finalize
+
+from config import METRICS
+
+# 기록하는 단계 이름
+# driver_start: 브라우저 실행, page_load: 유저 페이지 로딩, popup: 로그인 팝업 닫기, first_post: 첫번째 포스트 열기,
+# parse: 포스트 파싱(좋아요 클릭 포함), html_parse: HTML 파싱, like_click: 동영상 좋아요 수 확인, next_page: 다음 포스트 이동,
+# rate_wait: rate limit 대기(outcome 'backoff' 는 rate 를 줄인 경우), http_get: HTTP 요청, db_write: MongoDB bulk_write,
+# ready_{name}: 페이지 준비 대기(outcome '{mode}:{state}', ex. 'observer:ready', 'polling:timeout'), user: 유저 한 명 전체
+OK = 'ok'
+
+
+class StageTimer:
+    """
+    with 문 안의 실행 시간을 기록한다
+    예외가 발생한 경우에는 outcome 을 예외 이름으로 기록하며, 예외는 그대로 발생시킨다
+    """
+    def __init__(self, metrics, stage: str, proxy: str = None, outcome: str = OK):
+        self.metrics = metrics
+        self.stage = stage
+        self.proxy = proxy
+        self.outcome = outcome
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        outcome = exc_type.__name__ if exc_type is not None else self.outcome
+        self.metrics.observe(self.stage, time.perf_counter() - self._start, self.proxy, outcome)
+        return False
+
+
+class StageMetrics:
+    """
+    프로세스별로 단계(stage), proxy, 결과(outcome)마다 실행 시간을 모은다
+    횟수와 합계는 모두 기록하며, percentile 계산을 위한 실행 시간은 MAX_SAMPLES 개까지 reservoir sampling 으로 남긴다
+    프로세스가 종료될 때 run 디렉토리에 저장하며, main 프로세스에서 export() 로 합쳐서 내보낸다
+    async 크롤링의 executor thread 에서도 기록하므로, 기록과 저장은 lock 안에서 한다
+    """
+    def __init__(self, run_id: str = None, path: str = None):
+        self.run_id = run_id or METRICS['RUN_ID']
+        self.run_path = os.path.join(path or METRICS['PATH'], self.run_id)
+        self.max_samples = METRICS['MAX_SAMPLES']
+        self.pid = os.getpid()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str, proxy: str = None) -> StageTimer:
+        return StageTimer(self, stage, proxy)
+
+    def observe(self, stage: str, seconds: float, proxy: str = None, outcome: str = OK) -> None:
+        """
+        단계의 실행 시간을 기록한다
+        :param stage: 단계 이름(ex. page_load)
+        :param seconds: 실행 시간(초)
+        :param proxy: 사용한 proxy(ex. ProxyManager.key())
+        :param outcome: 실행 결과(ex. 'ok', 'TimeoutException')
+        :return: None
+        """
+        key = (stage, proxy or '', outcome)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'samples': []}
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if len(stats['samples']) < self.max_samples:
+                stats['samples'].append(seconds)
+            else:
+                index = random.randrange(stats['count'])
+                if index < self.max_samples:
+                    stats['samples'][index] = seconds
+
+    def dump(self) -> None:
+        """
+        지금까지 모은 기록을 run 디렉토리에 프로세스별 파일로 저장하고 비운다
+        :return: None
+        """
+        with self._lock:
+            current, self._stats = self._stats, {}
+        if not current:
+            return
+        os.makedirs(self.run_path, exist_ok=True)
+        filename = os.path.join(self.run_path, f'samples-{self.pid}-{time.time():.6f}.json')
+        rows = [dict(stats, stage=stage, proxy=proxy, outcome=outcome)
+                for (stage, proxy, outcome), stats in current.items()]
+        with open(f'{filename}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(rows, f)
+        os.replace(f'{filename}.tmp', filename)
+
+    def _load(self) -> dict:
+        merged = {}
+        for filename in glob.glob(os.path.join(self.run_path, 'samples-*.json')):
+            with open(filename, encoding='utf-8') as f:
+                rows = json.load(f)
+            for row in rows:
+                key = (row['stage'], row['proxy'], row['outcome'])
+                stats = merged.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0, 'samples': []})
+                stats['count'] += row['count']
+                stats['sum'] += row['sum']
+                stats['max'] = max(stats['max'], row['max'])
+                stats['samples'].extend(row['samples'])
+        return merged
+
+    @staticmethod
+    def _summary(stats: list) -> dict:
+        count = sum(stat['count'] for stat in stats)
+        total = sum(stat['sum'] for stat in stats)
+        samples = sorted(sample for stat in stats for sample in stat['samples'])
+        summary = {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else 0.0,
+            'max': round(max(stat['max'] for stat in stats), 6)
+        }
+        for quantile in METRICS['QUANTILES']:
+            summary[f'p{int(quantile * 100)}'] = round(_percentile(samples, quantile), 6)
+        return summary
+
+    def export(self) -> dict:
+        """
+        모든 프로세스의 기록을 합쳐서 JSON 요약(summary.json)과 Prometheus text 파일(metrics.prom)로 저장한다
+        :return: JSON 요약(dict)
+        """
+        self.dump()
+        merged = self._load()
+
+        groups = {'stages': {}, 'by_proxy': {}, 'by_outcome': {}}
+        for (stage, proxy, outcome), stats in merged.items():
+            groups['stages'].setdefault(stage, []).append(stats)
+            groups['by_proxy'].setdefault(stage, {}).setdefault(proxy or 'none', []).append(stats)
+            groups['by_outcome'].setdefault(stage, {}).setdefault(outcome, []).append(stats)
+
+        summary = {
+            'run_id': self.run_id,
+            'stages': {stage: self._summary(stats) for stage, stats in groups['stages'].items()},
+            'by_proxy': {stage: {proxy: self._summary(stats) for proxy, stats in proxies.items()}
+                         for stage, proxies in groups['by_proxy'].items()},
+            'by_outcome': {stage: {outcome: self._summary(stats) for outcome, stats in outcomes.items()}
+                           for stage, outcomes in groups['by_outcome'].items()}
+        }
+
+        os.makedirs(self.run_path, exist_ok=True)
+        with open(os.path.join(self.run_path, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(self.run_path, 'metrics.prom.tmp'), 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(merged))
+        # node_exporter textfile collector 가 쓰는 도중의 파일을 읽지 않도록 rename 한다
+        os.replace(os.path.join(self.run_path, 'metrics.prom.tmp'), os.path.join(self.run_path, 'metrics.prom'))
+        return summary
+
+    def prometheus(self, merged: dict) -> str:
+        """
+        단계, proxy, 결과별 실행 시간을 Prometheus summary 형식의 text 로 반환한다
+        :param merged: _load() 로 합친 기록
+        :return: Prometheus text exposition format
+        """
+        name = f'{METRICS["PREFIX"]}_stage_seconds'
+        lines = [
+            f'# HELP {name} Duration of each crawl stage in seconds.',
+            f'# TYPE {name} summary'
+        ]
+        for (stage, proxy, outcome), stats in sorted(merged.items()):
+            labels = f'run_id="{self.run_id}",stage="{stage}",proxy="{proxy}",outcome="{outcome}"'
+            samples = sorted(stats['samples'])
+            for quantile in METRICS['QUANTILES']:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {_percentile(samples, quantile):.6f}')
+            lines.append(f'{name}_sum{{{labels}}} {stats["sum"]:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _percentile(samples: list, quantile: float) -> float:
+    # 정렬된 실행 시간에서 nearest-rank 방식으로 percentile 을 구한다
+    if not samples:
+        return 0.0
+    index = min(int(quantile * len(samples)), len(samples) - 1)
+    return samples[index]
+
+
+_stage_metrics = None
+
+
+def init_stage_metrics(path: str = None, run_id: str = None) -> StageMetrics:
+    """
+    현재 프로세스의 StageMetrics 를 path 에 저장하도록 새로 생성한다
+    benchmark 처럼 크롤링 결과(METRICS['PATH'])와 다른 곳에 저장하는 경우, 크롤러 함수를 실행하기 전에 호출한다
+    이후에 fork 된 worker 프로세스도 같은 path, run_id 에 저장한다
+    :param path: 기록을 저장할 경로, 기본값은 METRICS['PATH']
+    :param run_id: 기본값은 METRICS['RUN_ID']
+    :return: StageMetrics
+    """
+    global _stage_metrics
+    if _stage_metrics is not None and _stage_metrics.pid == os.getpid():
+        # 이전 경로에 기록한 내용은 이전 경로에 저장한다
+        _stage_metrics.dump()
+    _stage_metrics = StageMetrics(run_id, path)
+    Finalize(_stage_metrics, _stage_metrics.dump, exitpriority=20)
+    return _stage_metrics
+
+
+def stage_metrics() -> StageMetrics:
+    """
+    현재 프로세스의 StageMetrics 를 반환한다
+    처음 호출될 때 생성하며, 프로세스가 종료될 때 기록을 저장하도록 등록한다
+    fork 된 프로세스에서는 부모 프로세스와 같은 run 디렉토리에 저장하도록 새로 생성한다
+    :return: StageMetrics
+    """
+    if _stage_metrics is None:
+        init_stage_metrics()
+    elif _stage_metrics.pid != os.getpid():
+        init_stage_metrics(os.path.dirname(_stage_metrics.run_path), _stage_metrics.run_id)
+    return _stage_metrics
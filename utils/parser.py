@@ -0,0 +1,284 @@
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+class SoupParser:
+    """
+    BeautifulSoup(lxml) + soupsieve CSS selector 로 인스타그램 페이지를 파싱한다
+    LxmlParser 와 같은 결과를 반환하며, 파싱 결과 비교 및 fallback 용도로 사용한다
+    """
+    name = 'soup'
+
+    @staticmethod
+    def page_available(html: str) -> bool:
+        soup = BeautifulSoup(html, 'lxml')
+
+        # 페이지를 찾을 수 없는 경우
+        if soup.select_one('div.error-container'):
+            return False
+        # 비공개 계정인 경우
+        elif soup.select_one('div.VIsJD'):
+            return False
+        # 게시물 없음인 경우
+        elif soup.select_one('div.FuWoR.-wdIA.A2kdl'):
+            return False
+        else:
+            return True
+
+    @staticmethod
+    def has_login_popup(html: str) -> bool:
+        soup = BeautifulSoup(html, 'lxml')
+        return soup.select_one('button.dCJp8.afkep.xqRnw') is not None
+
+    @staticmethod
+    def user_info(html: str) -> dict:
+        soup = BeautifulSoup(html, 'lxml')
+
+        # 인증배지 여부를 파싱한다
+        if soup.select_one('span.mrEK_.Szr5J.coreSpriteVerifiedBadge'):
+            verified_badge = True
+        else:
+            verified_badge = False
+        # 포스트 수, 팔로워, 팔로잉 수를 파싱한다
+        count_info_li = soup.select_one('ul.k9GMp').find_all('li')
+        post_count = count_info_li[0].find('span').get_text(strip=True).replace(',', '')
+        follower = count_info_li[1].find('span')['title'].replace(',', '')
+        follow = count_info_li[2].find('span').get_text(strip=True).replace(',', '')
+
+        # 유저 설명 부분을 파싱한다
+        try:
+            title = soup.select_one('div.-vDIg > h1').get_text(strip=True)
+        except (AttributeError, TypeError):
+            title = ''
+        try:
+            description = soup.select_one('div.-vDIg > span').get_text()
+        except AttributeError:
+            description = ''
+
+        return {
+            'postCount': post_count,
+            'followerCount': follower,
+            'followingCount': follow,
+            'title': title,
+            'description': description,
+            'VerifiedBadge': verified_badge
+        }
+
+    @staticmethod
+    def content(html: str, username: str) -> dict:
+        soup = BeautifulSoup(html, 'lxml')
+
+        # 포스트 본문 내용을 파싱한다
+        try:
+            content = soup.select_one('div.C4VMK > span').get_text()
+        except:
+            content = None
+
+        # 포스트의 댓글 내용들을 파싱한다
+        # 댓글 작성자가 포스트 주인이 아닌 경우에만 (작성자, 내용, 작성시간)을 반환한다
+        comments = []
+        for comment in soup.select('div.C4VMK'):
+            try:
+                writer = comment.find('a', {'class': 'FPmhX notranslate TlrDj'}).get_text(strip=True)
+            except (AttributeError, TypeError):
+                continue
+
+            if not writer == username:
+                comment_text = comment.find('span').get_text()
+                comment_date = comment.find('time', {'class': 'FH9sR Nzb55'})['datetime']
+                comments.append((writer, comment_text, comment_date))
+
+        # 해쉬태그 정보를 파싱한다
+        unclean_hashtags_list = soup.select('div.C4VMK > span > a.xil3i')
+        hashtags = [tags.get_text(strip=True).replace('#', '') for tags in unclean_hashtags_list]
+
+        # 포스트 작성시간을 파싱한다
+        date = soup.select_one('time._1o9PC.Nzb55')['datetime']
+
+        # 포스트의 좋아요 수를 파싱한다, 동영상인 경우에는 None 을 반환한다
+        like = soup.select_one('div.Nm9Fw > button > span')
+        if like is not None:
+            like = like.get_text()
+
+        return {
+            'content': content,
+            'comments': comments,
+            'hashtags': hashtags,
+            'date': date,
+            'like': like
+        }
+
+
+def _has_class(*names) -> str:
+    # CSS 의 class selector(ex. div.C4VMK)와 같은 의미의 XPath 조건식을 만든다
+    return ' and '.join(f'contains(concat(" ", normalize-space(@class), " "), " {name} ")' for name in names)
+
+
+def _class_equals(value) -> str:
+    # BeautifulSoup 의 find(tag, {'class': 'a b c'}) 처럼 class 속성 전체가 일치하는 조건식을 만든다
+    return f'normalize-space(@class)="{value}"'
+
+
+# 모든 selector 는 import 시점에 한 번만 컴파일한다
+_ERROR_CONTAINER = etree.XPath(f'//div[{_has_class("error-container")}]')
+_PRIVATE_ACCOUNT = etree.XPath(f'//div[{_has_class("VIsJD")}]')
+_NO_POSTS = etree.XPath(f'//div[{_has_class("FuWoR", "-wdIA", "A2kdl")}]')
+_LOGIN_POPUP = etree.XPath(f'//button[{_has_class("dCJp8", "afkep", "xqRnw")}]')
+
+_VERIFIED_BADGE = etree.XPath(f'//span[{_has_class("mrEK_", "Szr5J", "coreSpriteVerifiedBadge")}]')
+_COUNT_INFO = etree.XPath(f'(//ul[{_has_class("k9GMp")}])[1]')
+_DESCENDANT_LI = etree.XPath('.//li')
+_DESCENDANT_SPAN = etree.XPath('.//span')
+_TITLE = etree.XPath(f'//div[{_has_class("-vDIg")}]/h1')
+_DESCRIPTION = etree.XPath(f'//div[{_has_class("-vDIg")}]/span')
+
+_CONTENT = etree.XPath(f'//div[{_has_class("C4VMK")}]/span')
+_COMMENTS = etree.XPath(f'//div[{_has_class("C4VMK")}]')
+_COMMENT_WRITER = etree.XPath(f'.//a[{_class_equals("FPmhX notranslate TlrDj")}]')
+_COMMENT_DATE = etree.XPath(f'.//time[{_class_equals("FH9sR Nzb55")}]')
+_HASHTAGS = etree.XPath(f'//div[{_has_class("C4VMK")}]/span/a[{_has_class("xil3i")}]')
+_POST_DATE = etree.XPath(f'//time[{_has_class("_1o9PC", "Nzb55")}]')
+_LIKE = etree.XPath(f'//div[{_has_class("Nm9Fw")}]/button/span')
+
+_EMPTY_DOCUMENT = '<html></html>'
+
+
+class LxmlParser:
+    """
+    lxml 과 미리 컴파일한 XPath 로 인스타그램 페이지를 파싱한다
+    SoupParser 와 같은 결과를 반환하며, BeautifulSoup tree 생성과 soupsieve 매칭 비용이 없다
+    """
+    name = 'lxml'
+
+    @staticmethod
+    def _tree(html: str):
+        tree = etree.HTML(html or _EMPTY_DOCUMENT)
+        if tree is None:
+            tree = etree.HTML(_EMPTY_DOCUMENT)
+        return tree
+
+    @staticmethod
+    def _first(xpath, node):
+        found = xpath(node)
+        return found[0] if found else None
+
+    @staticmethod
+    def _text(node, strip=False) -> str:
+        # BeautifulSoup 의 get_text(), get_text(strip=True) 와 같은 결과를 반환한다
+        if strip:
+            return ''.join(text.strip() for text in node.itertext() if text.strip())
+        return ''.join(node.itertext())
+
+    @classmethod
+    def page_available(cls, html: str) -> bool:
+        tree = cls._tree(html)
+
+        # 페이지를 찾을 수 없는 경우
+        if _ERROR_CONTAINER(tree):
+            return False
+        # 비공개 계정인 경우
+        elif _PRIVATE_ACCOUNT(tree):
+            return False
+        # 게시물 없음인 경우
+        elif _NO_POSTS(tree):
+            return False
+        else:
+            return True
+
+    @classmethod
+    def has_login_popup(cls, html: str) -> bool:
+        return bool(_LOGIN_POPUP(cls._tree(html)))
+
+    @classmethod
+    def user_info(cls, html: str) -> dict:
+        tree = cls._tree(html)
+
+        # 인증배지 여부를 파싱한다
+        verified_badge = bool(_VERIFIED_BADGE(tree))
+
+        # 포스트 수, 팔로워, 팔로잉 수를 파싱한다
+        count_info = cls._first(_COUNT_INFO, tree)
+        if count_info is None:
+            raise AttributeError("'NoneType' object has no attribute 'find_all'")
+        count_info_li = _DESCENDANT_LI(count_info)
+        post_count = cls._text(_DESCENDANT_SPAN(count_info_li[0])[0], strip=True).replace(',', '')
+        follower = _DESCENDANT_SPAN(count_info_li[1])[0].attrib['title'].replace(',', '')
+        follow = cls._text(_DESCENDANT_SPAN(count_info_li[2])[0], strip=True).replace(',', '')
+
+        # 유저 설명 부분을 파싱한다
+        title = cls._first(_TITLE, tree)
+        title = cls._text(title, strip=True) if title is not None else ''
+        description = cls._first(_DESCRIPTION, tree)
+        description = cls._text(description) if description is not None else ''
+
+        return {
+            'postCount': post_count,
+            'followerCount': follower,
+            'followingCount': follow,
+            'title': title,
+            'description': description,
+            'VerifiedBadge': verified_badge
+        }
+
+    @classmethod
+    def content(cls, html: str, username: str) -> dict:
+        tree = cls._tree(html)
+
+        # 포스트 본문 내용을 파싱한다
+        content = cls._first(_CONTENT, tree)
+        if content is not None:
+            content = cls._text(content)
+
+        # 포스트의 댓글 내용들을 파싱한다
+        # 댓글 작성자가 포스트 주인이 아닌 경우에만 (작성자, 내용, 작성시간)을 반환한다
+        comments = []
+        for comment in _COMMENTS(tree):
+            writer = cls._first(_COMMENT_WRITER, comment)
+            if writer is None:
+                continue
+            writer = cls._text(writer, strip=True)
+
+            if not writer == username:
+                comment_text = cls._text(_DESCENDANT_SPAN(comment)[0])
+                comment_date = cls._first(_COMMENT_DATE, comment)
+                if comment_date is None:
+                    raise TypeError("'NoneType' object is not subscriptable")
+                comments.append((writer, comment_text, comment_date.attrib['datetime']))
+
+        # 해쉬태그 정보를 파싱한다
+        hashtags = [cls._text(tags, strip=True).replace('#', '') for tags in _HASHTAGS(tree)]
+
+        # 포스트 작성시간을 파싱한다
+        date = cls._first(_POST_DATE, tree)
+        if date is None:
+            raise TypeError("'NoneType' object is not subscriptable")
+        date = date.attrib['datetime']
+
+        # 포스트의 좋아요 수를 파싱한다, 동영상인 경우에는 None 을 반환한다
+        like = cls._first(_LIKE, tree)
+        if like is not None:
+            like = cls._text(like)
+
+        return {
+            'content': content,
+            'comments': comments,
+            'hashtags': hashtags,
+            'date': date,
+            'like': like
+        }
+
+
+PARSERS = {
+    SoupParser.name: SoupParser,
+    LxmlParser.name: LxmlParser
+}
+
+
+def get_parser(name: str = None):
+    """
+    설정된 이름의 parser backend 를 반환한다
+    알 수 없는 이름인 경우에는 BeautifulSoup parser 를 사용한다
+    :param name: 'lxml' or 'soup'
+    :return: parser backend
+    """
+    return PARSERS.get(name, SoupParser)
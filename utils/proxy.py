@@ -1,5 +1,19 @@
-import requests
+import json
 import random
+import time
+from operator import itemgetter
+
+import requests
+
+import config
+from connector.connector import RedisConnector
+
+
+class ProxyUnavailableError(Exception):
+    """
+    proxy API 와 Redis 에서 모두 proxy 목록을 가져오지 못한 경우 발생한다
+    """
+    pass
 
 
 class RandProxy:
@@ -49,3 +63,191 @@ class RandProxy:
             'ip': f'{proxy["ip"]}',
             'port': f'{proxy["port"]}'
         }
+
+
+class ProxyManager:
+    """
+    worker 프로세스들이 Redis 로 공유하는 proxy pool
+    proxy 목록은 LIST_TTL 동안 Redis 에 저장하여 API 를 한번만 요청하며,
+    proxy 별 성공률, 페이지 로딩 시간, 차단(로그인 페이지) 횟수로 가중치를 정하여 선택한다
+    proxy 별 기록은 실행(run)마다 따로 저장하므로, 이전 실행에서 차단된 proxy 도 다음 실행에서는 다시 기록을 쌓는다
+    연속으로 실패하거나 차단된 proxy 는 COOLDOWN 동안 선택하지 않는다
+
+    keys: {PREFIX}:list(string), :list:lock(string), :{run_id}:stats(hash, '{ip}:{port}:{field}', STATS_TTL),
+          :quarantine(zset, score=해제시간)
+    """
+    proxy_config = config.PROXY_POOL
+    FIELDS = ('success', 'failure', 'block', 'latency', 'streak')
+
+    def __init__(self, types=None, client=None, run_id: str = None):
+        self.types = types
+        self.client = client or RedisConnector().conn()
+        self.run_id = run_id or config.METRICS['RUN_ID']
+        prefix = self.proxy_config['PREFIX']
+        self.list_key = f'{prefix}:list'
+        self.lock_key = f'{prefix}:list:lock'
+        self.stats_key = f'{prefix}:{self.run_id}:stats'
+        self.quarantine_key = f'{prefix}:quarantine'
+        self._proxy_list = None
+        self._fetched_at = 0
+
+    @staticmethod
+    def key(proxies: dict) -> str:
+        return f'{proxies["ip"]}:{proxies["port"]}'
+
+    @property
+    def proxy_list(self) -> list:
+        """
+        proxy 목록을 반환한다
+        프로세스 안에서는 LOCAL_TTL 동안 재사용하며, Redis 에 없는 경우 한 프로세스만 API 로 가져와서 저장한다
+        """
+        if self._proxy_list and time.time() - self._fetched_at < self.proxy_config['LOCAL_TTL']:
+            return self._proxy_list
+
+        cached = self.client.get(self.list_key)
+        if cached:
+            proxy_list = json.loads(cached)
+        elif self.client.set(self.lock_key, 1, nx=True, ex=30) or not self._proxy_list:
+            proxy_list = RandProxy(self.types).proxy_list
+            if proxy_list:
+                self.client.set(self.list_key, json.dumps(proxy_list), ex=self.proxy_config['LIST_TTL'])
+            self.client.delete(self.lock_key)
+        else:
+            # 다른 프로세스가 목록을 가져오는 중이면, 이전 목록을 계속 사용한다
+            proxy_list = None
+
+        if proxy_list:
+            self._proxy_list = proxy_list
+            self._fetched_at = time.time()
+        return self._proxy_list
+
+    def _stats(self) -> dict:
+        stats = {}
+        for field, value in self.client.hgetall(self.stats_key).items():
+            key, name = field.rsplit(':', 1)
+            stats.setdefault(key, dict.fromkeys(self.FIELDS, 0))[name] = float(value)
+        return stats
+
+    def health(self, stats: dict or None) -> float:
+        """
+        proxy 의 선택 가중치를 반환한다
+        기록이 없는 proxy 도 선택되도록 성공/실패에 1 씩 더하며, 평균 로딩 시간이 길수록 가중치가 작아진다
+        :param stats: proxy 별 기록(success, failure, block, latency)
+        :return: 0 ~ 1
+        """
+        if not stats:
+            return 0.5
+        attempts = stats['success'] + stats['failure'] + stats['block']
+        success_rate = (stats['success'] + 1) / (attempts + stats['block'] + 2)
+        latency = stats['latency'] / stats['success'] if stats['success'] else 0
+        return success_rate / (1 + latency / self.proxy_config['LATENCY_REF'])
+
+    def get(self) -> dict:
+        """
+        격리되지 않은 proxy 중 상태가 좋은 proxy 일수록 높은 확률로 선택하여 리턴
+        모든 proxy 가 격리된 경우에는 전체 proxy 중에서 선택한다
+        proxy 목록이 없는 경우에는 proxy 없이 요청하지 않도록 ProxyUnavailableError 를 발생시킨다
+        """
+        proxy_list = self.proxy_list
+        if not proxy_list:
+            raise ProxyUnavailableError('get(): proxy list is empty, the proxy API returned nothing '
+                                        f'and {self.list_key} is not cached in Redis')
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(self.quarantine_key, '-inf', time.time())
+        pipe.zrange(self.quarantine_key, 0, -1)
+        _, quarantined = pipe.execute()
+        quarantined = set(quarantined)
+
+        candidates = [proxy for proxy in proxy_list if self.key(proxy) not in quarantined] or proxy_list
+        stats = self._stats()
+        weights = [self.health(stats.get(self.key(proxy))) for proxy in candidates]
+        proxy = random.choices(candidates, weights=weights)[0]
+
+        return {
+            'protocol': f'{proxy["protocol"]}',
+            'user': f'{proxy["user"]}',
+            'password': f'{proxy["password"]}',
+            'ip': f'{proxy["ip"]}',
+            'port': f'{proxy["port"]}'
+        }
+
+    def record_success(self, key: str, latency: float) -> None:
+        """
+        페이지를 정상적으로 가져온 경우 로딩 시간(초)과 함께 기록한다
+        """
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.stats_key, f'{key}:success', 1)
+        pipe.hincrbyfloat(self.stats_key, f'{key}:latency', latency)
+        pipe.hset(self.stats_key, f'{key}:streak', 0)
+        pipe.expire(self.stats_key, self.proxy_config['STATS_TTL'])
+        pipe.execute()
+
+    def record_failure(self, key: str) -> bool:
+        """
+        요청이 실패하거나 페이지 로딩 시간이 초과된 경우 기록한다
+        MAX_FAILURES 번 연속으로 실패한 proxy 는 격리한다
+        :return: 격리한 경우 True
+        """
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.stats_key, f'{key}:failure', 1)
+        pipe.hincrby(self.stats_key, f'{key}:streak', 1)
+        pipe.expire(self.stats_key, self.proxy_config['STATS_TTL'])
+        _, streak, _ = pipe.execute()
+        if streak >= self.proxy_config['MAX_FAILURES']:
+            self.quarantine(key)
+            return True
+        return False
+
+    def record_block(self, key: str) -> bool:
+        """
+        인스타그램이 로그인 페이지로 이동시키는 등 proxy 가 차단된 경우 기록하고 바로 격리한다
+        :return: True
+        """
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.stats_key, f'{key}:block', 1)
+        pipe.expire(self.stats_key, self.proxy_config['STATS_TTL'])
+        pipe.execute()
+        self.quarantine(key)
+        return True
+
+    def quarantine(self, key: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.zadd(self.quarantine_key, {key: time.time() + self.proxy_config['COOLDOWN']})
+        pipe.hset(self.stats_key, f'{key}:streak', 0)
+        pipe.expire(self.stats_key, self.proxy_config['STATS_TTL'])
+        pipe.execute()
+
+    def stats(self) -> list:
+        """
+        proxy 별 성공/실패/차단 횟수, 평균 로딩 시간, 가중치, 격리 여부를 가중치 순서로 반환한다
+        :return: [{'proxy', 'success', 'failure', 'block', 'avg_latency', 'health', 'quarantined'}, ...]
+        """
+        quarantined = set(self.client.zrangebyscore(self.quarantine_key, time.time(), '+inf'))
+        stats = []
+        for key, proxy_stats in self._stats().items():
+            stats.append({
+                'proxy': key,
+                'success': int(proxy_stats['success']),
+                'failure': int(proxy_stats['failure']),
+                'block': int(proxy_stats['block']),
+                'avg_latency': proxy_stats['latency'] / proxy_stats['success'] if proxy_stats['success'] else None,
+                'health': self.health(proxy_stats),
+                'quarantined': key in quarantined
+            })
+        stats.sort(key=itemgetter('health'), reverse=True)
+        return stats
+
+
+_proxy_manager = None
+
+
+def proxy_manager() -> ProxyManager:
+    """
+    현재 프로세스의 ProxyManager 를 반환한다
+    프로세스마다 하나만 생성하여, 유저마다 proxy 목록을 다시 요청하지 않는다
+    :return: ProxyManager
+    """
+    global _proxy_manager
+    if _proxy_manager is None:
+        _proxy_manager = ProxyManager()
+    return _proxy_manager
@@ -0,0 +1,145 @@
+import time
+from random import uniform
+from urllib.parse import urlparse
+
+import config
+from connector.connector import RedisConnector
+from utils.metrics import OK, stage_metrics
+
+
+class RateLimiter:
+    """
+    worker 프로세스들이 Redis 로 공유하는 token bucket rate limiter
+    proxy 별, 대상 host 별로 bucket 을 두며, 페이지를 열기 전에 두 bucket 에서 token 을 하나씩 예약하고
+    token 이 생길 때까지(+ JITTER) 기다린다, 여러 프로세스가 같은 proxy 를 사용해도 proxy 의 요청 간격은 RATE 를 넘지 않는다
+    차단(로그인 페이지, HTTP 429)이나 timeout 이 발생한 bucket 은 BACKOFF_TTL 동안 rate 를 BACKOFF_FACTOR 배씩(최대 MAX_BACKOFF) 줄인다
+
+    keys: {PREFIX}:bucket:{proxy|host}:{key}(hash, tokens/ts), {PREFIX}:backoff:{proxy|host}:{key}(string, rate 감소 배수)
+    """
+    limit_config = config.RATE_LIMIT
+
+    # bucket 마다 token 을 채운 다음 하나씩 꺼내며, token 이 부족한 경우 가장 오래 기다려야 하는 bucket 의 대기 시간을 반환한다
+    # token 은 음수가 될 수 있으며(예약), 다음 요청은 그만큼 더 기다린다
+    # KEYS: bucket key 들, 같은 순서의 backoff key 들 / ARGV: 현재 시간, bucket 별 rate, burst
+    RESERVE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local count = #KEYS / 2
+    local wait = 0
+    local factor = 1
+    for i = 1, count do
+        local backoff = tonumber(redis.call('get', KEYS[count + i]) or '1')
+        local rate = tonumber(ARGV[i * 2]) / backoff
+        local burst = tonumber(ARGV[i * 2 + 1])
+        local bucket = redis.call('hmget', KEYS[i], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or burst
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+        if tokens < 0 then
+            wait = math.max(wait, -tokens / rate)
+        end
+        factor = math.max(factor, backoff)
+        redis.call('hmset', KEYS[i], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('expire', KEYS[i], math.ceil((burst - tokens) / rate) + 60)
+    end
+    return {tostring(wait), tostring(factor)}
+    """
+    # rate 감소 배수를 BACKOFF_FACTOR 배 늘리고, BACKOFF_TTL 동안 차단이 없으면 원래 rate 로 돌아간다
+    BACKOFF_SCRIPT = """
+    local factor = math.min(tonumber(redis.call('get', KEYS[1]) or '1') * tonumber(ARGV[1]), tonumber(ARGV[2]))
+    redis.call('set', KEYS[1], tostring(factor), 'EX', ARGV[3])
+    return tostring(factor)
+    """
+
+    def __init__(self, client=None):
+        self.client = client or RedisConnector().conn()
+        self.prefix = self.limit_config['PREFIX']
+        self._reserve = self.client.register_script(self.RESERVE_SCRIPT)
+        self._backoff = self.client.register_script(self.BACKOFF_SCRIPT)
+
+    @property
+    def host(self) -> str:
+        # 기본 대상 host, config.BASE_URL 의 host 이다
+        return urlparse(config.BASE_URL).netloc
+
+    def _buckets(self, proxy: str = None, host: str = None) -> list:
+        buckets = []
+        if proxy:
+            buckets.append(('proxy', proxy, self.limit_config['PROXY_RATE'], self.limit_config['PROXY_BURST']))
+        if host:
+            buckets.append(('host', host, self.limit_config['HOST_RATE'], self.limit_config['HOST_BURST']))
+        return buckets
+
+    def reserve(self, proxy: str = None, host: str = None) -> (float, float):
+        """
+        proxy 와 host 의 bucket 에서 token 을 하나씩 예약하고, 기다려야 하는 시간을 반환한다
+        :param proxy: 사용하는 proxy(ex. ProxyManager.key()), 없는 경우 host bucket 만 사용한다
+        :param host: 요청하는 host, 기본값은 config.BASE_URL 의 host
+        :return: (기다려야 하는 시간(초, JITTER 포함), 가장 큰 rate 감소 배수)
+        """
+        buckets = self._buckets(proxy, host or self.host)
+        keys = [f'{self.prefix}:bucket:{kind}:{key}' for kind, key, _, _ in buckets] + \
+               [f'{self.prefix}:backoff:{kind}:{key}' for kind, key, _, _ in buckets]
+        args = [time.time()]
+        for _, _, rate, burst in buckets:
+            args.extend([rate, burst])
+        wait, factor = self._reserve(keys=keys, args=args)
+        return float(wait) + uniform(*self.limit_config['JITTER']), float(factor)
+
+    def wait(self, proxy: str = None, host: str = None) -> float:
+        """
+        token 이 생길 때까지 기다리며, 기다린 시간을 'rate_wait' 단계로 기록한다
+        rate 를 줄인 bucket 이 있는 경우에는 결과를 'backoff' 로 기록한다
+        :param proxy: 사용하는 proxy(ex. ProxyManager.key())
+        :param host: 요청하는 host, 기본값은 config.BASE_URL 의 host
+        :return: 기다린 시간(초)
+        """
+        seconds, factor = self.reserve(proxy, host)
+        with stage_metrics().timer('rate_wait', proxy) as timer:
+            timer.outcome = self.outcome(factor)
+            time.sleep(seconds)
+        return seconds
+
+    @staticmethod
+    def outcome(factor: float) -> str:
+        return 'backoff' if factor > 1 else OK
+
+    def backoff(self, proxy: str = None, host: str = None) -> None:
+        """
+        차단이나 timeout 이 발생한 proxy, host 의 rate 를 줄인다
+        proxy 만 느린 경우(timeout)에는 proxy 만, 인스타그램이 요청을 제한하는 경우(로그인 페이지, HTTP 429)에는 host 도 전달한다
+        :param proxy: 사용한 proxy(ex. ProxyManager.key())
+        :param host: 요청을 제한한 host
+        :return: None
+        """
+        for kind, key, _, _ in self._buckets(proxy, host):
+            self._backoff(keys=[f'{self.prefix}:backoff:{kind}:{key}'], args=[
+                self.limit_config['BACKOFF_FACTOR'],
+                self.limit_config['MAX_BACKOFF'],
+                self.limit_config['BACKOFF_TTL']
+            ])
+
+    def stats(self) -> dict:
+        """
+        rate 를 줄인 proxy, host 와 rate 감소 배수를 반환한다
+        :return: {'proxy:{key}' or 'host:{key}': 감소 배수}
+        """
+        keys = list(self.client.scan_iter(f'{self.prefix}:backoff:*'))
+        if not keys:
+            return {}
+        start = len(f'{self.prefix}:backoff:')
+        return {key[start:]: float(factor) for key, factor in zip(keys, self.client.mget(keys)) if factor}
+
+
+_rate_limiter = None
+
+
+def rate_limiter() -> RateLimiter:
+    """
+    현재 프로세스의 RateLimiter 를 반환한다
+    bucket 은 Redis 에 있으므로, 모든 worker 프로세스가 같은 rate 를 공유한다
+    :return: RateLimiter
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,132 @@
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.wait import WebDriverWait
+
+import config
+from utils.metrics import stage_metrics
+
+# 페이지 상태를 확인하는 함수, 브라우저 안에서 실행한다
+# selector 가 나타난 경우 'ready'(previous 가 있는 경우에는 작성시간도 바뀐 경우), 에러/로그인 페이지인 경우 'marker'/'login'
+# arguments: selector, markers({이름: selector}), previous(이전 포스트 작성시간), time selector, login path, timeout(초)
+CHECK_FUNCTION = """
+var selector = arguments[0], markers = arguments[1], previous = arguments[2], timeSelector = arguments[3],
+    loginPath = arguments[4];
+function check() {
+    var element = document.querySelector(selector);
+    if (element) {
+        if (previous === null) {
+            return {state: 'ready', element: element};
+        }
+        var time = document.querySelector(timeSelector);
+        if (time && time.getAttribute('datetime') !== previous) {
+            return {state: 'ready', element: element};
+        }
+    }
+    if (location.pathname.indexOf(loginPath) === 0) {
+        return {state: 'login', marker: loginPath};
+    }
+    for (var name in markers) {
+        if (document.querySelector(markers[name])) {
+            return {state: 'marker', marker: name};
+        }
+    }
+    return null;
+}
+"""
+# polling: 한번 확인하고 결과를 반환한다
+CHECK_SCRIPT = CHECK_FUNCTION + 'return check();'
+# observer: DOM 이 바뀔 때마다 확인하여 selector 가 나타나는 즉시 반환한다, timeout 이 지나면 'timeout' 을 반환한다
+OBSERVE_SCRIPT = CHECK_FUNCTION + """
+var done = arguments[arguments.length - 1];
+var result = check();
+if (result) {
+    done(result);
+    return;
+}
+var timer = null;
+var observer = new MutationObserver(function () {
+    var result = check();
+    if (result) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(result);
+    }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true,
+                                             attributeFilter: ['class', 'datetime']});
+timer = setTimeout(function () {
+    observer.disconnect();
+    done({state: 'timeout'});
+}, arguments[5] * 1000);
+"""
+POST_TIME_SCRIPT = "var time = document.querySelector(arguments[0]); return time ? time.getAttribute('datetime') : null;"
+# 기다리는 동안 페이지가 이동되어 document 가 바뀐 경우, 새 document 에서 다시 기다리는 최대 횟수
+MAX_RELOADS = 3
+
+
+def post_time(driver) -> str or None:
+    """
+    열려 있는 포스트의 작성시간(datetime 속성)을 반환한다, 다음 포스트로 바뀌었는지 확인하기 위해 사용한다
+    :param driver: selenium webdriver instance
+    :return: datetime 속성, 포스트가 없는 경우 None
+    """
+    return driver.execute_script(POST_TIME_SCRIPT, config.READINESS['TIME_SELECTOR'])
+
+
+def _observe(driver, args: list, timeout: float) -> dict:
+    deadline = time.time() + timeout
+    for reload in range(MAX_RELOADS + 1):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            return driver.execute_async_script(OBSERVE_SCRIPT, *args, remaining)
+        except TimeoutException:
+            # script timeout(SCRIPT_TIMEOUT) 이 timeout 보다 짧은 경우
+            break
+        except WebDriverException:
+            # 클릭으로 페이지가 이동되어 script 가 실행되던 document 가 사라진 경우
+            if reload == MAX_RELOADS:
+                raise
+    return {'state': 'timeout'}
+
+
+def _poll(driver, args: list, timeout: float) -> dict:
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=config.READINESS['POLL_INTERVAL']).until(
+            lambda d: d.execute_script(CHECK_SCRIPT, *args)
+        )
+    except TimeoutException:
+        return {'state': 'timeout'}
+
+
+def wait_ready(driver, selector: str, timeout: float, name: str, previous: str = None, mode: str = None):
+    """
+    selector 의 element 가 나타날 때까지 기다린 다음 반환한다
+    'observer' 모드는 MutationObserver 로 DOM 이 바뀌는 즉시 확인하며, 'polling' 모드는 POLL_INTERVAL 마다 확인한다
+    에러/비공개/로그인 페이지인 경우에는 timeout 까지 기다리지 않고 바로 TimeoutException 을 발생시킨다
+    기다린 시간은 'ready_{name}' 단계로, 결과는 '{mode}:{state}'(ex. 'observer:ready') 로 기록한다
+    :param driver: selenium webdriver instance
+    :param selector: CSS selector
+    :param timeout: 최대 대기 시간(초)
+    :param name: 기록할 단계 이름(ex. 'next_post')
+    :param previous: 이전 포스트의 작성시간(post_time()), 있는 경우 작성시간이 바뀐 다음에 반환한다
+    :param mode: 'observer' or 'polling', 기본값은 READINESS['MODE']
+    :return: WebElement
+    """
+    readiness = config.READINESS
+    mode = mode or readiness['MODE']
+    args = [selector, readiness['MARKERS'], previous, readiness['TIME_SELECTOR'], readiness['LOGIN_PATH']]
+
+    start = time.perf_counter()
+    if mode == 'polling':
+        result = _poll(driver, args, timeout)
+    else:
+        result = _observe(driver, args, timeout)
+    stage_metrics().observe(f'ready_{name}', time.perf_counter() - start, getattr(driver, 'proxy_key', None),
+                            f'{mode}:{result["state"]}')
+
+    if result['state'] != 'ready':
+        raise TimeoutException(f'wait_ready(): {selector} not ready. {result["state"]}: {result.get("marker")}')
+    return result['element']
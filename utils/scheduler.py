@@ -0,0 +1,168 @@
+import heapq
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+import config
+
+DAY = 60 * 60 * 24
+
+
+class RecrawlScheduler:
+    """
+    유저별 포스팅 빈도로 다음 크롤링 시간과 우선순위를 정하는 scheduler
+    일짜별 유저 정보(snapshots)의 postCount 변화량과 data_collection 의 최근 포스트 수로 하루 평균 포스트 수를 구하고,
+    크롤링 시점이 된 유저만 예상되는 새 포스트 수가 많은 순서로 BUDGET 명까지 크롤링한다
+    """
+    scheduler_config = config.SCHEDULER
+
+    def __init__(self, snapshots, data_collection, schedule_collection, budget: int = None):
+        # 일짜별 유저 정보 저장소(connector.snapshot.get_snapshot_store())
+        self.snapshots = snapshots
+        self.data_collection = data_collection
+        self.schedule_collection = schedule_collection
+        self.budget = budget or self.scheduler_config['BUDGET']
+        self.history_days = self.scheduler_config['HISTORY_DAYS']
+        self.min_interval = self.scheduler_config['MIN_INTERVAL_DAYS'] * DAY
+        self.max_interval = self.scheduler_config['MAX_INTERVAL_DAYS'] * DAY
+        # 이번 크롤링에서 선택한 유저와 선택 당시의 포스트 수
+        self.dispatched = {}
+        self.counters = {
+            'candidates': 0,
+            'due': 0,
+            'dispatched': 0
+        }
+
+    def refresh(self, batch_size: int = 1000) -> None:
+        """
+        최근 HISTORY_DAYS 일의 기록으로 유저별 포스팅 기록을 schedule collection 에 갱신한다
+        :param batch_size: 한번에 bulk_write 로 저장하는 유저 수
+        :return: None
+        """
+        since = int(time.time()) - self.history_days * DAY
+
+        # 일짜별 유저 정보에서 첫/마지막 크롤링 시간과 최소/최대 포스트 수를 구한다
+        snapshots = self.snapshots.post_count_ranges(since)
+        self._bulk_set(snapshots, batch_size)
+
+        # 최근 포스트 수는 이번 기간에 포스트가 없는 유저도 0 이 되도록 초기화한 다음 갱신한다
+        self.schedule_collection.update_many({}, {'$set': {'recentPosts': 0}})
+        posts = self.data_collection.aggregate([
+            {'$match': {'publishedAtTimestamp': {'$gte': since}}},
+            {'$group': {
+                '_id': '$userName',
+                'recentPosts': {'$sum': 1},
+                'newestPostAt': {'$max': '$publishedAtTimestamp'}
+            }}
+        ], allowDiskUse=True)
+        self._bulk_set(posts, batch_size)
+
+    def _bulk_set(self, documents, batch_size: int) -> None:
+        operations = []
+        for document in documents:
+            username = document.pop('_id')
+            operations.append(UpdateOne({'_id': username}, {'$set': document}, upsert=True))
+            if len(operations) >= batch_size:
+                self.schedule_collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            self.schedule_collection.bulk_write(operations, ordered=False)
+
+    def plan(self, schedule: dict or None, now: float = None) -> (float, float):
+        """
+        유저의 다음 크롤링 시간과 우선순위를 반환한다
+        하루 평균 포스트 수가 많을수록 크롤링 간격이 짧아지며, 우선순위는 마지막 크롤링 이후 예상되는 새 포스트 수이다
+        :param schedule: schedule collection 의 유저 document, 크롤링 기록이 없는 경우 None
+        :param now: 기준 시간(timestamp)
+        :return: (next due timestamp, priority)
+        """
+        now = now or time.time()
+        if not schedule or not schedule.get('lastSnapshotAt'):
+            # 크롤링 기록이 없는 유저는 바로 크롤링한다
+            return now, float('inf')
+
+        days = max((schedule['lastSnapshotAt'] - schedule.get('firstSnapshotAt', schedule['lastSnapshotAt'])) / DAY, 1)
+        post_count_delta = max((schedule.get('maxPostCount') or 0) - (schedule.get('minPostCount') or 0), 0)
+        velocity = max(post_count_delta / days, (schedule.get('recentPosts') or 0) / self.history_days)
+
+        # 포스트 하나가 새로 올라올 것으로 예상되는 간격으로 크롤링하며, 최소/최대 간격을 넘지 않는다
+        interval = DAY / velocity if velocity else self.max_interval
+        interval = min(max(interval, self.min_interval), self.max_interval)
+
+        next_due = schedule['lastSnapshotAt'] + interval
+        priority = velocity * (now - schedule['lastSnapshotAt']) / DAY
+        return next_due, priority
+
+    def due(self, usernames, batch_size: int = 1000) -> list:
+        """
+        크롤링 시점이 된 유저를 우선순위 순서로 최대 BUDGET 명까지 반환한다
+        :param usernames: 크롤링 대상 유저이름 iterable(ex. over_500_followers())
+        :param batch_size: schedule collection 을 한번에 조회하는 유저 수
+        :return: username list
+        """
+        now = time.time()
+        heap = []
+        batch = []
+        order = 0
+
+        def push(batch_usernames):
+            nonlocal order
+            schedules = {document['_id']: document for document in self.schedule_collection.find(
+                {'_id': {'$in': batch_usernames}}
+            )}
+            for username in batch_usernames:
+                schedule = schedules.get(username)
+                next_due, priority = self.plan(schedule, now)
+                if next_due > now:
+                    continue
+                self.counters['due'] += 1
+                # 우선순위가 같은 경우에는 입력 순서(팔로워 순)를 유지한다
+                order += 1
+                item = (priority, -order, username, (schedule or {}).get('maxPostCount'))
+                if len(heap) < self.budget:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+
+        for username in usernames:
+            self.counters['candidates'] += 1
+            batch.append(username)
+            if len(batch) >= batch_size:
+                push(batch)
+                batch = []
+        if batch:
+            push(batch)
+
+        selected = sorted(heap, reverse=True)
+        self.dispatched = {username: post_count for _, _, username, post_count in selected}
+        self.counters['dispatched'] = len(selected)
+        return [username for _, _, username, _ in selected]
+
+    def report(self, crawl_date: datetime = None) -> dict:
+        """
+        이번 크롤링에서 선택한 유저 중에 새 포스트가 있었던 유저의 비율을 반환한다
+        오늘 저장된 일짜별 유저 정보의 포스트 수가 선택 당시의 포스트 수보다 많은 경우 새 포스트가 있었던 것으로 본다
+        :param crawl_date: 크롤링 날짜
+        :return: dict
+        """
+        today = (crawl_date or config.CRAWL_DATE).strftime('%Y-%m-%d')
+        crawled = 0
+        with_new_posts = 0
+
+        for document in self.snapshots.day(today, self.dispatched):
+            crawled += 1
+            previous = self.dispatched.get(document['userName'])
+            try:
+                post_count = int(document['postCount'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            # 크롤링 기록이 없던 유저는 포스트가 있는 경우에 새 포스트가 있었던 것으로 본다
+            if post_count > (previous or 0):
+                with_new_posts += 1
+
+        return dict(self.counters, **{
+            'crawled': crawled,
+            'with_new_posts': with_new_posts,
+            'new_post_ratio': with_new_posts / crawled if crawled else 0.0
+        })
@@ -1,11 +1,98 @@
+import hashlib
+import json
+import os
+import random
+import time
+
 from random_user_agent.user_agent import UserAgent
 from random_user_agent.params import SoftwareName, OperatingSystem
 
+import config
 
-def random_user_agent() -> str:
+
+def _load_user_agents(limit: int) -> list:
     software_names = [SoftwareName.CHROME.value]
     operating_systems = [OperatingSystem.WINDOWS.value, OperatingSystem.MAC_OS_X.value]
 
-    user_agent_rotator = UserAgent(software_names=software_names, operating_systems=operating_systems, limit=100)
+    user_agent_rotator = UserAgent(software_names=software_names, operating_systems=operating_systems, limit=limit)
+
+    return [agent['user_agent'] for agent in user_agent_rotator.get_user_agents()]
+
+
+class UserAgentPool:
+    """
+    필터링한 User-Agent 목록을 프로세스마다 한번만 만들어서 재사용한다
+    목록은 CACHE_PATH 에 저장하여, CACHE_TTL 이 지나기 전에는 라이브러리의 User-Agent 데이터를 다시 읽지 않는다
+    """
+    user_agent_config = config.USER_AGENT
+
+    def __init__(self, limit: int = None, cache_path: str = None):
+        self.limit = limit or self.user_agent_config['LIMIT']
+        self.cache_path = cache_path if cache_path is not None else self.user_agent_config['CACHE_PATH']
+        self.agents = tuple(self._cached() or self._build())
+        self._size = len(self.agents)
+
+    def _cached(self) -> list or None:
+        if not self.cache_path:
+            return None
+        try:
+            if time.time() - os.path.getmtime(self.cache_path) > self.user_agent_config['CACHE_TTL']:
+                return None
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 설정한 개수와 다른 경우에는 다시 만든다
+        if cached.get('limit') != self.limit or not cached.get('agents'):
+            return None
+        return cached['agents']
+
+    def _build(self) -> list:
+        agents = _load_user_agents(self.limit)
+        if self.cache_path:
+            # 임시 파일에 쓴 다음 rename 하여, 여러 프로세스가 동시에 저장해도 깨진 파일을 읽지 않도록 한다
+            tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'limit': self.limit, 'agents': agents}, f)
+                os.replace(tmp_path, self.cache_path)
+            except OSError:
+                pass
+        return agents
 
-    return user_agent_rotator.get_random_user_agent()
+    def random(self) -> str:
+        """
+        User-Agent 하나를 랜덤으로 반환한다
+        :return: User-Agent
+        """
+        return self.agents[int(random.random() * self._size)]
+
+    def for_proxy(self, proxy_key: str or None) -> str:
+        """
+        proxy 마다 항상 같은 User-Agent 를 반환한다
+        프로세스가 달라도 같은 proxy 는 같은 User-Agent 를 사용하므로, proxy 별 브라우저 정보가 바뀌지 않는다
+        :param proxy_key: proxy 를 구분하는 문자열(ex. ProxyManager.key()), None 인 경우 랜덤으로 반환한다
+        :return: User-Agent
+        """
+        if proxy_key is None:
+            return self.random()
+        digest = hashlib.md5(proxy_key.encode()).digest()
+        return self.agents[int.from_bytes(digest[:8], 'big') % self._size]
+
+
+_user_agent_pool = None
+
+
+def user_agent_pool() -> UserAgentPool:
+    """
+    현재 프로세스의 UserAgentPool 을 반환한다
+    :return: UserAgentPool
+    """
+    global _user_agent_pool
+    if _user_agent_pool is None:
+        _user_agent_pool = UserAgentPool()
+    return _user_agent_pool
+
+
+def random_user_agent() -> str:
+    return user_agent_pool().random()